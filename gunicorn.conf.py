@@ -0,0 +1,32 @@
+"""
+gunicorn settings, read from the working directory (see Procfile).
+
+The sync WSGI workers are the default. RECIPE_ASGI=1 serves the ASGI
+application with uvicorn workers instead. It is opt-in because measured
+with bench_views (SQLite, 2 workers), ASGI only helps chart-heavy
+searches. Detail pages drop from 104 to 46 req/s, p95 rises from 236 to
+1368 ms, and workers take 122-143 MB instead of 105 MB. Re-measure before
+switching.
+
+RECIPE_PRELOAD=1 loads the application once in the master before forking
+the workers, which then start ready to serve and share the loaded code;
+see recipes/startup.py. Workers then can't be reloaded one at a time
+(HUP re-forks from the same master code), so deploys restart gunicorn.
+"""
+import os
+
+if os.environ.get("RECIPE_ASGI") == "1":
+    wsgi_app = "recipe_project.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "recipe_project.wsgi:application"
+
+preload_app = os.environ.get("RECIPE_PRELOAD") == "1"
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        # the master loaded the code; per-worker state starts here
+        from recipes.startup import worker_started
+
+        worker_started()
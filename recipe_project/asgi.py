@@ -2,6 +2,11 @@
 ASGI config for recipe_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served by gunicorn with uvicorn workers when RECIPE_ASGI=1 (see
+gunicorn.conf.py). It turns on RECIPE_ASYNC_VIEWS, so the async views
+(recipe search, list, detail, chart images) don't hold a worker while
+they wait on the database or the chart pool. The default is still
+wsgi.py, with the sync views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -12,5 +17,15 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipe_project.settings')
+# Persistent connections belong to the thread that opened them, and under
+# ASGI those threads don't outlive the request.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+os.environ.setdefault('RECIPE_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# warm up this worker, or with RECIPE_PRELOAD=1 the gunicorn master
+# (see recipes/startup.py)
+from recipes.startup import application_loaded  # noqa: E402
+
+application_loaded()
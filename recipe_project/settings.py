@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -42,8 +43,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so its total covers the rest of the stack
+    'recipes.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, serving MEDIA_ROOT as well (recipes/media.py)
+    'recipes.media.MediaWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,7 +60,8 @@ ROOT_URLCONF = 'recipe_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for the Server-Timing header
+        'BACKEND': 'recipes.timing.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,10 +90,139 @@ DATABASES = {
 
 # Heroku: Update database configuration from $DATABASE_URL.
 import dj_database_url
-db_from_env = dj_database_url.config(conn_max_age=500)
+# asgi.py sets DB_CONN_MAX_AGE=0: async views run their queries in
+# short-lived per-request threads, and each thread has its own connection.
+db_from_env = dj_database_url.config(conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 500)))
 DATABASES['default'].update(db_from_env)
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'charts': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'recipe-app-charts',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 500},
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'recipe-app-sessions',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Rendered search charts (recipes/chart_cache.py, recipes/rendering.py).
+# A CACHES alias shares charts between gunicorn workers, which the chart URL
+# needs because the image may be requested from a different worker.
+# None keeps an in-process LRU of RECIPE_CHART_CACHE_SIZE charts instead.
+RECIPE_CHART_CACHE_ALIAS = 'charts'
+RECIPE_CHART_CACHE_SIZE = 128
+RECIPE_CHART_WORKERS = 2
+RECIPE_CHART_QUEUE_DEPTH = 16
+RECIPE_CHART_TIMEOUT = 10
+# points in the per-recipe charts (recipes/charts.py)
+RECIPE_CHART_MAX_POINTS = 50
+
+# Rendered recipe detail pages (recipes/detail_cache.py). Invalidation bumps
+# version values in this cache, so with several workers it should be a
+# shared backend (Redis, Memcached, database); edits are picked up
+# everywhere regardless, through Recipe.updated_at.
+RECIPE_DETAIL_CACHE_ALIAS = 'default'
+RECIPE_DETAIL_CACHE_TIMEOUT = 3600
+
+# Text-search matches (recipes/search.py cached_matches), kept so picking a
+# facet doesn't run the full-text / LIKE query again; up to LIMIT ids each.
+# Keys carry the latest recipe write, read from the database, so any cache
+# works, per process or shared.
+RECIPE_MATCH_CACHE_ALIAS = 'default'
+RECIPE_MATCH_CACHE_TIMEOUT = 300
+RECIPE_MATCH_LIMIT = 1000
+
+# Search facet counts (recipes/facets.py): counted over at most SCAN_LIMIT
+# matches, skipped when the query runs over BUDGET_MS.
+RECIPE_FACET_SCAN_LIMIT = 5000
+RECIPE_FACET_BUDGET_MS = 100
+
+# Similar recipes on the detail page (recipes/similar.py): COUNT stored per
+# recipe. After a save the recipe is added to the lists of its CANDIDATES
+# nearest recipes, in a background thread unless IN_BACKGROUND is False;
+# bulk inserts over INCREMENTAL_LIMIT recipes wait for rebuild_similar.
+RECIPE_SIMILAR_COUNT = 6
+RECIPE_SIMILAR_CANDIDATES = 200
+RECIPE_SIMILAR_INCREMENTAL_LIMIT = 100
+RECIPE_SIMILAR_IN_BACKGROUND = True
+
+# Recipe changes are logged in the database (recipes/changes.py) for the
+# in-process indexes below to replay; entries are kept KEEP seconds.
+RECIPE_CHANGE_LOG_KEEP = 86400
+
+# Autocomplete prefix index (recipes/autocomplete.py), kept in each process.
+# Each process replays the change log at most every CHECK_INTERVAL seconds,
+# and rebuilds its index instead when more than REPLAY_LIMIT changes wait.
+RECIPE_AUTOCOMPLETE_CHECK_INTERVAL = 5
+RECIPE_AUTOCOMPLETE_REPLAY_LIMIT = 1000
+
+# Pantry search index (recipes/pantry.py), kept in each process and
+# following the change log like the autocomplete index.
+RECIPE_PANTRY_CHECK_INTERVAL = 5
+RECIPE_PANTRY_REPLAY_LIMIT = 1000
+
+# Statistics page and /api/stats/ (recipes/stats.py), read from summary
+# tables kept up to date on save; manage.py reconcile_stats recounts them.
+# Lists the TOP_INGREDIENTS most used ingredients.
+RECIPE_STATS_TOP_INGREDIENTS = 25
+
+# Sessions and the logged-in user, read from the 'sessions' cache so a
+# logged-in request runs no session or user query (recipes/sessions.py,
+# recipes/auth.py). Logout and password changes must reach every worker, so
+# the cache has to be shared: the file cache above is, on one host; use Redis
+# or Memcached across hosts. New sessions, logins and any other change are
+# written to the database at once; changes to only the DEFERRED_KEYS wait
+# WRITE_DELAY seconds, 0 writes them at once too. ModelBackend stays listed
+# so sessions logged in through it stay valid. RECIPE_CACHED_SESSIONS=0 in
+# the environment goes back to database sessions and uncached users.
+RECIPE_CACHED_SESSIONS = os.environ.get('RECIPE_CACHED_SESSIONS', '1') == '1'
+if RECIPE_CACHED_SESSIONS:
+    SESSION_ENGINE = 'recipes.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+if RECIPE_CACHED_SESSIONS:
+    AUTHENTICATION_BACKENDS.insert(0, 'recipes.auth.CachedModelBackend')
+RECIPE_USER_CACHE_ALIAS = 'sessions' if RECIPE_CACHED_SESSIONS else None
+RECIPE_USER_CACHE_TIMEOUT = 300
+RECIPE_SESSION_WRITE_DELAY = 5
+RECIPE_SESSION_DEFERRED_KEYS = ['last_activity', '_session_expiry']
+
+# Serve the async list, detail, search and chart views (recipes/urls.py);
+# asgi.py turns this on. Under WSGI the sync views are faster: an async
+# view there runs its own event loop and a thread hop per query.
+RECIPE_ASYNC_VIEWS = os.environ.get('RECIPE_ASYNC_VIEWS') == '1'
+
+# Per-request query/template/chart timings (recipes/timing.py), logged on
+# "recipes.timing" and sent as a Server-Timing header when this is on.
+RECIPE_SERVER_TIMING = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'recipes.timing': {
+            'handlers': ['console'],
+            'level': os.environ.get('RECIPE_TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -129,6 +263,11 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # Media files 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Served by MediaWhiteNoiseMiddleware (recipes/media.py). Responsive
+# derivatives have hashed names and are cached for good; other uploads for
+# MAX_AGE seconds. Each worker remembers the last FILES files it served.
+RECIPE_MEDIA_MAX_AGE = 3600
+RECIPE_MEDIA_FILES = 2048
 
 # Auth
 LOGIN_URL = '/login/'
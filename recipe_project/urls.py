@@ -1,7 +1,5 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 
 from .views import login_view, logout_view, success_view, about_view
 
@@ -20,4 +18,4 @@ urlpatterns = [
     path("", include("recipes.urls")),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# MEDIA_URL is served by recipes.media.MediaWhiteNoiseMiddleware
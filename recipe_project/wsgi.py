@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipe_project.settings')
 
 application = get_wsgi_application()
+
+# warm up this worker, or with RECIPE_PRELOAD=1 the gunicorn master
+# (see recipes/startup.py)
+from recipes.startup import application_loaded  # noqa: E402
+
+application_loaded()
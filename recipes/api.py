@@ -0,0 +1,223 @@
+"""
+Read-only JSON API mirroring the recipe list, detail and search pages.
+
+    GET /api/recipes/             keyset-paginated list, ordered by (name, id)
+    GET /api/recipes/<pk>/        one recipe
+    GET /api/search/?<filters>    RecipeSearchForm filters as query parameters
+    GET /api/autocomplete/?q=tom  recipe name and ingredient suggestions
+    GET /api/stats/               catalogue statistics (staff only)
+
+Query parameters:
+    fields   comma-separated subset of API_FIELDS (default: all of them)
+    cursor   next_cursor / previous_cursor of a previous page
+    limit    page size, up to MAX_PAGE_SIZE
+
+Rows are read with values_list() and turned straight into dicts, so no
+model instances are built. Every response carries an ETag of its body and
+answers If-None-Match with 304, which saves the transfer (not the query).
+"""
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .auth import is_authenticated
+from .autocomplete import MAX_SUGGESTIONS, get_autocomplete
+from .forms import RecipeSearchForm
+from .models import Recipe
+from .pagination import InvalidCursor, abounded_count, apaginate_keyset
+from .search import get_search_limit
+from .stats import dashboard
+
+# field -> ORM lookup
+API_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "category": "category__name",
+    "cooking_time": "cooking_time",
+    "difficulty": "difficulty",
+    "ingredients": "ingredient_list",
+    "description": "description",
+    "pic": "pic",
+    "updated_at": "updated_at",
+}
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidParameter(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """The requested fields, in request order, or every API field."""
+    if not value:
+        return tuple(API_FIELDS)
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in API_FIELDS]
+    if unknown or not fields:
+        raise InvalidParameter(f"Unknown fields: {', '.join(unknown) or value}")
+    return fields
+
+
+def parse_limit(value, default=PAGE_SIZE):
+    if not value:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidParameter(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+class RowSerializer:
+    """
+    values_list() columns for a set of fields, and row tuple -> dict.
+    Rows start with id and name whether or not they were asked for: they
+    are the keyset pagination key.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.lookups = ("id", "name", *(API_FIELDS[field] for field in fields))
+        self.pic_index = fields.index("pic") if "pic" in fields else None
+        self.storage = Recipe._meta.get_field("pic").storage
+
+    @staticmethod
+    def key(row):
+        return row[1], row[0]
+
+    def __call__(self, row):
+        values = row[2:]
+        if self.pic_index is not None:
+            values = list(values)
+            name = values[self.pic_index]
+            values[self.pic_index] = self.storage.url(name) if name else None
+        return dict(zip(self.fields, values))
+
+
+def error_response(message, status=400):
+    return JsonResponse({"error": message}, status=status)
+
+
+def json_response(request, payload):
+    """200 with `payload` as JSON, or 304 when the client has this body."""
+    body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def api_login_required(view):
+    """async_login_required, answering 401 instead of redirecting to the login page."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return error_response("Authentication required", status=401)
+        try:
+            return await view(request, *args, **kwargs)
+        except InvalidParameter as exc:
+            return error_response(str(exc))
+
+    return wrapper
+
+
+async def page_payload(qs, request, serializer):
+    try:
+        page = await apaginate_keyset(
+            qs.values_list(*serializer.lookups),
+            request.GET.get("cursor"),
+            parse_limit(request.GET.get("limit")),
+            key=serializer.key,
+        )
+    except InvalidCursor:
+        raise InvalidParameter("Invalid cursor")
+    return page, {
+        "results": [serializer(row) for row in page],
+        "next_cursor": page.next_cursor,
+        "previous_cursor": page.previous_cursor,
+    }
+
+
+@api_login_required
+async def recipe_list(request):
+    serializer = RowSerializer(parse_fields(request.GET.get("fields")))
+    _, payload = await page_payload(Recipe.objects.all(), request, serializer)
+    return json_response(request, payload)
+
+
+@api_login_required
+async def recipe_detail(request, pk):
+    serializer = RowSerializer(parse_fields(request.GET.get("fields")))
+    row = await Recipe.objects.filter(pk=pk).values_list(*serializer.lookups).afirst()
+    if row is None:
+        return error_response("Not found", status=404)
+    return json_response(request, serializer(row))
+
+
+@api_login_required
+async def recipe_search(request):
+    """
+    The search page's filters as query parameters. With keywords or a
+    pantry the results are the best matches in rank order, on a single page.
+    """
+    serializer = RowSerializer(parse_fields(request.GET.get("fields")))
+    form = RecipeSearchForm(request.GET)
+    if not await sync_to_async(form.is_valid)():
+        return JsonResponse({"error": "Invalid filters", "fields": form.errors}, status=400)
+
+    qs = await sync_to_async(form.filter_queryset)(Recipe.objects.all())
+    if form.is_ranked():
+        results = [serializer(row) async for row in qs.values_list(*serializer.lookups)[: get_search_limit()]]
+        payload = {"results": results, "count": len(results), "count_exact": True,
+                   "next_cursor": None, "previous_cursor": None}
+        return json_response(request, payload)
+
+    page, payload = await page_payload(qs, request, serializer)
+    count, count_exact = len(page), True
+    if page.has_other_pages():
+        count, count_exact = await abounded_count(qs)
+    payload.update(count=count, count_exact=count_exact)
+    return json_response(request, payload)
+
+
+@api_login_required
+async def autocomplete(request):
+    """
+    Suggestions for the word being typed, most used first, from the
+    in-process prefix index (recipes/autocomplete.py).
+
+    kind: "name" or "ingredient" (default: both)
+    """
+    kind = request.GET.get("kind")
+    if kind not in (None, "", "name", "ingredient"):
+        raise InvalidParameter("kind must be name or ingredient")
+    kinds = (kind,) if kind else ("name", "ingredient")
+    limit = min(parse_limit(request.GET.get("limit"), default=10), MAX_SUGGESTIONS)
+    # the first call builds the index from the database
+    index = await sync_to_async(get_autocomplete)()
+    suggestions = index.suggest(request.GET.get("q", "").rstrip("*"), kinds, limit)
+    payload = {
+        kind: [{"text": text, "count": count} for text, count in results]
+        for kind, results in suggestions.items()
+    }
+    return json_response(request, payload)
+
+
+@api_login_required
+async def stats(request):
+    """The statistics page's numbers, from the summary tables (recipes/stats.py)."""
+    if not await sync_to_async(lambda: request.user.is_staff)():
+        return error_response("Staff only", status=403)
+    return json_response(request, await sync_to_async(dashboard)())
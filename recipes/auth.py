@@ -0,0 +1,85 @@
+"""
+Login checks for async views, and the cached user lookup.
+
+Django 4.2's login_required and LoginRequiredMixin only wrap sync views,
+and request.user is a lazy object that queries the session and user tables
+on first access, which async code may not do directly.
+
+CachedModelBackend keeps the logged-in user in the RECIPE_USER_CACHE_ALIAS
+cache (None: not cached), so with cached sessions (recipes/sessions.py) a
+logged-in request runs neither query. Saving or deleting a user replaces
+its entry with a short-lived marker (recipes/signals.py): a password
+change therefore logs out the user's other sessions at once, as Django
+compares the session's password hash with the user's on every request.
+While the marker lasts the user is read from the database and not cached,
+so a request that read the user just before the change can't put the old
+copy back.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.mixins import AccessMixin
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import caches
+
+USER_CACHE_TIMEOUT = 300
+INVALIDATED = "invalidated"
+INVALIDATED_TIMEOUT = 2
+
+
+async def is_authenticated(request):
+    # resolves the lazy request.user in a thread; templates then reuse it
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def async_login_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin for class-based views with async handlers."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def get_user_cache():
+    alias = getattr(settings, "RECIPE_USER_CACHE_ALIAS", None)
+    return caches[alias] if alias else None
+
+
+def user_cache_key(user_id):
+    return f"recipe-user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    cache = get_user_cache()
+    if cache is not None:
+        cache.set(user_cache_key(user_id), INVALIDATED, INVALIDATED_TIMEOUT)
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user(), run once per request, reads the cache."""
+
+    def get_user(self, user_id):
+        cache = get_user_cache()
+        if cache is None:
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None or user == INVALIDATED:
+            fresh = super().get_user(user_id)
+            if fresh is not None and user is None:
+                cache.add(key, fresh, getattr(settings, "RECIPE_USER_CACHE_TIMEOUT", USER_CACHE_TIMEOUT))
+            return fresh
+        return user if self.user_can_authenticate(user) else None
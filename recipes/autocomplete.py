@@ -0,0 +1,322 @@
+"""
+In-process prefix index for search-as-you-type suggestions.
+
+Recipe names and ingredients each get a PrefixIndex: terms ranked by the
+number of recipes using them, found by the start of any word, so "tom"
+suggests "tomato" and "creamy tomato soup". Lookups stay in memory and
+never reach the database.
+
+The index is built on first use (wsgi.py / asgi.py start that at boot, in
+a background thread): names from the recipe table, ingredient counts from
+the ingredient index in one aggregate query. Every change to a recipe's
+name or ingredients is logged with its before and after values
+(recipes/changes.py), whichever process makes it. Each process replays
+the log on top of its index: right after its own changes commit, and for
+the others' at most every RECIPE_AUTOCOMPLETE_CHECK_INTERVAL seconds,
+with one indexed query. It rebuilds in the background only when more than
+RECIPE_AUTOCOMPLETE_REPLAY_LIMIT changes are waiting, e.g. after a bulk
+import, serving the old index meanwhile.
+
+Measured on 100k seeded recipes (recipes/seed.py), all distinct names with
+411k word starts: 28 MB (tracemalloc), most of it the name strings and
+their labels (15 MB) and the term -> id dict (4 MB); the word-start array
+is 8 bytes per entry. Build 0.8 s, lookups 10-300 µs; replaying a rename
+made by another process 3 ms.
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from itertools import islice
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count
+from django.dispatch import receiver
+
+from .changes import ChangeFeed, snapshot_isolation
+from .ingredients import parse_ingredients, prefix_upper_bound
+from .models import Ingredient, Recipe
+
+logger = logging.getLogger(__name__)
+
+MAX_SUGGESTIONS = 20
+REPLAY_LIMIT = 1000
+# words starting further into a term than this aren't indexed
+MAX_OFFSET = 255
+
+
+def normalize_term(text):
+    """'  Creamy  Tomato ' -> 'creamy tomato'"""
+    return " ".join((text or "").lower().split())
+
+
+def word_starts(term):
+    """'olive oil' -> [0, 6]"""
+    starts = [0]
+    position = term.find(" ")
+    while position != -1 and position < MAX_OFFSET:
+        starts.append(position + 1)
+        position = term.find(" ", position + 1)
+    return starts
+
+
+class PrefixIndex:
+    """
+    Terms ranked by count, findable by the start of any of their words.
+
+    Terms get small int ids. `entries` holds one int per word start,
+    id << 8 | offset, sorted by the text from that offset on, so a prefix
+    selects a range of it with bisect. A narrow range is ranked directly;
+    for a wide one (a letter or two typed) it is cheaper to walk `ranked`,
+    the ids most used first, until `limit` terms match. Either way a lookup
+    touches about sqrt(limit * terms) entries. Ties go to the older term,
+    which also keeps matches spread evenly through `ranked`.
+    """
+
+    def __init__(self, counts=(), labels=None):
+        # id -> term / count / text shown; ids of removed terms are reused
+        self.terms = []
+        self.counts = []
+        self.labels = []
+        self.ids = {}
+        self.free = []
+        labels = labels or {}
+        for term, count in counts:
+            self.ids[term] = len(self.terms)
+            self.terms.append(term)
+            self.counts.append(count)
+            self.labels.append(labels.get(term, term))
+        self.entries = array("q", sorted(
+            (term_id << 8 | offset for term_id, term in enumerate(self.terms) for offset in word_starts(term)),
+            key=self._suffix,
+        ))
+        self.ranked = array("q", sorted(range(len(self.terms)), key=self._rank))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _suffix(self, entry):
+        return self.terms[entry >> 8][entry & 0xFF:]
+
+    def _rank(self, term_id):
+        return -self.counts[term_id], term_id
+
+    def _remove_entry(self, entry):
+        position = bisect_left(self.entries, self._suffix(entry), key=self._suffix)
+        while self.entries[position] != entry:
+            position += 1
+        del self.entries[position]
+
+    def add(self, term, label):
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.free.pop() if self.free else len(self.terms)
+            if term_id == len(self.terms):
+                self.terms.append(term)
+                self.counts.append(0)
+                self.labels.append(label)
+            else:
+                self.terms[term_id], self.counts[term_id], self.labels[term_id] = term, 0, label
+            self.ids[term] = term_id
+            for offset in word_starts(term):
+                insort(self.entries, term_id << 8 | offset, key=self._suffix)
+        else:
+            del self.ranked[bisect_left(self.ranked, self._rank(term_id), key=self._rank)]
+        self.counts[term_id] += 1
+        insort(self.ranked, term_id, key=self._rank)
+
+    def discard(self, term):
+        term_id = self.ids.get(term)
+        if term_id is None:
+            return
+        del self.ranked[bisect_left(self.ranked, self._rank(term_id), key=self._rank)]
+        self.counts[term_id] -= 1
+        if self.counts[term_id]:
+            insort(self.ranked, term_id, key=self._rank)
+            return
+        for offset in word_starts(term):
+            self._remove_entry(term_id << 8 | offset)
+        del self.ids[term]
+        self.terms[term_id] = self.labels[term_id] = None
+        self.free.append(term_id)
+
+    def top(self, prefix, limit):
+        """(label, count) of the `limit` most used terms with a word starting with `prefix`."""
+        lo = bisect_left(self.entries, prefix, key=self._suffix)
+        hi = bisect_left(self.entries, prefix_upper_bound(prefix), lo, key=self._suffix)
+        if (hi - lo) ** 2 <= limit * len(self.ids):
+            best = heapq.nsmallest(limit, {entry >> 8 for entry in self.entries[lo:hi]}, key=self._rank)
+        else:
+            terms, word_start = self.terms, " " + prefix
+            matches = (
+                term_id for term_id in self.ranked
+                if terms[term_id].startswith(prefix) or word_start in terms[term_id]
+            )
+            best = list(islice(matches, limit))
+        return [(self.labels[term_id], self.counts[term_id]) for term_id in best]
+
+
+def recipe_terms(name, ingredients):
+    """(name term, ingredient terms) of one recipe."""
+    return normalize_term(name), parse_ingredients(ingredients)
+
+
+class Autocomplete:
+    def __init__(self, names, ingredients, feed=None):
+        self.names = names
+        self.ingredients = ingredients
+        # the logged changes not applied yet (recipes/changes.py)
+        self.feed = feed
+        self.checked = time.monotonic()
+        self.lock = threading.Lock()
+        self.replay_lock = threading.Lock()
+
+    @classmethod
+    def build(cls):
+        # one snapshot for the index and the point its feed starts from
+        with transaction.atomic():
+            snapshot_isolation()
+            feed = ChangeFeed()
+            name_counts, name_labels = {}, {}
+            # pk order: ids (and so ties) go oldest first, not alphabetically
+            for name in Recipe.objects.order_by("pk").values_list("name", flat=True).iterator(chunk_size=2000):
+                term = normalize_term(name)
+                if term:
+                    name_counts[term] = name_counts.get(term, 0) + 1
+                    name_labels.setdefault(term, name.strip())
+            # already parsed and counted by the ingredient index
+            ingredient_counts = list(
+                Ingredient.objects.annotate(recipe_count=Count("recipe_links"))
+                .filter(recipe_count__gt=0)
+                .values_list("name", "recipe_count")
+            )
+        return cls(PrefixIndex(name_counts.items(), name_labels), PrefixIndex(ingredient_counts), feed)
+
+    def replay(self):
+        """
+        Apply the changes logged since the last replay. Returns False when
+        there are too many, or the log no longer has them: rebuild then.
+        """
+        with self.replay_lock:
+            changes = self.feed.read(getattr(settings, "RECIPE_AUTOCOMPLETE_REPLAY_LIMIT", REPLAY_LIMIT))
+            if changes is None:
+                return False
+            for _, old, new in changes:
+                self.change(old, new)
+            return True
+
+    def change(self, old=None, new=None):
+        """
+        Replace one recipe's terms: old and new are (name, ingredients)
+        before and after, None for a created or deleted recipe.
+        """
+        with self.lock:
+            if old is not None:
+                name_term, ingredient_terms = recipe_terms(*old)
+                if name_term:
+                    self.names.discard(name_term)
+                for term in ingredient_terms:
+                    self.ingredients.discard(term)
+            if new is not None:
+                name_term, ingredient_terms = recipe_terms(*new)
+                if name_term:
+                    self.names.add(name_term, new[0].strip())
+                for term in ingredient_terms:
+                    self.ingredients.add(term, term)
+
+    def suggest(self, query, kinds=("name", "ingredient"), limit=10):
+        """{kind: [(label, count), ...]} for the terms with a word starting with `query`."""
+        prefix = normalize_term(query)
+        if not prefix:
+            return {kind: [] for kind in kinds}
+        indexes = {"name": self.names, "ingredient": self.ingredients}
+        with self.lock:
+            return {kind: indexes[kind].top(prefix, limit) for kind in kinds}
+
+
+_autocomplete = None
+_build_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def get_autocomplete():
+    """
+    This process's index. The first call builds it; later calls replay
+    the changes logged since, at most every CHECK_INTERVAL seconds.
+    """
+    global _autocomplete
+    index = _autocomplete
+    if index is None:
+        with _build_lock:
+            if _autocomplete is None:
+                _autocomplete = Autocomplete.build()
+            return _autocomplete
+    if time.monotonic() - index.checked > getattr(settings, "RECIPE_AUTOCOMPLETE_CHECK_INTERVAL", 5):
+        index.checked = time.monotonic()
+        sync_autocomplete()
+    return index
+
+
+def sync_autocomplete():
+    """
+    Bring this process's index, if built, up to date with the change log,
+    or start rebuilding it. Runs after this process's own changes commit.
+    """
+    index = _autocomplete
+    if index is None:
+        return
+    try:
+        if index.replay():
+            return
+    except DatabaseError:
+        logger.exception("Reading the recipe change log failed")
+        return
+    if not _rebuilding.is_set():
+        _rebuilding.set()
+        threading.Thread(target=_rebuild, name="autocomplete-rebuild", daemon=True).start()
+
+
+def _rebuild():
+    global _autocomplete
+    try:
+        index = Autocomplete.build()
+        # changes committed during the build
+        index.replay()
+        _autocomplete = index
+    except Exception:
+        logger.exception("Rebuilding the autocomplete index failed")
+    finally:
+        _rebuilding.clear()
+        connection.close()
+
+
+def _build_in_background():
+    try:
+        get_autocomplete()
+    except Exception:
+        # e.g. no database yet; the first request will try again
+        logger.exception("Building the autocomplete index failed")
+    finally:
+        connection.close()
+
+
+def warm_autocomplete():
+    """Start building the index in a background thread, e.g. at server start."""
+    if _autocomplete is None:
+        threading.Thread(target=_build_in_background, name="autocomplete-build", daemon=True).start()
+
+
+def current_autocomplete():
+    """This process's index, or None if it hasn't been built."""
+    return _autocomplete
+
+
+@receiver(setting_changed)
+def reset_autocomplete(setting=None, **kwargs):
+    global _autocomplete
+    if setting is None or setting.startswith("RECIPE_AUTOCOMPLETE"):
+        _autocomplete = None
@@ -0,0 +1,104 @@
+"""
+Small timing helpers shared by the bench_* management commands.
+"""
+import resource
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .seed import insert_recipes, seed_categories
+
+
+@contextmanager
+def seeded_recipes(count, batch_size=5000, seed=0):
+    """
+    Insert `count` synthetic recipes for the duration of the block, then roll
+    them back so benchmarks never leave data behind.
+    """
+    with transaction.atomic():
+        if count:
+            insert_recipes(count, seed=seed, category_ids=seed_categories(), batch_size=batch_size)
+        yield
+        transaction.set_rollback(True)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def latency_stats(timings_ms):
+    """p50/p95/p99 and mean of a list of latencies in milliseconds."""
+    timings = sorted(timings_ms)
+    return {
+        "runs": len(timings),
+        "mean_ms": round(statistics.fmean(timings), 3) if timings else 0.0,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+    }
+
+
+def measure(fn, repeat=10, warmup=1):
+    """
+    Call `fn` repeatedly and return latency stats in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return latency_stats(timings)
+
+
+def peak_rss_kib(pid=None):
+    """
+    Peak resident set size in KiB of this process, or of `pid` (Linux only).
+    """
+    if pid is None:
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss // 1024 if sys.platform == "darwin" else maxrss
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def memory_kib(pid):
+    """
+    Current RSS, PSS and peak RSS in KiB of `pid` (Linux only). PSS splits
+    shared pages between the processes sharing them, so for gunicorn
+    workers forked from a preloaded master it is the memory each one
+    really adds.
+    """
+    usage = {"rss": None, "pss": None, "peak_rss": peak_rss_kib(pid)}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in ("Rss", "Pss"):
+                    usage[field.lower()] = int(value.split()[0])
+    except OSError:
+        pass
+    return usage
+
+
+def with_children(pid):
+    """`pid` and its direct children, e.g. a gunicorn master and its workers (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [pid, *map(int, f.read().split())]
+    except OSError:
+        return [pid]
@@ -0,0 +1,127 @@
+"""
+Log of recipe changes for the in-process indexes.
+
+Every process keeps its own autocomplete and pantry indexes
+(recipes/autocomplete.py, recipes/pantry.py), built from the database. A change made by one process has to reach all
+the others, including separate ones such as manage.py import_recipes.
+RecipeChange rows carry the change itself: a recipe's (name, ingredients)
+before and after, None for a created or deleted recipe. Each index
+replays the rows it hasn't seen, in id order.
+
+The rows are written along with the change, in its transaction when it
+runs in one, so they commit and roll back with it. Recipe saves and
+deletes write them from signals (recipes/signals.py); bulk writers that
+bypass save() call log_created() next to their bulk_create. Rewriting the
+ingredient index itself (manage.py backfill_ingredients) changes no recipe
+but what every index was built from: log_reindexed() writes a row with
+neither old nor new, and a feed reading it asks for a rebuild.
+
+ChangeFeed reads the log. Ids come from the database in insert order,
+but a transaction can commit after a later one, so a process can't just
+remember the highest id it applied. The feed remembers the ids of the
+last GRACE seconds and reads that window again on each read. Rows older
+than GRACE and still missing belonged to transactions that rolled back.
+
+Rows older than RECIPE_CHANGE_LOG_KEEP seconds are deleted as new ones
+are written. A feed that hasn't read for that long can't tell what it
+missed, and its index is rebuilt instead.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import RecipeChange
+
+KEEP = 86400
+# longer than any transaction that writes recipes
+GRACE = 60
+PRUNE_INTERVAL = 300
+
+_pruned = 0.0
+
+
+def get_keep():
+    return getattr(settings, "RECIPE_CHANGE_LOG_KEEP", KEEP)
+
+
+def log_changes(changes):
+    """
+    Record (recipe id, old, new) changes; old and new are (name,
+    ingredients) or None. Call inside the transaction making the change.
+    """
+    global _pruned
+    rows = [
+        RecipeChange(recipe_id=pk, old=old and list(old), new=new and list(new))
+        for pk, old, new in changes
+        if old is None or new is None or tuple(old) != tuple(new)
+    ]
+    if not rows:
+        return
+    RecipeChange.objects.bulk_create(rows, batch_size=1000)
+    if time.monotonic() - _pruned > PRUNE_INTERVAL:
+        _pruned = time.monotonic()
+        RecipeChange.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=get_keep())).delete()
+
+
+def log_created(recipes):
+    """Log Recipe objects inserted in bulk, inside the inserting transaction."""
+    log_changes((recipe.pk, None, (recipe.name, recipe.ingredients)) for recipe in recipes)
+
+
+def log_reindexed():
+    """Log that the ingredient index was rewritten: every index rebuilds."""
+    RecipeChange.objects.create(recipe_id=0, old=None, new=None)
+
+
+def snapshot_isolation():
+    """
+    Make the open transaction read one snapshot, so an index built in it
+    and its ChangeFeed agree. SQLite transactions already do; PostgreSQL's
+    default READ COMMITTED takes a new one per query.
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+
+class ChangeFeed:
+    """
+    The log rows one index hasn't applied yet. Create it in the same
+    snapshot the index is built from (see snapshot_isolation()).
+    """
+
+    def __init__(self):
+        recent = timezone.now() - timedelta(seconds=GRACE)
+        self.floor = RecipeChange.objects.filter(created_at__lt=recent).aggregate(last=Max("id"))["last"] or 0
+        self.seen = set(RecipeChange.objects.filter(id__gt=self.floor).values_list("id", flat=True))
+        self.read_at = time.time()
+
+    def read(self, limit):
+        """
+        [(recipe id, old, new), ...] committed since the last read, in id order, or
+        None when there are more than `limit`, the feed fell behind the log
+        or the ingredient index was rewritten: rebuild the index then.
+        """
+        if time.time() - self.read_at > get_keep() - GRACE:
+            return None
+        rows = list(
+            RecipeChange.objects.filter(id__gt=self.floor)
+            .order_by("id")
+            .values_list("id", "recipe_id", "old", "new", "created_at")
+        )
+        new = [(recipe_id, old, new) for pk, recipe_id, old, new, _ in rows if pk not in self.seen]
+        if len(new) > limit or any(old is None and new is None for _, old, new in new):
+            return None
+        self.read_at = time.time()
+        recent = timezone.now() - timedelta(seconds=GRACE)
+        for pk, _, _, _, created_at in rows:
+            if created_at < recent:
+                self.floor = pk
+            else:
+                break
+        self.seen = {row[0] for row in rows if row[0] > self.floor}
+        return new
@@ -0,0 +1,127 @@
+"""
+Content-addressed cache for rendered search charts.
+
+A chart only depends on its type and the (label, value) series it is drawn
+from (recipes/charts.py), so the cache key is a hash of exactly that. Repeated
+searches over an unchanged result set skip matplotlib entirely.
+
+Storage is an in-process LRU by default. Set RECIPE_CHART_CACHE_ALIAS to use
+one of settings.CACHES instead (locmem, file-based, ...), in which case that
+cache's own MAX_ENTRIES/TIMEOUT bound its size.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# bump when chart rendering changes, so old images are not served
+CHART_CACHE_VERSION = 2
+DEFAULT_SIZE = 128
+
+
+def chart_key(chart_type, rows):
+    """
+    rows: iterable of tuples, e.g. (label, value); None hashes like ""
+    """
+    digest = hashlib.sha256(f"{CHART_CACHE_VERSION}\x1d{chart_type}\x1d".encode())
+    for row in rows:
+        digest.update(("\x1f".join("" if value is None else str(value) for value in row) + "\x1e").encode())
+    return digest.hexdigest()
+
+
+class LRUChartStore:
+    def __init__(self, max_entries=DEFAULT_SIZE):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheChartStore:
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ChartCache:
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        chart = self.store.get(key)
+        with self._lock:
+            if chart is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return chart
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def clear(self):
+        self.store.clear()
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+_chart_cache = None
+
+
+def get_chart_cache():
+    global _chart_cache
+    if _chart_cache is None:
+        alias = getattr(settings, "RECIPE_CHART_CACHE_ALIAS", None)
+        if alias:
+            store = DjangoCacheChartStore(alias)
+        else:
+            store = LRUChartStore(getattr(settings, "RECIPE_CHART_CACHE_SIZE", DEFAULT_SIZE))
+        _chart_cache = ChartCache(store)
+    return _chart_cache
+
+
+@receiver(setting_changed)
+def reset_chart_cache(setting, **kwargs):
+    global _chart_cache
+    if setting.startswith("RECIPE_CHART_CACHE"):
+        _chart_cache = None
@@ -0,0 +1,48 @@
+"""
+The data behind search charts, read with SQL.
+
+A chart is drawn from a short series of (label, value) pairs rather than
+from the matching recipes themselves:
+
+- "#2" (difficulty distribution) is one GROUP BY difficulty, however many
+  recipes match.
+- "#1" / "#3" (cooking time per recipe) plot the first
+  RECIPE_CHART_MAX_POINTS results in the page's order; more points would
+  not be readable anyway.
+
+The same series is what the chart URL serves as JSON (chart_payload), for
+drawing the chart in the browser instead.
+"""
+from django.conf import settings
+from django.db.models import Count
+
+from .utils import CHART_LABELS
+
+MAX_POINTS = 50
+
+
+def chart_series(qs, chart_type, max_points=None):
+    """(label, value) pairs for a chart of the recipes in `qs`."""
+    if chart_type == "#2":
+        counts = {}
+        for difficulty, count in qs.order_by().values_list("difficulty").annotate(count=Count("pk")):
+            # blank and NULL both mean not classified
+            label = difficulty or "Unknown"
+            counts[label] = counts.get(label, 0) + count
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    if max_points is None:
+        max_points = getattr(settings, "RECIPE_CHART_MAX_POINTS", MAX_POINTS)
+    return list(qs.values_list("name", "cooking_time")[:max_points])
+
+
+def chart_payload(chart_type, series):
+    """JSON-ready description of a chart, for client-side rendering."""
+    title, x_label, y_label = CHART_LABELS[chart_type]
+    return {
+        "chart_type": chart_type,
+        "title": title,
+        "x_label": x_label,
+        "y_label": y_label,
+        "series": [{"label": label, "value": value} for label, value in series],
+    }
@@ -0,0 +1,103 @@
+"""
+Rendered-fragment cache for the recipe detail page.
+
+Fragments are keyed on the recipe's pk, its updated_at, its category's id
+and name, its similar-recipe list, and two version values kept in the
+cache: one per recipe and one for every recipe at once. Signals
+(recipes/signals.py) bump them when a recipe or its pictures change; bulk
+writers that bypass save() call invalidate_*() themselves. updated_at, the
+category and the similar recipes come from the database rows the page is
+rendered from, so edits, category renames and deletions, rebuild_similar
+and the background similar-recipe updates show up on every worker even
+when the cache itself is per-process.
+
+The same key, with whether the user is staff (base.html's navigation
+differs), doubles as the page's ETag.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+FRAGMENT_TEMPLATE = "recipes/_recipe_detail.html"
+GENERATION_KEY = "recipe-detail:generation"
+
+
+def get_detail_cache():
+    return caches[getattr(settings, "RECIPE_DETAIL_CACHE_ALIAS", "default")]
+
+
+def version_key(pk):
+    return f"recipe-detail:version:{pk}"
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def get_versions(keys):
+    cache = get_detail_cache()
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # start from a fresh value, never from an old one: an evicted
+            # counter must not bring back fragments cached under it
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+    return found
+
+
+def category_version(recipe):
+    """The shown category: renaming one changes no recipe's updated_at."""
+    if recipe.category_id is None:
+        return "-"
+    return "{}-{}".format(recipe.category_id, hashlib.sha1(recipe.category.name.encode()).hexdigest()[:12])
+
+
+def similar_version(similar):
+    """The listed similar recipes: rows rewritten by other processes too."""
+    rows = "\x1e".join(f"{link.similar_id}:{link.score!r}:{link.similar.name}" for link in similar)
+    return hashlib.sha1(rows.encode()).hexdigest()[:12]
+
+
+def detail_cache_key(recipe, similar=()):
+    """
+    `recipe` should come with select_related("category"); `similar` is its
+    similar_recipes() list, shown on the page.
+    """
+    versions = get_versions([version_key(recipe.pk), GENERATION_KEY])
+    return "recipe-detail:{}:{}:{}:{}:{}.{}".format(
+        recipe.pk,
+        recipe.updated_at.timestamp(),
+        category_version(recipe),
+        similar_version(similar),
+        versions[GENERATION_KEY],
+        versions[version_key(recipe.pk)],
+    )
+
+
+def detail_etag(key):
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+def render_detail_fragment(key, context):
+    """
+    The cached page body under `key`, rendered from FRAGMENT_TEMPLATE on a miss.
+    """
+    cache = get_detail_cache()
+    html = cache.get(key)
+    if html is None:
+        html = render_to_string(FRAGMENT_TEMPLATE, context)
+        cache.set(key, html, getattr(settings, "RECIPE_DETAIL_CACHE_TIMEOUT", 3600))
+    return mark_safe(html)
+
+
+def invalidate_recipe_details(pks):
+    get_detail_cache().set_many({version_key(pk): _new_version() for pk in pks}, None)
+
+
+def invalidate_all_recipe_details():
+    get_detail_cache().set(GENERATION_KEY, _new_version(), None)
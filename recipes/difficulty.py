@@ -0,0 +1,104 @@
+"""
+Difficulty rules and the ingredient parsing they depend on.
+
+Kept free of model imports so Recipe.save() and the recompute_difficulty
+command share one definition of the rules. Migrations keep their own copy
+of the rules they were written with.
+"""
+EASY = "Easy"
+MEDIUM = "Medium"
+HARD = "Hard"
+VERY_HARD = "Very Hard"
+
+DIFFICULTY_CHOICES = [(d, d) for d in (EASY, MEDIUM, HARD, VERY_HARD)]
+
+# checked in order: (difficulty, cooking time below, at most this many ingredients)
+RULES = (
+    (EASY, 10, 3),
+    (MEDIUM, 20, 6),
+    (HARD, 30, 10),
+)
+
+# fields Recipe.save() fills in from `ingredients` and `cooking_time`
+PRECOMPUTED_FIELDS = ("ingredient_list", "ingredient_count", "difficulty")
+
+
+def split_ingredients(text):
+    """Split the comma-separated field into display items (original casing)."""
+    return [i.strip() for i in (text or "").split(",") if i.strip()]
+
+
+def classify_difficulty(cooking_time, num_ingredients):
+    for difficulty, max_time, max_ingredients in RULES:
+        if cooking_time < max_time and num_ingredients <= max_ingredients:
+            return difficulty
+    return VERY_HARD
+
+
+def classify_difficulties(cooking_times, ingredient_counts):
+    """
+    Vectorized classify_difficulty: two equal-length arrays in, an object
+    array of difficulty labels out. Same RULES, evaluated with NumPy.
+    """
+    import numpy as np
+
+    times = np.asarray(cooking_times)
+    counts = np.asarray(ingredient_counts)
+    conditions = [(times < max_time) & (counts <= max_ingredients) for _, max_time, max_ingredients in RULES]
+    # np.select picks the first matching rule, like the if/elif chain
+    codes = np.select(conditions, np.arange(len(RULES)), default=len(RULES))
+    labels = np.array([difficulty for difficulty, _, _ in RULES] + [VERY_HARD], dtype=object)
+    return labels[codes]
+
+
+def precomputed_values(ingredients, cooking_time):
+    ingredient_list = split_ingredients(ingredients)
+    return {
+        "ingredient_list": ingredient_list,
+        "ingredient_count": len(ingredient_list),
+        "difficulty": classify_difficulty(cooking_time, len(ingredient_list)),
+    }
+
+
+def recompute_precomputed(model, batch_size=1000, only_changed=True):
+    """
+    Recompute PRECOMPUTED_FIELDS for every row of `model` (the Recipe model)
+    in pk-ordered batches.
+    Returns (rows scanned, rows updated).
+    """
+    scanned = updated = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            model.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .only("pk", "ingredients", "cooking_time", *PRECOMPUTED_FIELDS)[:batch_size]
+        )
+        if not batch:
+            break
+
+        ingredient_lists = [split_ingredients(recipe.ingredients) for recipe in batch]
+        difficulties = classify_difficulties(
+            [recipe.cooking_time for recipe in batch],
+            [len(items) for items in ingredient_lists],
+        )
+
+        changed = []
+        for recipe, ingredient_list, difficulty in zip(batch, ingredient_lists, difficulties):
+            values = {
+                "ingredient_list": ingredient_list,
+                "ingredient_count": len(ingredient_list),
+                "difficulty": difficulty,
+            }
+            if only_changed and all(getattr(recipe, k) == v for k, v in values.items()):
+                continue
+            for field, value in values.items():
+                setattr(recipe, field, value)
+            changed.append(recipe)
+
+        if changed:
+            model.objects.bulk_update(changed, PRECOMPUTED_FIELDS)
+        scanned += len(batch)
+        updated += len(changed)
+        last_pk = batch[-1].pk
+    return scanned, updated
@@ -1,5 +1,15 @@
 from django import forms
+from django.db.models import Model
+
+from categories.models import Category
+
 from .models import Recipe
+from .difficulty import DIFFICULTY_CHOICES
+from .facets import TIME_BUCKET_CHOICES, apply_facets
+from .images import create_derivatives
+from .ingredients import filter_by_ingredients
+from .pantry import DEFAULT_MISSING, MAX_MISSING, pantry_matches
+from .search import cached_matches, get_match_limit, rank_order, ranked_queryset, search_recipes
 
 CHART_CHOICES = (
     ("", "— No chart —"),
@@ -10,6 +20,20 @@ CHART_CHOICES = (
 
 
 class RecipeSearchForm(forms.Form):
+    keywords = forms.CharField(
+        required=False,
+        max_length=200,
+        label="Keywords",
+        help_text="Searches name, ingredients and description; best matches first.",
+        widget=forms.TextInput(
+            attrs={
+                "placeholder": "e.g. creamy tomato soup",
+                "class": "form-control",
+                "autocomplete": "off",
+            }
+        ),
+    )
+
     recipe_name = forms.CharField(
         required=False,
         max_length=120,
@@ -26,7 +50,8 @@ class RecipeSearchForm(forms.Form):
     ingredient = forms.CharField(
         required=False,
         max_length=120,
-        label="Ingredient contains",
+        label="Ingredients",
+        help_text="Comma-separated. End a term with * to match by prefix (tom* finds tomato).",
         widget=forms.TextInput(
             attrs={
                 "placeholder": "e.g. garlic, milk",
@@ -36,6 +61,36 @@ class RecipeSearchForm(forms.Form):
         ),
     )
 
+    pantry = forms.CharField(
+        required=False,
+        max_length=1000,
+        label="Ingredients I have",
+        help_text="Comma-separated. Finds what you can cook with them, fewest missing ingredients first.",
+        widget=forms.Textarea(
+            attrs={
+                "placeholder": "e.g. eggs, milk, flour, butter",
+                "class": "form-control",
+                "rows": 2,
+            }
+        ),
+    )
+
+    max_missing = forms.IntegerField(
+        required=False,
+        min_value=0,
+        max_value=MAX_MISSING,
+        label="Missing ingredients allowed",
+        widget=forms.NumberInput(
+            attrs={
+                "placeholder": str(DEFAULT_MISSING),
+                "class": "form-control",
+                "min": 0,
+                "max": MAX_MISSING,
+                "step": 1,
+            }
+        ),
+    )
+
     max_cooking_time = forms.IntegerField(
         required=False,
         min_value=1,
@@ -50,6 +105,28 @@ class RecipeSearchForm(forms.Form):
         ),
     )
 
+    difficulty = forms.ChoiceField(
+        required=False,
+        choices=[("", "Any difficulty")] + DIFFICULTY_CHOICES,
+        label="Difficulty",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
+    category = forms.ModelChoiceField(
+        required=False,
+        queryset=Category.objects.order_by("name"),
+        empty_label="Any category",
+        label="Category",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
+    time_bucket = forms.ChoiceField(
+        required=False,
+        choices=[("", "Any cooking time")] + TIME_BUCKET_CHOICES,
+        label="Cooking time",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
     chart_type = forms.ChoiceField(
         required=False,
         choices=CHART_CHOICES,
@@ -57,6 +134,80 @@ class RecipeSearchForm(forms.Form):
         widget=forms.Select(attrs={"class": "form-control"}),
     )
 
+    # fields that narrow the result set (chart_type only changes the display)
+    FILTER_FIELDS = (
+        "keywords", "recipe_name", "ingredient", "pantry", "max_missing", "max_cooking_time", "difficulty",
+        "category", "time_bucket",
+    )
+    # applied on top of the text matches, so picking one doesn't search again
+    FACET_FIELDS = ("category", "difficulty", "time_bucket")
+
+    def is_ranked(self):
+        """Whether filter_queryset() returns the top matches in rank order."""
+        data = self.cleaned_data
+        return bool((data.get("keywords") or "").strip() or (data.get("pantry") or "").strip())
+
+    def filter_queryset(self, qs):
+        """
+        Apply the cleaned filters to a Recipe queryset.
+        With keywords, the result is the top matches by relevance in rank order.
+        With a pantry, it is the recipes missing the fewest of their
+        ingredients (recipes/pantry.py), in that order.
+        """
+        data = self.cleaned_data
+        keywords = (data.get("keywords") or "").strip()
+        recipe_name = (data.get("recipe_name") or "").strip()
+        ingredient = (data.get("ingredient") or "").strip()
+        pantry = (data.get("pantry") or "").strip()
+
+        pantry_ids = None
+        if pantry:
+            # from the in-memory index; the other filters narrow these
+            pantry_ids = pantry_matches(pantry, data.get("max_missing"), get_match_limit())
+            qs = qs.filter(pk__in=pantry_ids)
+        if ingredient:
+            qs = filter_by_ingredients(qs, ingredient)
+        if data.get("max_cooking_time"):
+            qs = qs.filter(cooking_time__lte=data["max_cooking_time"])
+        if keywords or recipe_name:
+            qs = self.text_matches(qs, keywords, recipe_name)
+        qs = apply_facets(qs, data)
+        if pantry_ids:
+            qs = qs.order_by(rank_order(pantry_ids))
+        return qs
+
+    def text_matches(self, qs, keywords, recipe_name):
+        """
+        `qs` narrowed by the keyword / name filters. The matching ids come
+        from the match cache when the same search ran recently, so changing
+        only a facet doesn't run the full-text or LIKE query again.
+        """
+        limit = get_match_limit()
+        named = qs.filter(name__icontains=recipe_name) if recipe_name else qs
+
+        def compute():
+            if keywords:
+                # ranked, so the top N within a facet come from the top `limit`
+                return search_recipes(keywords, base_qs=named, limit=limit)
+            ids = list(named.order_by().values_list("pk", flat=True)[: limit + 1])
+            return ids if len(ids) <= limit else None
+
+        filters = {name: self.cleaned_data.get(name) for name in self.FILTER_FIELDS if name not in self.FACET_FIELDS}
+        ids = cached_matches(filters, compute)
+        if keywords:
+            return ranked_queryset(ids)
+        if ids is None:
+            return named
+        return Recipe.objects.filter(pk__in=ids)
+
+    def filter_params(self):
+        """The non-empty filters, e.g. for an export link's query string."""
+        return {
+            name: value.pk if isinstance(value, Model) else value
+            for name in self.FILTER_FIELDS
+            if (value := self.cleaned_data.get(name)) not in (None, "")
+        }
+
 
 class AddRecipeForm(forms.ModelForm):
     """
@@ -73,3 +224,10 @@ class AddRecipeForm(forms.ModelForm):
             "description": forms.Textarea(attrs={"class": "form-control", "rows": 5, "placeholder": "Short recipe description / steps"}),
             "category": forms.Select(attrs={"class": "form-control"}),
         }
+
+    def save(self, commit=True):
+        recipe = super().save(commit=commit)
+        if commit and "pic" in self.changed_data:
+            # thumbnails/srcset sizes for the list and detail pages
+            create_derivatives(recipe)
+        return recipe
@@ -0,0 +1,141 @@
+"""
+Responsive image derivatives for Recipe.pic.
+
+Each uploaded picture is resized to a few widths in WebP and JPEG and stored
+as RecipeImage rows with their pixel size, so templates can emit srcset and
+width/height instead of shipping the multi-hundred-KB original everywhere.
+
+render_derivatives() works on bytes only, so the backfill command can run
+it in worker processes.
+"""
+import hashlib
+import re
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .detail_cache import invalidate_recipe_details
+from .models import RecipeImage
+
+WIDTHS = (160, 320, 640, 1024)
+
+# format -> (Pillow format, file extension, save options)
+FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def read_source(pic):
+    """Bytes of a FieldFile, or None if it has no file or the file is missing."""
+    if not pic:
+        return None
+    try:
+        with pic.storage.open(pic.name, "rb") as f:
+            return f.read()
+    except (FileNotFoundError, OSError):
+        return None
+
+
+def render_derivatives(data):
+    """
+    Resize image bytes to every WIDTHS entry (never upscaling) and encode
+    them in every FORMATS entry.
+    Returns a list of (format, width, height, bytes), or [] if `data` isn't an image.
+    """
+    # Pillow (which imports numpy) loads on the first upload, not at start-up
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        source = Image.open(BytesIO(data))
+        source.load()
+    except (UnidentifiedImageError, OSError):
+        return []
+
+    source = ImageOps.exif_transpose(source).convert("RGB")
+    widths = sorted({min(width, source.width) for width in WIDTHS})
+
+    results = []
+    for width in widths:
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.LANCZOS)
+        for fmt, (pil_format, _, options) in FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, **options)
+            results.append((fmt, width, height, buffer.getvalue()))
+    return results
+
+
+# names made by derivative_name(): a new source picture gets new names
+DERIVATIVE_NAME_RE = re.compile(r"\.[0-9a-f]{10}\.\d+w\.(?:webp|jpg)$")
+
+
+def derivative_name(source_name, digest, fmt, width):
+    """
+    'recipes/lasagne.jpg' -> 'lasagne.3f2a9c01d4.320w.webp'
+    The source hash in the name means a new upload never reuses an old URL.
+    """
+    stem = PurePosixPath(source_name).stem[:60]
+    return f"{stem}.{digest[:10]}.{width}w.{FORMATS[fmt][1]}"
+
+
+def save_derivative(rendition, name, content):
+    """
+    Store a derivative under exactly `name`. The storage would add a suffix
+    to a name that is taken (a file left by an earlier run), and a suffixed
+    name no longer matches DERIVATIVE_NAME_RE; the name is this recipe's
+    and this source's only, so the old file is simply replaced.
+    """
+    name = rendition.image.field.generate_filename(rendition, name)
+    storage = rendition.image.storage
+    storage.delete(name)
+    rendition.image.name = storage.save(name, ContentFile(content))
+
+
+@transaction.atomic
+def save_derivatives(recipe, derivatives, digest):
+    """
+    Replace the recipe's RecipeImage rows (and files) with `derivatives`.
+    `digest` is the source picture's hash; the names hash it with the
+    recipe's pk, so recipes sharing a picture don't share files.
+    """
+    for old in recipe.renditions.all():
+        old.image.delete(save=False)
+    recipe.renditions.all().delete()
+
+    key = hashlib.sha256(f"{recipe.pk}:{digest}".encode()).hexdigest()
+    renditions = []
+    for fmt, width, height, content in derivatives:
+        rendition = RecipeImage(recipe=recipe, format=fmt, width=width, height=height)
+        save_derivative(rendition, derivative_name(recipe.pic.name, key, fmt, width), content)
+        renditions.append(rendition)
+    renditions = RecipeImage.objects.bulk_create(renditions)
+    transaction.on_commit(lambda: invalidate_recipe_details([recipe.pk]))
+    return renditions
+
+
+def create_derivatives(recipe):
+    data = read_source(recipe.pic)
+    if data is None:
+        return []
+    return save_derivatives(recipe, render_derivatives(data), hashlib.sha256(data).hexdigest())
+
+
+def picture_sources(renditions):
+    """
+    Group renditions for a <picture> element:
+    {"webp": "url 160w, url 320w", "jpeg": "...", "fallback": RecipeImage}
+    """
+    by_format = {}
+    for rendition in sorted(renditions, key=lambda r: r.width):
+        by_format.setdefault(rendition.format, []).append(rendition)
+    if not by_format:
+        return None
+
+    sources = {fmt: ", ".join(f"{r.image.url} {r.width}w" for r in items) for fmt, items in by_format.items()}
+    jpegs = by_format.get("jpeg") or next(iter(by_format.values()))
+    # <img src> for browsers without srcset: the first one that is sharp on 2x screens
+    sources["fallback"] = next((r for r in jpegs if r.width >= 320), jpegs[-1])
+    return sources
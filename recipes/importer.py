@@ -0,0 +1,240 @@
+"""
+Streaming bulk import of recipes from CSV or JSON Lines.
+
+Input is read row by row and written in bulk_create batches, one
+transaction per batch, so memory use does not grow with the file size.
+
+Columns / keys: name, description, ingredients, cooking_time, and optionally
+id (stable external id), category (name) and image (file name).
+ingredients may be a comma-separated string or, in JSONL, a list.
+
+Re-runs are idempotent: every row gets an external_id (its "id" column, or
+a hash of its content) and rows whose external_id already exists are
+skipped. A progress file records the last committed line so an interrupted
+import can resume without re-reading the database for finished batches;
+it is removed once the whole file is in. New categories are created in the
+transaction of the batch that first uses them. The first MAX_ERRORS
+rejected rows are kept for the report, the rest only counted.
+"""
+import csv
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from categories.models import Category
+
+from .changes import log_created
+from .difficulty import classify_difficulties, split_ingredients
+from .ingredients import index_recipes
+from .models import Recipe
+from .signals import recipes_bulk_created
+
+REQUIRED = ("name", "description", "ingredients", "cooking_time")
+PIC_DIR = Recipe._meta.get_field("pic").upload_to
+MAX_ERRORS = 1000
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """
+    Yield (line number, dict) from a .csv or .jsonl file. A JSONL line that
+    isn't a JSON object comes as (line number, RowError) instead.
+    """
+    fmt = fmt or ("csv" if str(path).endswith(".csv") else "jsonl")
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield number, RowError(f"invalid JSON: {exc.msg}")
+                continue
+            yield number, row if isinstance(row, dict) else RowError("not a JSON object")
+
+
+class CategoryCache:
+    """
+    name -> id, loaded once and extended as new names appear. Names
+    created since the last commit() are forgotten again by rollback().
+    """
+
+    def __init__(self):
+        self.ids = {name.lower(): pk for pk, name in Category.objects.values_list("pk", "name")}
+        self.added = []
+
+    def get(self, name):
+        name = (name or "").strip()
+        if not name:
+            return None
+        key = name.lower()
+        if key not in self.ids:
+            self.ids[key] = Category.objects.create(name=name[:50]).pk
+            self.added.append(key)
+        return self.ids[key]
+
+    def commit(self):
+        self.added = []
+
+    def rollback(self):
+        for key in self.added:
+            del self.ids[key]
+        self.added = []
+
+
+def external_id_for(row):
+    if row.get("id") not in (None, ""):
+        return str(row["id"])[:64]
+    content = "\x1f".join(str(row.get(field, "")) for field in REQUIRED)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def build_recipe(row):
+    missing = [field for field in REQUIRED if row.get(field) in (None, "")]
+    if missing:
+        raise RowError(f"missing {', '.join(missing)}")
+    try:
+        cooking_time = int(row["cooking_time"])
+    except (TypeError, ValueError):
+        raise RowError(f"bad cooking_time {row['cooking_time']!r}")
+    if cooking_time < 0:
+        raise RowError("negative cooking_time")
+
+    ingredients = row["ingredients"]
+    if isinstance(ingredients, list):
+        ingredients = ",".join(str(i) for i in ingredients)
+
+    ingredient_list = split_ingredients(ingredients)
+    return Recipe(
+        external_id=external_id_for(row),
+        name=str(row["name"])[:120],
+        description=str(row["description"]),
+        ingredients=ingredients,
+        ingredient_list=ingredient_list,
+        ingredient_count=len(ingredient_list),
+        cooking_time=cooking_time,
+    )
+
+
+class RecipeImporter:
+    def __init__(self, batch_size=1000, image_dir=None, progress_path=None, on_batch=None):
+        self.batch_size = batch_size
+        self.image_dir = Path(image_dir) if image_dir else None
+        self.progress_path = progress_path
+        self.on_batch = on_batch
+        self.categories = CategoryCache()
+        self.created = self.skipped = 0
+        # (line, message) of the first MAX_ERRORS rejected rows
+        self.errors = []
+        self.error_count = 0
+
+    def load_progress(self):
+        if self.progress_path and os.path.exists(self.progress_path):
+            with open(self.progress_path) as f:
+                return int(f.read().strip() or 0)
+        return 0
+
+    def save_progress(self, line):
+        if self.progress_path:
+            with open(self.progress_path, "w") as f:
+                f.write(str(line))
+
+    def clear_progress(self):
+        if self.progress_path and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
+
+    def reject(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def run(self, rows, resume=False):
+        """
+        rows: iterable of (line number, dict), e.g. read_rows(path)
+        """
+        start_after = self.load_progress() if resume else 0
+        batch = []
+        line = 0
+        for line, row in rows:
+            if line <= start_after:
+                continue
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                batch.append((row, build_recipe(row)))
+            except RowError as exc:
+                self.reject(line, str(exc))
+            if len(batch) >= self.batch_size:
+                self.flush(batch, line)
+                batch = []
+        if batch:
+            self.flush(batch, line)
+        self.clear_progress()
+        return self.created
+
+    def flush(self, batch, line):
+        copied = []
+        try:
+            with transaction.atomic():
+                keys = [recipe.external_id for _, recipe in batch]
+                existing = set(Recipe.objects.filter(external_id__in=keys).values_list("external_id", flat=True))
+
+                new, seen = [], set()
+                for row, recipe in batch:
+                    if recipe.external_id in existing or recipe.external_id in seen:
+                        self.skipped += 1
+                        continue
+                    seen.add(recipe.external_id)
+                    recipe.category_id = self.categories.get(row.get("category"))
+                    self.attach_image(recipe, row.get("image"), copied)
+                    new.append(recipe)
+
+                if new:
+                    difficulties = classify_difficulties(
+                        [r.cooking_time for r in new], [r.ingredient_count for r in new]
+                    )
+                    for recipe, difficulty in zip(new, difficulties):
+                        recipe.difficulty = difficulty
+                    Recipe.objects.bulk_create(new)
+                    # bulk_create skips post_save, so index ingredients here
+                    index_recipes([(recipe.pk, recipe.ingredients) for recipe in new])
+                    log_created(new)
+        except Exception:
+            # the batch rolled back: no row points at its picture copies,
+            # and the categories it created are gone
+            for name in copied:
+                default_storage.delete(name)
+            self.categories.rollback()
+            raise
+
+        self.categories.commit()
+        self.created += len(new)
+        self.save_progress(line)
+        if new:
+            recipes_bulk_created.send(sender=Recipe, recipe_ids=[recipe.pk for recipe in new])
+        if self.on_batch:
+            self.on_batch(self)
+
+    def attach_image(self, recipe, filename, copied):
+        """Copy the row's picture into storage, adding its name to `copied`."""
+        if not (self.image_dir and filename):
+            return
+        path = self.image_dir / Path(filename).name
+        if not path.is_file():
+            return
+        with open(path, "rb") as f:
+            recipe.pic.name = default_storage.save(f"{PIC_DIR}/{path.name}", File(f))
+        copied.append(recipe.pic.name)
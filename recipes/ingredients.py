@@ -0,0 +1,124 @@
+"""
+Normalized ingredient index.
+
+Recipe.ingredients stays the editable comma-separated text. The Ingredient /
+RecipeIngredient rows are derived from it so search can use indexed lookups
+instead of scanning the text column with LIKE.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Q
+
+from .difficulty import split_ingredients
+from .models import Ingredient, RecipeIngredient
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+NAME_MAX_LENGTH = Ingredient._meta.get_field("name").max_length
+
+
+def normalize_ingredient(name):
+    """'  Olive   Oil ' -> 'olive oil'"""
+    return _WHITESPACE_RE.sub(" ", name).strip().lower()[:NAME_MAX_LENGTH]
+
+
+def parse_ingredients(text):
+    """
+    Return unique normalized ingredient names, in the order they appear.
+    """
+    names = []
+    seen = set()
+    for item in split_ingredients(text):
+        name = normalize_ingredient(item)
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def get_ingredient_ids(names):
+    """
+    Map normalized names to Ingredient ids, creating missing rows.
+    """
+    ids = dict(Ingredient.objects.filter(name__in=names).values_list("name", "id"))
+    missing = [n for n in names if n not in ids]
+    if missing:
+        # ignore_conflicts: another request may have created the same name meanwhile
+        Ingredient.objects.bulk_create([Ingredient(name=n) for n in missing], ignore_conflicts=True)
+        ids.update(Ingredient.objects.filter(name__in=missing).values_list("name", "id"))
+    return ids
+
+
+def build_links(recipe_id, names, ids):
+    return [
+        RecipeIngredient(recipe_id=recipe_id, ingredient_id=ids[name], position=position)
+        for position, name in enumerate(names)
+    ]
+
+
+@transaction.atomic
+def sync_recipe_ingredients(recipe):
+    """
+    Rebuild the RecipeIngredient rows of one recipe from its text field.
+    """
+    names = parse_ingredients(recipe.ingredients)
+    RecipeIngredient.objects.filter(recipe_id=recipe.pk).delete()
+    if names:
+        ids = get_ingredient_ids(names)
+        RecipeIngredient.objects.bulk_create(build_links(recipe.pk, names, ids))
+    return names
+
+
+@transaction.atomic
+def index_recipes(rows):
+    """
+    Rebuild RecipeIngredient rows for many recipes at once.
+    rows: (pk, ingredients text) pairs
+    """
+    parsed = [(pk, parse_ingredients(text)) for pk, text in rows]
+    ids = get_ingredient_ids(sorted({name for _, names in parsed for name in names}))
+    RecipeIngredient.objects.filter(recipe_id__in=[pk for pk, _ in parsed]).delete()
+    links = []
+    for pk, names in parsed:
+        links.extend(build_links(pk, names, ids))
+    RecipeIngredient.objects.bulk_create(links)
+
+
+def prefix_upper_bound(prefix):
+    """
+    Smallest string greater than every string starting with `prefix`.
+    name >= prefix AND name < bound is an index range scan on every backend,
+    unlike LIKE 'prefix%' which SQLite can't serve from a case-sensitive index.
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def ingredient_lookup(term):
+    """
+    Q for Ingredient rows matching one search term.
+    "garlic" is an exact match, "tom*" matches every ingredient starting with "tom".
+    """
+    term = term.strip()
+    prefix = term.endswith("*")
+    name = normalize_ingredient(term.rstrip("*"))
+    if not name:
+        return None
+    if prefix:
+        return Q(name__gte=name, name__lt=prefix_upper_bound(name))
+    return Q(name=name)
+
+
+def filter_by_ingredients(qs, text):
+    """
+    Narrow a Recipe queryset to recipes containing every comma-separated term.
+    """
+    for term in (text or "").split(","):
+        lookup = ingredient_lookup(term)
+        if lookup is None:
+            continue
+        ingredient_ids = Ingredient.objects.filter(lookup).values("id")
+        qs = qs.filter(
+            pk__in=RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids).values("recipe_id")
+        )
+    return qs
@@ -0,0 +1,270 @@
+"""
+Request-level benchmark of the recipe views, used by the bench_views command.
+
+Each scenario is one user-visible action (open the list, open a recipe,
+search with or without a chart, add a recipe). Scenarios are driven either
+in-process through the Django test client, or over HTTP against a running
+server such as a local gunicorn. The server must use the same database,
+because the bench user's session is written straight to the session
+store.
+
+Each scenario also reports the SQL queries per request, as counted by the
+server in its Server-Timing header (RECIPE_SERVER_TIMING).
+
+A chart scenario counts until the chart image has been served, not just
+the search page. Each request picks a random max_cooking_time, so most
+charts are distinct; repeated ones are chart cache hits, as in real use.
+"""
+import http.client
+import random
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.middleware.csrf import CSRF_ALLOWED_CHARS
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .bench import latency_stats
+from .models import Recipe
+from .seed import INGREDIENTS
+from .sessions import flush_sessions
+
+BENCH_USERNAME = "bench"
+# recipes created by the "add" scenario, deleted afterwards
+ADDED_PREFIX = "Bench recipe"
+
+_CHART_URL_RE = re.compile(r'src="(/charts/[0-9a-f]+\.png)"')
+CHART_POLLS = 30
+_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+class ServerQueries:
+    """Totals of the query counts in the Server-Timing headers seen."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.responses = 0
+
+    def record(self, header):
+        match = _QUERIES_RE.search(header or "")
+        if match:
+            with self.lock:
+                self.queries += int(match.group(1))
+                self.responses += 1
+
+    def totals(self):
+        with self.lock:
+            return self.queries, self.responses
+
+
+class ClientTransport:
+    """In-process requests through django.test.Client."""
+
+    def __init__(self, user):
+        # "testserver" is only allowed inside the test runner
+        self.client = Client(HTTP_HOST="localhost")
+        self.client.force_login(user)
+        self.server_queries = ServerQueries()
+
+    def request(self, method, path, data=None):
+        if method == "POST":
+            response = self.client.post(path, data or {})
+        else:
+            response = self.client.get(path, data or {})
+        self.server_queries.record(response.get("Server-Timing"))
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, body
+
+
+class HTTPTransport:
+    """Requests over HTTP, one keep-alive connection per thread."""
+
+    def __init__(self, base_url, user):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        client = Client()
+        client.force_login(user)
+        # the server reads it from the database or a cache shared with it,
+        # not from this process's pending writes (recipes/sessions.py)
+        flush_sessions()
+        session_id = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.csrf_token = get_random_string(32, CSRF_ALLOWED_CHARS)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={session_id}; {settings.CSRF_COOKIE_NAME}={self.csrf_token}"
+        self.local = threading.local()
+        self.server_queries = ServerQueries()
+
+    def connection(self):
+        if not hasattr(self.local, "connection"):
+            self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return self.local.connection
+
+    def request(self, method, path, data=None):
+        headers = {"Cookie": self.cookie}
+        body = None
+        if method == "POST":
+            body = urlencode(data or {})
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            headers["X-CSRFToken"] = self.csrf_token
+        elif data:
+            path = f"{path}?{urlencode(data)}"
+        connection = self.connection()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+            self.server_queries.record(response.getheader("Server-Timing"))
+            return response.status, body
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            raise
+
+
+class Scenarios:
+    """
+    name -> callable(transport, rng) returning the final status code.
+    """
+
+    def __init__(self, recipe_ids, category_id=None):
+        self.recipe_ids = recipe_ids
+        self.category_id = category_id
+
+    def all(self):
+        scenarios = {
+            "overview": self.overview,
+            "detail": self.detail,
+            "search": self.search,
+            "search_keywords": self.search_keywords,
+        }
+        for chart_type in ("#1", "#2", "#3"):
+            scenarios[f"search_chart_{chart_type[1:]}"] = self.search_with_chart(chart_type)
+        scenarios["add"] = self.add
+        scenarios.update(api_list=self.api_list, api_detail=self.api_detail, api_search=self.api_search)
+        return scenarios
+
+    def overview(self, transport, rng):
+        return transport.request("GET", reverse("recipes:recipes_overview"))[0]
+
+    def detail(self, transport, rng):
+        pk = rng.choice(self.recipe_ids)
+        return transport.request("GET", reverse("recipes:recipe_detail", args=[pk]))[0]
+
+    def search(self, transport, rng):
+        data = {"ingredient": rng.choice(INGREDIENTS), "max_cooking_time": rng.randint(10, 120)}
+        return transport.request("POST", reverse("recipes:recipe_search"), data)[0]
+
+    def search_keywords(self, transport, rng):
+        data = {"keywords": " ".join(rng.sample(INGREDIENTS, 2))}
+        return transport.request("POST", reverse("recipes:recipe_search"), data)[0]
+
+    def api_list(self, transport, rng):
+        return transport.request("GET", reverse("recipes:api_recipe_list"))[0]
+
+    def api_detail(self, transport, rng):
+        pk = rng.choice(self.recipe_ids)
+        return transport.request("GET", reverse("recipes:api_recipe_detail", args=[pk]))[0]
+
+    def api_search(self, transport, rng):
+        data = {"ingredient": rng.choice(INGREDIENTS), "max_cooking_time": rng.randint(10, 120)}
+        return transport.request("GET", reverse("recipes:api_recipe_search"), data)[0]
+
+    def search_with_chart(self, chart_type):
+        def scenario(transport, rng):
+            data = {"max_cooking_time": rng.randint(10, 120), "chart_type": chart_type}
+            status, body = transport.request("POST", reverse("recipes:recipe_search"), data)
+            match = _CHART_URL_RE.search(body.decode())
+            if status != 200 or match is None:
+                # no results, or the chart queue was full
+                return status
+            for _ in range(CHART_POLLS):
+                status, _ = transport.request("GET", match.group(1))
+                if status != 202:
+                    break
+            return status
+
+        return scenario
+
+    def add(self, transport, rng):
+        data = {
+            "name": f"{ADDED_PREFIX} {rng.randrange(10**9)}",
+            "description": "Mix everything and bake.",
+            "ingredients": ",".join(rng.sample(INGREDIENTS, rng.randint(2, 10))),
+            "cooking_time": rng.randint(5, 90),
+        }
+        if self.category_id:
+            data["category"] = self.category_id
+        status = transport.request("POST", reverse("recipes:recipe_add"), data)[0]
+        # a redirect to the new recipe is success
+        return 200 if status == 302 else status
+
+
+def run_scenario(scenario, transport, requests, concurrency=1, warmup=2, seed=0):
+    """
+    Run `scenario` `requests` times; return latency stats plus errors,
+    throughput (requests per second over the wall-clock time) and the
+    server's mean queries per HTTP request.
+    """
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        scenario(transport, rng)
+
+    rngs = [random.Random(seed + n + 1) for n in range(requests)]
+    errors = []
+
+    def one(n):
+        started = time.perf_counter()
+        try:
+            status = scenario(transport, rngs[n])
+        except Exception as exc:
+            status = type(exc).__name__
+        if status != 200:
+            errors.append(status)
+        return (time.perf_counter() - started) * 1000
+
+    queries_before, responses_before = transport.server_queries.totals()
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = list(pool.map(one, range(requests)))
+    else:
+        timings = [one(n) for n in range(requests)]
+    elapsed = time.perf_counter() - started
+
+    stats = latency_stats(timings)
+    stats["errors"] = len(errors)
+    if errors:
+        stats["error_statuses"] = sorted({str(status) for status in errors})
+    stats["throughput_rps"] = round(requests / elapsed, 2) if elapsed else 0.0
+    queries, responses = transport.server_queries.totals()
+    if responses > responses_before:
+        stats["queries_per_request"] = round((queries - queries_before) / (responses - responses_before), 2)
+    return stats
+
+
+def bench_user():
+    user, created = User.objects.get_or_create(username=BENCH_USERNAME)
+    if created:
+        user.set_unusable_password()
+        user.save()
+    return user
+
+
+def remove_added_recipes():
+    return Recipe.objects.filter(name__startswith=ADDED_PREFIX).delete()[1].get("recipes.Recipe", 0)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,61 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+
+from recipes.images import read_source, render_derivatives, save_derivatives
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Generate responsive image derivatives for existing recipe pictures."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--force", action="store_true", help="Regenerate recipes that already have derivatives.")
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        # the shared placeholder (Recipe.pic's default) is served as it is,
+        # not rendered again for every recipe that still uses it
+        default_pic = Recipe._meta.get_field("pic").get_default()
+        recipes = Recipe.objects.exclude(pic__in=["", default_pic]).order_by("pk")
+        if not options["force"]:
+            recipes = recipes.filter(renditions__isnull=True)
+
+        self.done = self.skipped = 0
+        pending = {}
+
+        # resizing/encoding runs in the pool; files and rows are written here.
+        # spawn: never fork a process that holds DB connections and threads;
+        # the workers set Django up to import recipes.images
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+        ) as executor:
+            for recipe in recipes.iterator():
+                data = read_source(recipe.pic)
+                if data is None:
+                    self.skipped += 1
+                    continue
+                future = executor.submit(render_derivatives, data)
+                pending[future] = (recipe, hashlib.sha256(data).hexdigest())
+
+                # keep a bounded number of source images in flight
+                if len(pending) >= workers * 2:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self.save(finished, pending)
+
+            self.save(list(pending), pending)
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {self.done} recipes, {self.skipped} skipped (missing file)."))
+
+    def save(self, futures, pending):
+        for future in futures:
+            recipe, digest = pending.pop(future)
+            derivatives = future.result()
+            save_derivatives(recipe, derivatives, digest)
+            self.done += 1
+            self.stdout.write(f"{recipe.pic.name}: {len(derivatives)} derivatives")
@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from recipes.changes import log_reindexed
+from recipes.ingredients import index_recipes
+from recipes.models import Recipe
+from recipes.similar import rebuild_similar
+from recipes.stats import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = "Populate the normalized ingredient index from Recipe.ingredients."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for rebuild_similar.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_pk = 0
+        total = 0
+
+        while True:
+            rows = list(
+                Recipe.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", "ingredients")[:batch_size]
+            )
+            if not rows:
+                break
+
+            index_recipes(rows)
+
+            last_pk = rows[-1][0]
+            total += len(rows)
+            self.stdout.write(f"Indexed {total} recipes")
+
+        # index_recipes writes the links without signals: recount the
+        # ingredient statistics, recompute the similar lists and have every
+        # process rebuild its autocomplete and pantry indexes
+        reconcile_stats()
+        rebuild_similar(workers=options["workers"], progress=lambda done, count: self.stdout.write(f"Similar recipes: {done} of {count}"))
+        log_reindexed()
+        self.stdout.write(self.style.SUCCESS(f"Done: {total} recipes indexed."))
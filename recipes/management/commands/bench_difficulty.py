@@ -0,0 +1,44 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from recipes.difficulty import classify_difficulties
+from recipes.models import Recipe
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = "Compare the vectorized difficulty classifier with Recipe.calculate_difficulty()."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        rng = np.random.default_rng(0)
+        times = rng.integers(1, 120, rows)
+        counts = rng.integers(1, 15, rows)
+
+        # unsaved instances: measures the per-object classification, not the ORM
+        recipes = [
+            Recipe(cooking_time=int(t), ingredients=",".join(["x"] * int(c)))
+            for t, c in zip(times, counts)
+        ]
+        loop, loop_s = timed(lambda: [recipe.calculate_difficulty() for recipe in recipes])
+        vectorized, vec_s = timed(lambda: classify_difficulties(times, counts))
+
+        assert list(vectorized) == loop
+        self.stdout.write(json.dumps({
+            "rows": rows,
+            "per_object_s": round(loop_s, 3),
+            "vectorized_s": round(vec_s, 3),
+            "speedup": round(loop_s / vec_s, 1),
+            "vectorized_rows_per_s": int(rows / vec_s),
+        }, indent=2))
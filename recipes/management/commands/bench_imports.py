@@ -0,0 +1,42 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipes.startup import import_times
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the application in a fresh interpreter under python -X importtime "
+        "and print its cold start time, peak RSS and the slowest imports as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--module", default="recipe_project.wsgi", help="Application module to import.")
+        parser.add_argument("--top", type=int, default=15, help="Packages and modules to list.")
+
+    def handle(self, *args, **options):
+        times, cold_start = import_times(options["module"])
+
+        # self time summed per top-level package adds up to the whole import
+        packages = {}
+        for name, self_us, _ in times:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0) + self_us
+        slowest = sorted(times, key=lambda item: item[1], reverse=True)[: options["top"]]
+
+        report = {
+            "module": options["module"],
+            "cold_start": cold_start,
+            "imports": len(times),
+            "import_ms": round(sum(self_us for _, self_us, _ in times) / 1000, 1),
+            "packages_ms": {
+                package: round(self_us / 1000, 1)
+                for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[: options["top"]]
+            },
+            "slowest_modules": [
+                {"module": name, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cumulative_us / 1000, 1)}
+                for name, self_us, cumulative_us in slowest
+            ],
+        }
+        self.stdout.write(json.dumps(report, indent=2))
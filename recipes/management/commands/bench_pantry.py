@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from recipes.bench import measure, seeded_recipes
+from recipes.models import RecipeIngredient
+from recipes.pantry import build_pantry_index, parse_pantry
+
+DEFAULT_PANTRIES = [
+    "eggs, milk, flour, butter, sugar",
+    "garlic, onion, tomato, olive oil, pasta, basil, parmesan, salt, pepper, chicken",
+]
+
+
+def grouped_matches(ingredient_ids, max_missing, limit):
+    """The same matches as one GROUP BY over the ingredient index (baseline)."""
+    qs = (
+        RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids)
+        .values("recipe_id")
+        .annotate(hits=Count("pk"), size=F("recipe__ingredient_count"))
+        .filter(size__lte=F("hits") + max_missing)
+        .order_by(F("size") - F("hits"), "recipe_id")
+    )
+    return [row["recipe_id"] for row in qs[:limit]]
+
+
+class Command(BaseCommand):
+    help = "Time pantry search with the in-memory bitset index against a GROUP BY on a seeded dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=100_000, help="Synthetic recipes to add (rolled back afterwards).")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--max-missing", type=int, default=2)
+        parser.add_argument("--limit", type=int, default=1000)
+        parser.add_argument("--pantry", action="append", dest="pantries")
+
+    def handle(self, *args, **options):
+        pantries = options["pantries"] or DEFAULT_PANTRIES
+        max_missing, limit = options["max_missing"], options["limit"]
+        report = {"recipes_seeded": options["seed"], "pantries": {}}
+
+        with seeded_recipes(options["seed"]):
+            started = time.perf_counter()
+            index = build_pantry_index()
+            report["index"] = {
+                "recipes": len(index),
+                "build_s": round(time.perf_counter() - started, 2),
+                "bytes": index.nbytes(),
+            }
+            for pantry in pantries:
+                ingredient_ids = parse_pantry(pantry)
+                counts, _ = index.match(ingredient_ids, max_missing, limit)
+                report["pantries"][pantry] = {
+                    "matches_by_missing": counts,
+                    "bitsets": measure(lambda: index.match(ingredient_ids, max_missing, limit), repeat=options["repeat"]),
+                    "group_by": measure(lambda: grouped_matches(ingredient_ids, max_missing, limit), repeat=3),
+                }
+
+        self.stdout.write(json.dumps(report, indent=2))
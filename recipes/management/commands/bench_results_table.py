@@ -0,0 +1,57 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from recipes.bench import seeded_recipes
+from recipes.models import Recipe
+from recipes.tables import render_results_table, result_rows
+
+
+def pandas_results_table(qs):
+    """The DataFrame/to_html path recipe_search used before recipes/tables.py."""
+    import pandas as pd
+
+    df = pd.DataFrame(list(qs.values("id", "name", "cooking_time", "difficulty", "ingredients")))
+    df["name"] = df.apply(
+        lambda row: f'<a class="recipe-link" href="{reverse("recipes:recipe_detail", args=[row["id"]])}">{row["name"]}</a>',
+        axis=1,
+    )
+    df["ingredients"] = df["ingredients"].fillna("").apply(lambda x: x if len(x) <= 80 else x[:77] + "...")
+    df = df.drop(columns=["id"])
+    return df.to_html(classes="recipe-search-table", index=False, escape=False)
+
+
+def profile(fn):
+    # timed without tracemalloc, which slows allocation-heavy code several-fold
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ms": round(elapsed * 1000, 1), "peak_mib": round(peak / 2**20, 1)}
+
+
+class Command(BaseCommand):
+    help = "Compare the streaming results table with the old pandas to_html path."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+
+    def handle(self, *args, **options):
+        import pandas  # noqa: F401  keep the one-off import cost out of the timings
+
+        report = {}
+        for size in options["sizes"]:
+            with seeded_recipes(size):
+                qs = Recipe.objects.order_by("name")
+                report[size] = {
+                    "pandas": profile(lambda: pandas_results_table(qs)),
+                    "streaming": profile(lambda: render_results_table(result_rows(qs))),
+                }
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from recipes.bench import measure, seeded_recipes
+from recipes.search import LikeSearchBackend, get_search_backend
+
+DEFAULT_QUERIES = ["tomato", "garlic soup", "creamy chicken pasta", "baked lemon"]
+
+
+class Command(BaseCommand):
+    help = "Compare ranked full-text search with LIKE scans on a seeded dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=100_000, help="Synthetic recipes to add (rolled back afterwards).")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--query", action="append", dest="queries")
+
+    def handle(self, *args, **options):
+        queries = options["queries"] or DEFAULT_QUERIES
+        backends = {"like": LikeSearchBackend(), "fulltext": get_search_backend()}
+        report = {"recipes_seeded": options["seed"], "backend": type(backends["fulltext"]).__name__, "queries": {}}
+
+        with seeded_recipes(options["seed"]):
+            for query in queries:
+                report["queries"][query] = {
+                    label: measure(lambda: backend.search(query, limit=options["limit"]), repeat=options["repeat"])
+                    for label, backend in backends.items()
+                }
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,99 @@
+import json
+import logging
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.bench import memory_kib, peak_rss_kib, seeded_recipes, with_children
+from recipes.loadtest import (
+    ClientTransport,
+    HTTPTransport,
+    Scenarios,
+    bench_user,
+    git_revision,
+    remove_added_recipes,
+    run_scenario,
+)
+from recipes.models import Recipe
+from recipes.startup import cold_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the recipe views end to end and print p50/p95/p99 latency, "
+        "throughput, queries per request, cold start time and memory use as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", help="Base URL of a running server (e.g. gunicorn). Default: in-process test client.")
+        parser.add_argument("--scenario", action="append", dest="scenarios", help="Run only these (repeatable).")
+        parser.add_argument("--requests", type=int, default=50, help="Measured requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--concurrency", type=int, default=1, help="Parallel requests (--url only).")
+        parser.add_argument("--seed", type=int, default=0, help="Synthetic recipes to add first (test client only, rolled back afterwards).")
+        parser.add_argument("--pid", type=int, action="append", default=[], help="Server process to report memory use for, with its children (--url only, repeatable).")
+        parser.add_argument("--output", help="Write the JSON report here as well.")
+
+    def handle(self, *args, **options):
+        live = bool(options["url"])
+        if options["verbosity"] < 2:
+            # one log line per request would drown the report
+            logging.getLogger("recipes.timing").setLevel(logging.WARNING)
+        if not live and options["concurrency"] > 1:
+            raise CommandError("--concurrency needs --url; the test client runs one request at a time.")
+        if live and options["seed"]:
+            raise CommandError("--seed is test client only; use seed_recipes for a server.")
+
+        # in-process runs are rolled back, including recipes made by "add"
+        with seeded_recipes(options["seed"]) if not live else nullcontext():
+            report = self.run(options, live)
+        if live:
+            report["added_recipes_removed"] = remove_added_recipes()
+
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+
+    def run(self, options, live):
+        recipe_ids = list(Recipe.objects.order_by("pk").values_list("pk", flat=True)[:10_000])
+        if not recipe_ids:
+            raise CommandError("No recipes to benchmark; run seed_recipes or pass --seed.")
+        user = bench_user()
+        transport = HTTPTransport(options["url"], user) if live else ClientTransport(user)
+        scenarios = Scenarios(recipe_ids, Recipe.objects.filter(pk=recipe_ids[0]).values_list("category_id", flat=True)[0])
+
+        selected = scenarios.all()
+        if options["scenarios"]:
+            unknown = set(options["scenarios"]) - set(selected)
+            if unknown:
+                raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}. Choose from {', '.join(selected)}.")
+            selected = {name: selected[name] for name in options["scenarios"]}
+
+        report = {
+            "commit": git_revision(),
+            "target": options["url"] or "test-client",
+            "recipes": Recipe.objects.count(),
+            "requests_per_scenario": options["requests"],
+            "concurrency": options["concurrency"],
+            "session_engine": settings.SESSION_ENGINE,
+            # a new process importing the application, as a worker does at boot
+            "cold_start": cold_start(),
+            "scenarios": {},
+        }
+        started = time.perf_counter()
+        for name, scenario in selected.items():
+            self.stderr.write(f"{name}...")
+            report["scenarios"][name] = run_scenario(
+                scenario, transport, options["requests"], options["concurrency"], options["warmup"]
+            )
+        report["wall_s"] = round(time.perf_counter() - started, 2)
+        if live:
+            pids = [child for pid in options["pid"] for child in with_children(pid)]
+            report["memory_kib"] = {pid: memory_kib(pid) for pid in pids}
+        else:
+            report["peak_rss_kib"] = peak_rss_kib()
+        return report
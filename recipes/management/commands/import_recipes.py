@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.importer import RecipeImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Stream recipes from a CSV or JSON Lines file into the database in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Default: from the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--images", help="Directory with the files named in the 'image' column.")
+        parser.add_argument("--resume", action="store_true", help="Continue after the last committed batch.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def report(importer):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{importer.created} created, {importer.skipped} skipped, "
+                f"{importer.error_count} errors ({importer.created / elapsed:.0f} rows/s)"
+            )
+
+        importer = RecipeImporter(
+            batch_size=options["batch_size"],
+            image_dir=options["images"],
+            progress_path=f"{options['path']}.progress",
+            on_batch=report,
+        )
+        importer.run(read_rows(options["path"], options["format"]), resume=options["resume"])
+
+        for line, message in importer.errors[:20]:
+            self.stderr.write(f"line {line}: {message}")
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s: {importer.created} created, {importer.skipped} already present, "
+            f"{importer.error_count} rejected ({importer.created / max(elapsed, 1e-9):.0f} rows/s)."
+        ))
@@ -0,0 +1,25 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.similar import rebuild_similar
+
+
+class Command(BaseCommand):
+    help = "Recompute every recipe's similar recipes from the ingredient index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--slice-size", type=int, default=2000, help="Recipes per worker task.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = rebuild_similar(
+            workers=options["workers"],
+            slice_size=options["slice_size"],
+            progress=lambda done, total: self.stdout.write(f"{done} of {total} recipes"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total} recipes in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from recipes.detail_cache import invalidate_all_recipe_details
+from recipes.difficulty import recompute_precomputed
+from recipes.models import Recipe
+from recipes.stats import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute parsed ingredients and difficulty for every recipe (run after changing the rules)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--all", action="store_true", help="Write every row, not only rows whose values changed.")
+
+    def handle(self, *args, **options):
+        scanned, updated = recompute_precomputed(
+            Recipe, batch_size=options["batch_size"], only_changed=not options["all"]
+        )
+        if updated:
+            # bulk_update skips post_save, so cached detail pages are dropped here
+            invalidate_all_recipe_details()
+            # and the statistics count recipes per difficulty
+            reconcile_stats()
+        self.stdout.write(self.style.SUCCESS(f"Done: {updated} of {scanned} recipes updated."))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.stats import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = "Recount the statistics summary tables from the recipes and fix rows that drifted (run periodically)."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        fixed = reconcile_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {fixed['categories']} category and {fixed['ingredients']} ingredient rows fixed"
+            f" in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.seed import insert_recipes, seed_categories
+
+
+class Command(BaseCommand):
+    help = "Fill the database with realistic synthetic recipes, categories and ingredients."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0, help="Same seed, same recipes.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        category_ids = seed_categories()
+
+        def report(inserted):
+            self.stdout.write(f"{inserted} / {options['count']} recipes")
+
+        inserted = insert_recipes(
+            options["count"],
+            seed=options["seed"],
+            category_ids=category_ids,
+            batch_size=options["batch_size"],
+            on_batch=report,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {inserted} recipes in {len(category_ids)} categories ({time.perf_counter() - started:.1f}s)."
+        ))
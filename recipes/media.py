@@ -0,0 +1,165 @@
+"""
+Uploaded media (MEDIA_ROOT) served by the WhiteNoise middleware, in
+production as well as with DEBUG.
+
+MediaWhiteNoiseMiddleware replaces WhiteNoiseMiddleware in MIDDLEWARE and
+serves STATIC_ROOT as before. WhiteNoise indexes static files once at
+start-up, but pictures are uploaded while the site runs, so media files
+are looked up on request. Each worker keeps the RECIPE_MEDIA_FILES most
+recently served ones and checks them with one stat() per request, so a
+replaced or deleted file is noticed at once.
+
+What WhiteNoise brings for both:
+- GET/HEAD only. Conditional requests (If-None-Match, If-Modified-Since)
+  get a 304.
+- A single Range is answered with 206.
+- The open file is handed to the server: gunicorn sends it with
+  sendfile(), without copying it through Python.
+
+Added here:
+- Byte ranges expose their file descriptor, so gunicorn sendfile()s those
+  too. WhiteNoise's SlicedFile is read through Python.
+- If-Range is honoured: when the file changed since the client's copy, the
+  whole file is sent rather than a range of the new one.
+- Media ETags are strong: a hash of the content, computed once per file
+  and worker.
+- Responsive derivatives are named after the hash of their source picture
+  (recipes/images.py). They are cached for good:
+  "Cache-Control: max-age=315360000, public, immutable".
+- Other media files are cached for RECIPE_MEDIA_MAX_AGE seconds, then
+  revalidated.
+"""
+import hashlib
+import os
+import stat
+import threading
+from collections import OrderedDict
+from email.utils import parsedate
+from urllib.parse import urlparse
+
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseFileResponse, WhiteNoiseMiddleware
+from whitenoise.responders import SlicedFile
+from whitenoise.string_utils import ensure_leading_trailing_slash
+
+from .images import DERIVATIVE_NAME_RE
+
+MEDIA_MAX_AGE = 3600
+MEDIA_FILES = 2048
+
+
+class RangeFile:
+    """
+    A SlicedFile that also has fileno(). gunicorn then sendfile()s
+    Content-Length bytes from the current offset, where SlicedFile has
+    already seeked to.
+    """
+
+    def __init__(self, sliced):
+        self.sliced = sliced
+
+    def read(self, size=-1):
+        return self.sliced.read(size)
+
+    def fileno(self):
+        return self.sliced.fileobj.fileno()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # socket.sendfile() rewinds the file when it's done
+        return self.sliced.fileobj.seek(offset, whence)
+
+    def close(self):
+        self.sliced.close()
+
+
+def content_etag(path):
+    with open(path, "rb") as f:
+        return '"%s"' % hashlib.file_digest(f, "sha256").hexdigest()[:32]
+
+
+class MediaWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.media_prefix = ensure_leading_trailing_slash(urlparse(settings.MEDIA_URL or "").path)
+        self.media_root = os.path.abspath(settings.MEDIA_ROOT).rstrip(os.path.sep) + os.path.sep
+        self.media_max_age = getattr(settings, "RECIPE_MEDIA_MAX_AGE", MEDIA_MAX_AGE)
+        self.media_files_size = getattr(settings, "RECIPE_MEDIA_FILES", MEDIA_FILES)
+        # url -> ((mtime, size), StaticFile), least recently served first
+        self.media_files = OrderedDict()
+        self.media_lock = threading.Lock()
+
+    def __call__(self, request):
+        if self.is_media(request.path_info):
+            media_file = self.find_media_file(request.path_info)
+            if media_file is not None:
+                return self.serve(media_file, request)
+            # unknown: Django's 404
+            return self.get_response(request)
+        return super().__call__(request)
+
+    def find_media_file(self, url):
+        if not self.url_is_canonical(url):
+            return None
+        path = os.path.join(self.media_root, url[len(self.media_prefix):])
+        if not path.startswith(self.media_root):
+            return None
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            stat_result = None
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            with self.media_lock:
+                self.media_files.pop(url, None)
+            return None
+
+        version = (stat_result.st_mtime_ns, stat_result.st_size)
+        with self.media_lock:
+            cached = self.media_files.get(url)
+            if cached is not None and cached[0] == version:
+                self.media_files.move_to_end(url)
+                return cached[1]
+        media_file = self.get_static_file(path, url, stat_cache={path: stat_result})
+        with self.media_lock:
+            self.media_files[url] = (version, media_file)
+            self.media_files.move_to_end(url)
+            while len(self.media_files) > self.media_files_size:
+                self.media_files.popitem(last=False)
+        return media_file
+
+    def is_media(self, url):
+        return self.media_prefix != "/" and url.startswith(self.media_prefix)
+
+    def immutable_file_test(self, path, url):
+        if self.is_media(url):
+            return bool(DERIVATIVE_NAME_RE.search(url))
+        return super().immutable_file_test(path, url)
+
+    def add_cache_headers(self, headers, path, url):
+        if not self.is_media(url):
+            return super().add_cache_headers(headers, path, url)
+        if self.immutable_file_test(path, url):
+            headers["Cache-Control"] = f"max-age={self.FOREVER}, public, immutable"
+        else:
+            headers["Cache-Control"] = f"max-age={self.media_max_age}, public"
+        headers["ETag"] = content_etag(path)
+
+    @staticmethod
+    def range_still_valid(static_file, if_range):
+        # If-Range needs a strong match: a weak ETag never matches
+        if if_range.startswith('"'):
+            return if_range == static_file.etag
+        return static_file.last_modified is not None and parsedate(if_range) == static_file.last_modified
+
+    def serve(self, static_file, request):
+        request_headers = request.META
+        if_range = request_headers.get("HTTP_IF_RANGE")
+        if if_range and "HTTP_RANGE" in request_headers and not self.range_still_valid(static_file, if_range):
+            # changed since the client's copy: send all of it
+            request_headers = {key: value for key, value in request_headers.items() if key != "HTTP_RANGE"}
+        response = static_file.get_response(request.method, request_headers)
+        file = RangeFile(response.file) if isinstance(response.file, SlicedFile) else response.file
+        http_response = WhiteNoiseFileResponse(file or (), status=int(response.status))
+        del http_response["content-type"]
+        for key, value in response.headers:
+            http_response[key] = value
+        return http_response
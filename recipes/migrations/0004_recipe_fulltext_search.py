@@ -0,0 +1,76 @@
+# Full-text search index; the SQL differs per backend, see recipes/search.py.
+# Copied here as it was when this migration was written, so later changes
+# to recipes/search.py or RECIPE_SEARCH_BACKEND don't change what it does.
+
+from django.db import migrations
+
+SQLITE_INSTALL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5(
+        name, ingredients, description,
+        content='recipes_recipe', content_rowid='id',
+        tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_ai AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, ingredients, description)
+        VALUES (new.id, new.name, new.ingredients, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_ad AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, ingredients, description)
+        VALUES ('delete', old.id, old.name, old.ingredients, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS recipes_recipe_fts_au AFTER UPDATE OF name, ingredients, description ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, ingredients, description)
+        VALUES ('delete', old.id, old.name, old.ingredients, old.description);
+        INSERT INTO recipes_recipe_fts(rowid, name, ingredients, description)
+        VALUES (new.id, new.name, new.ingredients, new.description);
+    END""",
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_ai",
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_ad",
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_au",
+    "DROP TABLE IF EXISTS recipes_recipe_fts",
+]
+
+# a generated column needs no triggers: Postgres recomputes it on write
+POSTGRES_INSTALL = [
+    """ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(ingredients, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS recipes_recipe_search_gin ON recipes_recipe USING GIN (search_vector)",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS recipes_recipe_search_gin",
+    "ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector",
+]
+
+# other databases search with LIKE and need nothing
+INSTALL = {'sqlite': SQLITE_INSTALL, 'postgresql': POSTGRES_INSTALL}
+UNINSTALL = {'sqlite': SQLITE_UNINSTALL, 'postgresql': POSTGRES_UNINSTALL}
+
+
+def install(apps, schema_editor):
+    for sql in INSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def uninstall(apps, schema_editor):
+    for sql in UNINSTALL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredient_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
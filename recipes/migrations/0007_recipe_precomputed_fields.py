@@ -0,0 +1,62 @@
+# Generated by Django 4.2.26 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+# The rules as they were when this migration was written (recipes/difficulty.py),
+# copied so later changes to them don't change what this migration does.
+RULES = (
+    ('Easy', 10, 3),
+    ('Medium', 20, 6),
+    ('Hard', 30, 10),
+)
+
+
+def classify(cooking_time, num_ingredients):
+    for difficulty, max_time, max_ingredients in RULES:
+        if cooking_time < max_time and num_ingredients <= max_ingredients:
+            return difficulty
+    return 'Very Hard'
+
+
+def populate(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    last_pk = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'ingredients', 'cooking_time')[:1000]
+        )
+        if not batch:
+            break
+        for recipe in batch:
+            recipe.ingredient_list = [i.strip() for i in (recipe.ingredients or '').split(',') if i.strip()]
+            recipe.ingredient_count = len(recipe.ingredient_list)
+            recipe.difficulty = classify(recipe.cooking_time, recipe.ingredient_count)
+        Recipe.objects.bulk_update(batch, ['ingredient_list', 'ingredient_count', 'difficulty'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipeimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_list',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='difficulty',
+            field=models.CharField(blank=True, choices=[('Easy', 'Easy'), ('Medium', 'Medium'), ('Hard', 'Hard'), ('Very Hard', 'Very Hard')], db_index=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 03:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_precomputed_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='external_id',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.26 on 2026-10-18 05:37
+
+from django.db import migrations, models
+from django.db.models import Case, Count, Sum, Value, When
+import django.db.models.deletion
+
+# The cooking-time buckets as they were when this migration was written
+# (recipes/facets.py), copied so later changes to them don't change what
+# this migration does: (key, upper bound in minutes).
+TIME_BUCKETS = (
+    ('quick', 15),
+    ('short', 30),
+    ('medium', 60),
+    ('long', 120),
+    ('longer', None),
+)
+
+
+def populate(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    CategoryStat = apps.get_model('recipes', 'CategoryStat')
+    IngredientStat = apps.get_model('recipes', 'IngredientStat')
+
+    bucket = Case(
+        *(When(cooking_time__lte=high, then=Value(key)) for key, high in TIME_BUCKETS if high is not None),
+        default=Value(TIME_BUCKETS[-1][0]),
+    )
+    rows = (
+        Recipe.objects.annotate(bucket=bucket)
+        .values_list('category_id', 'difficulty', 'bucket')
+        .annotate(count=Count('pk'), minutes=Sum('cooking_time'))
+        .order_by()
+    )
+    CategoryStat.objects.bulk_create([
+        CategoryStat(category_id=category_id, difficulty=difficulty, time_bucket=key, recipe_count=count, total_cooking_time=minutes)
+        for category_id, difficulty, key, count, minutes in rows
+    ], batch_size=1000)
+    counts = RecipeIngredient.objects.values_list('ingredient_id').annotate(count=Count('pk')).order_by()
+    IngredientStat.objects.bulk_create(
+        [IngredientStat(ingredient_id=pk, recipe_count=count) for pk, count in counts], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0001_initial'),
+        ('recipes', '0010_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngredientStat',
+            fields=[
+                ('ingredient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='recipes.ingredient')),
+                ('recipe_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-recipe_count', 'ingredient'], name='ingredientstat_count_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CategoryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('difficulty', models.CharField(blank=True, max_length=20)),
+                ('time_bucket', models.CharField(max_length=10)),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('total_cooking_time', models.BigIntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='categories.category')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='categorystat',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('category', 'difficulty', 'time_bucket'), name='unique_category_stat'),
+        ),
+        migrations.AddConstraint(
+            model_name='categorystat',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('difficulty', 'time_bucket'), name='unique_uncategorized_stat'),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
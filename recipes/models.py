@@ -1,6 +1,14 @@
 from django.db import models
 from django.urls import reverse
 
+from .difficulty import (
+    DIFFICULTY_CHOICES,
+    PRECOMPUTED_FIELDS,
+    classify_difficulty,
+    precomputed_values,
+    split_ingredients,
+)
+
 
 class Recipe(models.Model):
     name = models.CharField(max_length=120)
@@ -11,7 +19,18 @@ class Recipe(models.Model):
     cooking_time = models.PositiveIntegerField(
         help_text="Cooking time in minutes"
     )
-    difficulty = models.CharField(max_length=20, blank=True)
+    # stable key from import_recipes, so re-running an import skips existing rows
+    external_id = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    # filled in by save() from ingredients/cooking_time, see recipes/difficulty.py
+    difficulty = models.CharField(
+        max_length=20, blank=True, editable=False, db_index=True, choices=DIFFICULTY_CHOICES
+    )
+    ingredient_list = models.JSONField(default=list, blank=True, editable=False)
+    ingredient_count = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Last-Modified of the detail page and part of its cache key; the
+    # latest one versions the text-search match cache
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     category = models.ForeignKey(
         'categories.Category',
@@ -26,22 +45,167 @@ class Recipe(models.Model):
         default='no_picture.jpg'
     )
 
+    # normalized index kept in sync with `ingredients` (see recipes/signals.py)
+    ingredient_index = models.ManyToManyField(
+        'Ingredient',
+        through='RecipeIngredient',
+        related_name='recipes',
+        blank=True,
+    )
+
+    class Meta:
+        indexes = [
+            # keyset pagination order, see recipes/pagination.py
+            models.Index(fields=["name", "id"], name="recipe_name_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
     def get_absolute_url(self):
         return reverse('recipes:recipe_detail', kwargs={'pk': self.pk})
 
+    def save(self, *args, **kwargs):
+        self.update_precomputed()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"ingredients", "cooking_time"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, *PRECOMPUTED_FIELDS}
+        super().save(*args, **kwargs)
+
+    def update_precomputed(self):
+        """Parse ingredients and classify difficulty once, at write time."""
+        for field, value in precomputed_values(self.ingredients, self.cooking_time).items():
+            setattr(self, field, value)
+
     def calculate_difficulty(self):
-    
-        ingredients_list = [i.strip() for i in self.ingredients.split(',') if i.strip()]
-        num_ingredients = len(ingredients_list)
-
-        if self.cooking_time < 10 and num_ingredients < 4:
-            return "Easy"
-        elif self.cooking_time < 20 and num_ingredients <= 6:
-            return "Medium"
-        elif self.cooking_time < 30 and num_ingredients <= 10:
-            return "Hard"
-        else:
-            return "Very Hard"
+        return classify_difficulty(self.cooking_time, len(split_ingredients(self.ingredients)))
+
+
+class Ingredient(models.Model):
+    """
+    Normalized ingredient name (lowercased, single-spaced).
+    Filled from Recipe.ingredients, see recipes/ingredients.py.
+    """
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeIngredient(models.Model):
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='ingredient_links')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='recipe_links')
+    position = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ["recipe", "position"]
+        constraints = [
+            models.UniqueConstraint(fields=["recipe", "ingredient"], name="unique_recipe_ingredient"),
+        ]
+        indexes = [
+            # reverse lookup used by search: ingredient -> recipes
+            models.Index(fields=["ingredient", "recipe"], name="recipeingr_ingr_recipe_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.ingredient_id}"
+
+
+class RecipeImage(models.Model):
+    """
+    Resized copy of Recipe.pic in one format, see recipes/images.py.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='renditions')
+    image = models.ImageField(upload_to='recipes/derivatives', max_length=255)
+    format = models.CharField(max_length=10)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["recipe", "format", "width"]
+        constraints = [
+            models.UniqueConstraint(fields=["recipe", "format", "width"], name="unique_recipe_rendition"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.width}w {self.format}"
+
+
+class SimilarRecipe(models.Model):
+    """
+    One of a recipe's most similar recipes by shared ingredients, see
+    recipes/similar.py.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["recipe", "similar"], name="unique_similar_recipe"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} ~ {self.similar_id}: {self.score:.2f}"
+
+
+class RecipeChange(models.Model):
+    """
+    A committed change to a recipe's name or ingredients, replayed by each
+    process's in-memory indexes; see recipes/changes.py.
+    """
+    # not a foreign key: deletions are logged too
+    recipe_id = models.BigIntegerField()
+    # [name, ingredients] before and after; null for a created / deleted
+    # recipe, both null when the ingredient index was rewritten
+    old = models.JSONField(null=True)
+    new = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.pk}: recipe {self.recipe_id}"
+
+
+class CategoryStat(models.Model):
+    """
+    Recipes per (category, difficulty, cooking-time bucket), kept up to
+    date on every write; see recipes/stats.py.
+    """
+    category = models.ForeignKey('categories.Category', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    difficulty = models.CharField(max_length=20, blank=True)
+    time_bucket = models.CharField(max_length=10)
+    recipe_count = models.IntegerField(default=0)
+    total_cooking_time = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["category", "difficulty", "time_bucket"], name="unique_category_stat",
+                condition=models.Q(category__isnull=False),
+            ),
+            # NULLs are distinct in a unique index, so "no category" has its own
+            models.UniqueConstraint(
+                fields=["difficulty", "time_bucket"], name="unique_uncategorized_stat",
+                condition=models.Q(category__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id}/{self.difficulty or '-'}/{self.time_bucket}: {self.recipe_count}"
+
+
+class IngredientStat(models.Model):
+    """Number of recipes using an ingredient, see recipes/stats.py."""
+    ingredient = models.OneToOneField(Ingredient, on_delete=models.CASCADE, primary_key=True, related_name='stat')
+    recipe_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-recipe_count", "ingredient"], name="ingredientstat_count_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient_id}: {self.recipe_count}"
@@ -0,0 +1,127 @@
+"""
+Keyset (cursor) pagination ordered on (name, id).
+
+Instead of OFFSET, each page continues from the last (name, id) it showed,
+so page 1000 costs the same index range scan as page 1. Cursors are opaque
+URL-safe tokens; a tampered cursor can only move the window, never expose
+anything the queryset doesn't already allow.
+"""
+import base64
+import json
+from operator import attrgetter
+
+from django.db.models import Q
+
+AFTER = "a"
+BEFORE = "b"
+
+# exact counts above this are shown as "N+"
+COUNT_LIMIT = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, name, pk):
+    raw = json.dumps([direction, name, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        direction, name, pk = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(token) from exc
+    if direction not in (AFTER, BEFORE) or not isinstance(name, str) or not isinstance(pk, int):
+        raise InvalidCursor(token)
+    return direction, name, pk
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _window(qs, cursor, per_page):
+    """(direction, cursor name, queryset slice of up to per_page + 1 rows)"""
+    direction, name, pk = decode_cursor(cursor) if cursor else (AFTER, None, None)
+
+    if direction == AFTER:
+        qs = qs.order_by("name", "pk")
+        if name is not None:
+            qs = qs.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+    else:
+        qs = qs.order_by("-name", "-pk").filter(Q(name__lt=name) | Q(name=name, pk__lt=pk))
+    return direction, name, qs[: per_page + 1]
+
+
+def _page(rows, direction, name, per_page, key):
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == BEFORE:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage(rows)
+
+    first, last = key(rows[0]), key(rows[-1])
+    if direction == AFTER:
+        has_next, has_previous = has_more, name is not None
+    else:
+        has_next, has_previous = True, has_more
+
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(AFTER, *last) if has_next else None,
+        previous_cursor=encode_cursor(BEFORE, *first) if has_previous else None,
+    )
+
+
+def paginate_keyset(qs, cursor, per_page, key=attrgetter("name", "pk")):
+    """
+    Return one KeysetPage of `qs` ordered by (name, id).
+
+    cursor: token from a previous page (or None for the first page)
+    key: extracts (name, pk) from a row; pass one for values_list() querysets
+    """
+    direction, name, window = _window(qs, cursor, per_page)
+    return _page(list(window), direction, name, per_page, key)
+
+
+async def apaginate_keyset(qs, cursor, per_page, key=attrgetter("name", "pk")):
+    """paginate_keyset() for async views."""
+    direction, name, window = _window(qs, cursor, per_page)
+    return _page([row async for row in window], direction, name, per_page, key)
+
+
+def bounded_count(qs, limit=COUNT_LIMIT):
+    """
+    Count at most `limit` + 1 rows: (count, is_exact).
+    COUNT(*) over a LIMITed subquery stops early on large result sets.
+    """
+    count = qs.order_by()[: limit + 1].count()
+    return min(count, limit), count <= limit
+
+
+async def abounded_count(qs, limit=COUNT_LIMIT):
+    count = await qs.order_by()[: limit + 1].acount()
+    return min(count, limit), count <= limit
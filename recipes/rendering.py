@@ -0,0 +1,236 @@
+"""
+Chart rendering off the request thread.
+
+The search view only registers a chart job (its type and SQL-aggregated
+series, recipes/charts.py) and links to it; the chart itself is drawn by
+recipes.utils.draw_chart in a bounded process pool and stored in the chart
+cache (recipes/chart_cache.py) under its content key. The browser then
+loads it from recipes:chart, as PNG (queued with the search), SVG (drawn on
+first request) or the JSON series.
+
+Settings:
+    RECIPE_CHART_WORKERS      pool size; 0 renders synchronously in-process
+    RECIPE_CHART_QUEUE_DEPTH  max jobs queued or running per web worker
+    RECIPE_CHART_TIMEOUT      seconds before a job is given up on; the
+                              pool is replaced when one overruns
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .chart_cache import chart_key, get_chart_cache
+from .utils import draw_chart
+
+logger = logging.getLogger(__name__)
+
+JOB_PREFIX = "job:"
+
+# how long the chart view holds a request for a queued chart before answering 202
+POLL_WAIT = 1.0
+
+
+class TrackingContext:
+    """
+    The spawn context, keeping a handle to every process the pool starts
+    through it, so an overrunning one can be stopped.
+    """
+
+    def __init__(self):
+        self._context = multiprocessing.get_context("spawn")
+        self.processes = []
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def Process(self, *args, **kwargs):
+        process = self._context.Process(*args, **kwargs)
+        self.processes.append(process)
+        return process
+
+
+class ChartRenderer:
+    def __init__(self, cache, max_workers=2, max_pending=16, timeout=10.0):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._context = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            # spawn: never fork a web worker that holds DB connections and threads
+            self._context = TrackingContext()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+        return self._executor
+
+    def _expire(self):
+        now = time.monotonic()
+        overrun = False
+        for key, (future, started) in list(self._pending.items()):
+            if now - started > self.timeout:
+                logger.warning("Chart %s timed out after %.1fs", key, self.timeout)
+                del self._pending[key]
+                # a queued job just goes; a running one holds a pool process
+                overrun |= not future.cancel()
+        if overrun:
+            self._recycle()
+
+    def _recycle(self):
+        """
+        Replace the pool and kill its processes: a job can't be stopped on
+        its own once it runs. Jobs still in the old pool fail with it and
+        are queued again when their chart is next asked for.
+        """
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in self._context.processes:
+            if process.is_alive():
+                process.terminate()
+
+    def submit(self, key, chart_type, rows, fmt="png"):
+        """
+        Queue a chart unless it is already queued.
+        Returns False when the queue is full.
+        """
+        if self.max_workers == 0:
+            self._store(key, draw_chart(chart_type, rows, fmt))
+            return True
+
+        with self._lock:
+            self._expire()
+            if key in self._pending:
+                return True
+            if len(self._pending) >= self.max_pending:
+                return False
+            future = self.executor.submit(draw_chart, chart_type, rows, fmt)
+            self._pending[key] = (future, time.monotonic())
+        future.add_done_callback(lambda f: self._finish(key, f))
+        return True
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._pending.get(key, (None,))[0] is future:
+                del self._pending[key]
+        if future.cancelled():
+            return
+        try:
+            self._store(key, future.result())
+        except BrokenProcessPool:
+            logger.warning("Chart %s was dropped with its pool", key)
+        except Exception:
+            logger.exception("Chart %s failed to render", key)
+
+    def _store(self, key, image):
+        if image is not None:
+            self.cache.store.set(key, image)
+
+    def wait(self, key, timeout):
+        """
+        Block up to `timeout` seconds for a queued chart, then return its
+        image bytes (or None if it is still rendering or unknown here).
+        """
+        with self._lock:
+            entry = self._pending.get(key)
+        if entry is not None:
+            try:
+                entry[0].result(timeout=timeout)
+            except Exception:
+                # still rendering (TimeoutError) or failed; _finish logs failures
+                return None
+        return self.cache.store.get(key)
+
+    async def await_chart(self, key, timeout):
+        """
+        wait() for async views: awaits the render without holding a thread.
+        """
+        with self._lock:
+            entry = self._pending.get(key)
+        if entry is not None:
+            try:
+                # shield: a timeout here must not cancel the render itself
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(entry[0])), timeout)
+            except Exception:
+                return None
+        return await sync_to_async(self.cache.store.get, thread_sensitive=False)(key)
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._pending
+
+
+_renderer = None
+
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = ChartRenderer(
+            get_chart_cache(),
+            max_workers=getattr(settings, "RECIPE_CHART_WORKERS", 2),
+            max_pending=getattr(settings, "RECIPE_CHART_QUEUE_DEPTH", 16),
+            timeout=getattr(settings, "RECIPE_CHART_TIMEOUT", 10.0),
+        )
+    return _renderer
+
+
+@receiver(setting_changed)
+def reset_renderer(setting, **kwargs):
+    global _renderer
+    if setting.startswith("RECIPE_CHART"):
+        _renderer = None
+
+
+def image_key(key, fmt):
+    return f"{key}.{fmt}"
+
+
+def request_chart(chart_type, series):
+    """
+    Register a chart for `series` and queue its PNG. Returns the chart's
+    key, or None if the render queue is full.
+
+    The job spec is stored in the chart cache too, so a web worker that did
+    not queue the chart can still render it (or serve its series) when the
+    browser asks for it.
+    """
+    series = [tuple(point) for point in series]
+    key = chart_key(chart_type, series)
+    renderer = get_renderer()
+    # kept fresh even when the PNG is cached: the SVG and JSON need it
+    renderer.cache.store.set(JOB_PREFIX + key, (chart_type, series))
+    if renderer.cache.get(image_key(key, "png")) is None:
+        if not renderer.submit(image_key(key, "png"), chart_type, series):
+            return None
+    return key
+
+
+def chart_spec(key):
+    """(chart_type, series) of a registered chart, or None."""
+    return get_chart_cache().store.get(JOB_PREFIX + key)
+
+
+def resume_chart(key, fmt="png"):
+    """
+    Queue a chart from its stored job spec (used by the chart view).
+    Returns False if the spec is unknown or the queue is full.
+    """
+    spec = chart_spec(key)
+    if spec is None:
+        return False
+    chart_type, series = spec
+    return get_renderer().submit(image_key(key, fmt), chart_type, series, fmt)
@@ -0,0 +1,267 @@
+"""
+Ranked full-text search over recipe name, ingredients and description.
+
+The backend is picked from the database vendor (or settings.RECIPE_SEARCH_BACKEND):
+
+- SQLite: an external-content FTS5 table kept in sync with triggers, ranked by bm25().
+- PostgreSQL: a generated tsvector column with a GIN index, ranked by ts_rank_cd().
+- Anything else: LIKE scans ordered by name (also used as the benchmark baseline).
+
+Every backend returns recipe ids, best match first, limited to the top N.
+"""
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.models import Case, IntegerField, Max, Q, When
+from django.utils.module_loading import import_string
+
+from .models import Recipe, RecipeChange
+
+DEFAULT_LIMIT = 50
+# ids kept per text search in the match cache, see cached_matches()
+MATCH_LIMIT = 1000
+
+# column weights, in FTS column order: a hit in the name counts most
+NAME_WEIGHT = 10.0
+INGREDIENTS_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def get_search_limit():
+    return getattr(settings, "RECIPE_SEARCH_LIMIT", DEFAULT_LIMIT)
+
+
+def _restrict_sql(base_qs, column):
+    """
+    Turn an optional Recipe queryset into an extra `column IN (...)` clause so
+    the other search filters are applied inside the ranked query, before LIMIT.
+    """
+    if base_qs is None or not base_qs.query.where:
+        return "", []
+    sql, params = base_qs.order_by().values("pk").query.sql_with_params()
+    return f" AND {column} IN ({sql})", list(params)
+
+
+class LikeSearchBackend:
+    """
+    Unranked fallback: icontains on every text column, ordered by name.
+    """
+
+    def install(self, schema_editor):
+        pass
+
+    def uninstall(self, schema_editor):
+        pass
+
+    def search(self, text, base_qs=None, limit=None):
+        terms = tokenize(text)
+        if not terms:
+            return []
+        qs = base_qs if base_qs is not None else Recipe.objects.all()
+        for term in terms:
+            qs = qs.filter(
+                Q(name__icontains=term) | Q(ingredients__icontains=term) | Q(description__icontains=term)
+            )
+        qs = qs.order_by("name", "pk").values_list("pk", flat=True)
+        return list(qs[: limit or get_search_limit()])
+
+
+class SQLiteSearchBackend:
+    table = "recipes_recipe_fts"
+
+    def install(self, schema_editor):
+        """
+        Create the FTS table and sync triggers (idempotent).
+        Also run on post_migrate, because SQLite rebuilds recipes_recipe on
+        most ALTERs and the triggers are dropped together with the old table.
+        """
+        table = self.table
+        created = not self._exists(schema_editor.connection)
+        statements = [
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                name, ingredients, description,
+                content='recipes_recipe', content_rowid='id',
+                tokenize='porter unicode61'
+            )""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON recipes_recipe BEGIN
+                INSERT INTO {table}(rowid, name, ingredients, description)
+                VALUES (new.id, new.name, new.ingredients, new.description);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON recipes_recipe BEGIN
+                INSERT INTO {table}({table}, rowid, name, ingredients, description)
+                VALUES ('delete', old.id, old.name, old.ingredients, old.description);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF name, ingredients, description ON recipes_recipe BEGIN
+                INSERT INTO {table}({table}, rowid, name, ingredients, description)
+                VALUES ('delete', old.id, old.name, old.ingredients, old.description);
+                INSERT INTO {table}(rowid, name, ingredients, description)
+                VALUES (new.id, new.name, new.ingredients, new.description);
+            END""",
+        ]
+        if created:
+            statements.append(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    def uninstall(self, schema_editor):
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {self.table}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def _exists(self, conn):
+        return self.table in conn.introspection.table_names()
+
+    def match_expression(self, text):
+        # quote every token so user input can't inject FTS5 query syntax
+        return " ".join(f'"{token}"' for token in tokenize(text))
+
+    def search(self, text, base_qs=None, limit=None):
+        match = self.match_expression(text)
+        if not match:
+            return []
+        restrict, params = _restrict_sql(base_qs, "rowid")
+        sql = (
+            f"SELECT rowid FROM {self.table} "
+            f"WHERE {self.table} MATCH %s{restrict} "
+            f"ORDER BY bm25({self.table}, %s, %s, %s), rowid LIMIT %s"
+        )
+        params = [match, *params, NAME_WEIGHT, INGREDIENTS_WEIGHT, DESCRIPTION_WEIGHT, limit or get_search_limit()]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    column = "search_vector"
+    index = "recipes_recipe_search_gin"
+    config = "english"
+
+    def install(self, schema_editor):
+        # a generated column needs no triggers: Postgres recomputes it on write
+        schema_editor.execute(
+            f"""ALTER TABLE recipes_recipe ADD COLUMN IF NOT EXISTS {self.column} tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('{self.config}', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('{self.config}', coalesce(ingredients, '')), 'B') ||
+                setweight(to_tsvector('{self.config}', coalesce(description, '')), 'C')
+            ) STORED"""
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.index} ON recipes_recipe USING GIN ({self.column})"
+        )
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute(f"DROP INDEX IF EXISTS {self.index}")
+        schema_editor.execute(f"ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS {self.column}")
+
+    def search(self, text, base_qs=None, limit=None):
+        if not tokenize(text):
+            return []
+        restrict, params = _restrict_sql(base_qs, "id")
+        sql = (
+            f"SELECT id FROM recipes_recipe, websearch_to_tsquery('{self.config}', %s) query "
+            f"WHERE {self.column} @@ query{restrict} "
+            f"ORDER BY ts_rank_cd({self.column}, query) DESC, id LIMIT %s"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [text, *params, limit or get_search_limit()])
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_search_backend(vendor=None):
+    path = getattr(settings, "RECIPE_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(vendor or connection.vendor, LikeSearchBackend)()
+
+
+def search_recipes(text, base_qs=None, limit=None):
+    """
+    Ranked Recipe ids for a keyword query, restricted to `base_qs` if given.
+    """
+    return get_search_backend().search(text, base_qs=base_qs, limit=limit)
+
+
+def rank_order(ids):
+    """order_by() expression putting recipes in the order of `ids`."""
+    return Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)], output_field=IntegerField())
+
+
+def ranked_queryset(ids):
+    """
+    Recipe queryset for `ids`, keeping the relevance order of the list.
+    """
+    if not ids:
+        return Recipe.objects.none()
+    return Recipe.objects.filter(pk__in=ids).order_by(rank_order(ids))
+
+
+def get_match_limit():
+    return getattr(settings, "RECIPE_MATCH_LIMIT", MATCH_LIMIT)
+
+
+def get_match_cache():
+    return caches[getattr(settings, "RECIPE_MATCH_CACHE_ALIAS", "default")]
+
+
+def match_version():
+    """
+    Changes with any recipe write, in every process: the latest updated_at
+    and, for deletions, the latest change log id (recipes/changes.py). Two
+    index lookups.
+    """
+    return [
+        str(Recipe.objects.aggregate(last=Max("updated_at"))["last"]),
+        RecipeChange.objects.aggregate(last=Max("id"))["last"],
+    ]
+
+
+def cached_matches(filters, compute):
+    """
+    The ids of a text search, from the match cache or from compute().
+
+    filters: JSON-able dict of everything the ids depend on
+    compute: returns the matching ids, or None when there are more than
+    get_match_limit() (not worth keeping; run the filters as SQL instead)
+
+    Cached for RECIPE_MATCH_CACHE_TIMEOUT seconds, under a key that
+    includes match_version(), so a recipe written by any process is seen by
+    the next search.
+    """
+    cache = get_match_cache()
+    digest = hashlib.sha1(json.dumps([match_version(), filters], sort_keys=True).encode()).hexdigest()
+    key = f"recipe-matches:{digest}"
+    missing = object()
+    ids = cache.get(key, missing)
+    if ids is missing:
+        ids = compute()
+        cache.set(key, ids, getattr(settings, "RECIPE_MATCH_CACHE_TIMEOUT", 300))
+    return ids
+
+
+def repair_search_schema(using="default"):
+    """
+    Recreate the SQLite sync triggers if migrations rebuilt recipes_recipe.
+    Does nothing until the FTS table itself has been created by migration 0004.
+    """
+    conn = connections[using]
+    if conn.vendor != "sqlite" or SQLiteSearchBackend.table not in conn.introspection.table_names():
+        return
+    with conn.schema_editor() as schema_editor:
+        SQLiteSearchBackend().install(schema_editor)
@@ -0,0 +1,99 @@
+"""
+Synthetic recipe data for benchmarks and load tests.
+"""
+import random
+from itertools import islice
+
+from django.db import transaction
+
+from categories.models import Category
+
+from .changes import log_created
+from .ingredients import index_recipes
+from .models import Recipe
+from .signals import recipes_bulk_created
+
+INGREDIENTS = [
+    "flour", "sugar", "butter", "eggs", "milk", "salt", "pepper", "olive oil",
+    "garlic", "onion", "tomato", "basil", "oregano", "parmesan", "mozzarella",
+    "cheddar", "chicken", "beef", "pork", "bacon", "salmon", "shrimp", "rice",
+    "pasta", "potato", "carrot", "celery", "spinach", "mushroom", "bell pepper",
+    "zucchini", "eggplant", "lemon", "lime", "ginger", "soy sauce", "honey",
+    "cream", "yogurt", "chickpeas", "lentils", "beans", "corn", "cumin",
+    "paprika", "chili", "coriander", "parsley", "thyme", "rosemary", "vinegar",
+    "mustard", "apple", "banana", "chocolate", "vanilla", "cinnamon", "oats",
+    "bread", "tofu", "coconut milk", "peas", "cabbage", "broccoli", "avocado",
+]
+
+ADJECTIVES = [
+    "Classic", "Creamy", "Spicy", "Quick", "Rustic", "Roasted", "Grilled",
+    "Baked", "Smoky", "Zesty", "Hearty", "Golden", "Crispy", "Homestyle",
+]
+
+DISHES = [
+    "Soup", "Pasta", "Salad", "Curry", "Stew", "Risotto", "Pie", "Tart",
+    "Sandwich", "Burger", "Omelette", "Casserole", "Stir Fry", "Tacos",
+    "Lasagne", "Quiche", "Pancakes", "Bowl", "Skillet", "Gratin",
+]
+
+STEPS = [
+    "Chop the {a} and the {b}.",
+    "Fry the {a} until golden.",
+    "Simmer with the {b} for a few minutes.",
+    "Season to taste and serve with {a}.",
+    "Bake until the {b} is bubbling.",
+    "Whisk the {a} into the {b}.",
+]
+
+CATEGORIES = ["Breakfast", "Lunch", "Dinner", "Dessert", "Snack", "Soup", "Salad", "Vegetarian"]
+
+
+def generate_recipes(count, seed=0, category_ids=None):
+    """
+    Yield `count` unsaved Recipe objects with realistic-looking fields.
+    Same `seed` -> same data, so benchmark runs are comparable.
+    """
+    rng = random.Random(seed)
+    category_ids = list(category_ids or [])
+    for n in range(count):
+        ingredients = rng.sample(INGREDIENTS, rng.randint(2, 14))
+        main = ingredients[0]
+        name = f"{rng.choice(ADJECTIVES)} {main.title()} {rng.choice(DISHES)}"
+        steps = [
+            rng.choice(STEPS).format(a=rng.choice(ingredients), b=rng.choice(ingredients))
+            for _ in range(rng.randint(2, 5))
+        ]
+        recipe = Recipe(
+            name=f"{name} #{n}",
+            description=" ".join(steps),
+            ingredients=",".join(ingredients),
+            cooking_time=rng.randint(3, 120),
+            category_id=rng.choice(category_ids) if category_ids else None,
+        )
+        # bulk_create skips save(), so fill in difficulty etc. here
+        recipe.update_precomputed()
+        yield recipe
+
+
+def seed_categories():
+    """Create the CATEGORIES that don't exist yet; return all of their ids."""
+    return [Category.objects.get_or_create(name=name)[0].pk for name in CATEGORIES]
+
+
+def insert_recipes(count, seed=0, category_ids=None, batch_size=5000, on_batch=None):
+    """
+    bulk_create `count` generated recipes, one transaction per batch, keeping
+    the ingredient index in sync. Returns the number inserted.
+    """
+    recipes = generate_recipes(count, seed=seed, category_ids=category_ids)
+    inserted = 0
+    while batch := list(islice(recipes, batch_size)):
+        with transaction.atomic():
+            Recipe.objects.bulk_create(batch)
+            index_recipes([(recipe.pk, recipe.ingredients) for recipe in batch])
+            log_created(batch)
+        recipes_bulk_created.send(sender=Recipe, recipe_ids=[recipe.pk for recipe in batch])
+        inserted += len(batch)
+        if on_batch:
+            on_batch(inserted)
+    return inserted
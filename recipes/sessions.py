@@ -0,0 +1,137 @@
+"""
+Session engine (SESSION_ENGINE = "recipes.sessions"): sessions are read
+from a cache and written to the database behind it.
+
+Django's cached_db engine already reads sessions from the cache, so a
+request whose session is cached runs no session query; but every change is
+still an UPDATE of django_session before the response goes out. Here a
+change that only touches RECIPE_SESSION_DEFERRED_KEYS (activity stamps,
+the expiry) goes to the cache and waits in this process; the first request
+to finish RECIPE_SESSION_WRITE_DELAY seconds after the oldest of them
+writes them all in one transaction, and so does the worker when it exits
+(startup.worker_started). Everything else is written through, as
+cached_db does: new sessions, logins (the auth keys), and any other key.
+Deleting a session, as logout does, removes it from the cache and the
+database at once and drops its pending change.
+
+The cache (SESSION_CACHE_ALIAS) must be shared by every process serving
+requests, or a logout in one would leave the session cached in another.
+Until a deferred change is written the cache and this process hold the
+only copy, so an eviction (the file cache culls at MAX_ENTRIES) or a crash
+loses it; that is why only changes that can be lost are deferred. A change
+to a session that was deleted meanwhile is dropped, and the entry taken
+out of the cache again. RECIPE_SESSION_WRITE_DELAY = 0 writes everything
+through.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import DatabaseError, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "recipes.sessions"
+WRITE_DELAY = 5
+DEFERRED_KEYS = ("last_activity", "_session_expiry")
+
+# session key -> Session instance to write
+_pending = {}
+_pending_lock = threading.Lock()
+# time.monotonic() of the oldest pending change
+_oldest = None
+
+
+def get_write_delay():
+    return getattr(settings, "RECIPE_SESSION_WRITE_DELAY", WRITE_DELAY)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+    # the session as loaded from the cache or database; None for a new one
+    _stored = None
+
+    def load(self):
+        data = super().load()
+        self._stored = dict(data)
+        return data
+
+    def can_defer(self):
+        """Whether the changes since load() only touch the deferred keys."""
+        if self._stored is None:
+            return False
+        session = self._get_session()
+        changed = {key for key in self._stored.keys() | session.keys() if self._stored.get(key) != session.get(key)}
+        return changed <= set(getattr(settings, "RECIPE_SESSION_DEFERRED_KEYS", DEFERRED_KEYS))
+
+    def _get_session_from_db(self):
+        # a cache miss: this process may hold a newer copy than the database
+        with _pending_lock:
+            pending = _pending.get(self.session_key)
+        if pending is not None and pending.expire_date > timezone.now():
+            return pending
+        return super()._get_session_from_db()
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None or not get_write_delay() or not self.can_defer():
+            with _pending_lock:
+                # superseded by this write
+                if self.session_key is not None:
+                    _pending.pop(self.session_key, None)
+            super().save(must_create)
+            self._stored = dict(self._get_session())
+            return
+        obj = self.create_model_instance(self._get_session())
+        self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+        global _oldest
+        with _pending_lock:
+            _pending[obj.session_key] = obj
+            if _oldest is None:
+                _oldest = time.monotonic()
+        self._stored = dict(self._get_session())
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        if key is not None:
+            with _pending_lock:
+                _pending.pop(key, None)
+        super().delete(session_key)
+
+
+def flush_sessions():
+    """Write this process's pending session changes. Returns how many."""
+    global _oldest
+    with _pending_lock:
+        pending = list(_pending.values())
+        _pending.clear()
+        _oldest = None
+    if not pending:
+        return 0
+    deleted = []
+    with transaction.atomic():
+        for obj in pending:
+            updated = type(obj).objects.filter(session_key=obj.session_key).update(
+                session_data=obj.session_data, expire_date=obj.expire_date
+            )
+            if not updated:
+                deleted.append(KEY_PREFIX + obj.session_key)
+    if deleted:
+        # logged out elsewhere since the change: don't let the cache keep them
+        caches[settings.SESSION_CACHE_ALIAS].delete_many(deleted)
+    return len(pending)
+
+
+@receiver(request_finished)
+def flush_due_sessions(sender, **kwargs):
+    if _oldest is None or time.monotonic() - _oldest < get_write_delay():
+        return
+    try:
+        flush_sessions()
+    except DatabaseError:
+        logger.exception("Writing pending session changes failed")
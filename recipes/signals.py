@@ -0,0 +1,193 @@
+import importlib
+import sys
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from django.urls import clear_url_caches
+
+from categories.models import Category
+
+from . import stats
+from .auth import invalidate_cached_user
+from .autocomplete import sync_autocomplete
+from .changes import log_changes
+from .detail_cache import invalidate_recipe_details
+from .ingredients import sync_recipe_ingredients
+from .models import Recipe, RecipeImage
+from .pantry import sync_pantry
+from .search import repair_search_schema
+from .similar import listed_by, schedule_update
+from .timing import install_query_timer
+
+# Sent by bulk writers that bypass Recipe.save() (import_recipes), after each
+# committed batch, with recipe_ids=[...]. Anything kept in sync on post_save
+# should listen to this as well.
+recipes_bulk_created = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe_ingredients(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Keep the ingredient index in sync for saves from AddRecipeForm, the admin
+    or anywhere else that goes through Recipe.save().
+    """
+    if raw:
+        # loaddata: fixtures bring their own RecipeIngredient rows
+        return
+    if update_fields is not None and "ingredients" not in update_fields:
+        return
+    sync_recipe_ingredients(instance)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_detail(sender, instance, raw=False, **kwargs):
+    invalidate_recipe_details([instance.pk])
+
+
+def changes_logged_fields(update_fields):
+    return update_fields is None or bool({"name", "ingredients"} & set(update_fields))
+
+
+def sync_indexes():
+    # the in-process indexes replaying the change log (recipes/changes.py)
+    sync_autocomplete()
+    sync_pantry()
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_logged_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    if instance._state.adding or not changes_logged_fields(update_fields):
+        return
+    instance._logged_old = Recipe.objects.filter(pk=instance.pk).values_list("name", "ingredients").first()
+
+
+@receiver(post_save, sender=Recipe)
+def log_recipe_change(sender, instance, created, update_fields=None, **kwargs):
+    # after index_recipe_ingredients; every process's indexes replay the
+    # log, this one's as soon as the change commits
+    if not changes_logged_fields(update_fields):
+        return
+    old = instance.__dict__.pop("_logged_old", None)
+    log_changes([(instance.pk, old, (instance.name, instance.ingredients))])
+    transaction.on_commit(sync_indexes)
+
+
+@receiver(post_delete, sender=Recipe)
+def log_recipe_removal(sender, instance, **kwargs):
+    log_changes([(instance.pk, (instance.name, instance.ingredients), None)])
+    transaction.on_commit(sync_indexes)
+
+
+@receiver(recipes_bulk_created)
+def sync_indexes_after_bulk(sender, recipe_ids, **kwargs):
+    # logged by the bulk writer (log_created); runs now unless an outer
+    # transaction (e.g. a benchmark's) is still open
+    transaction.on_commit(sync_indexes)
+
+
+@receiver(post_save, sender=Recipe)
+def update_similar_recipes(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and "ingredients" not in update_fields):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: schedule_update([pk]))
+
+
+@receiver(recipes_bulk_created)
+def add_similar_recipes(sender, recipe_ids, **kwargs):
+    transaction.on_commit(lambda: schedule_update(recipe_ids))
+
+
+@receiver(pre_delete, sender=Recipe)
+def refill_similar_recipes(sender, instance, **kwargs):
+    # the delete cascades to the lists it is in; those recipes need new matches
+    recipe_ids = listed_by(instance.pk)
+    if recipe_ids:
+        transaction.on_commit(lambda: schedule_update(recipe_ids))
+
+
+@receiver(post_delete, sender=RecipeImage)
+def invalidate_recipe_picture(sender, instance, **kwargs):
+    # derivatives are bulk-created; save_derivatives invalidates for those
+    invalidate_recipe_details([instance.recipe_id])
+
+
+# fields behind the summary tables (recipes/stats.py); difficulty follows them
+STATS_FIELDS = {"category", "cooking_time", "ingredients", "difficulty"}
+
+
+def changes_stats(update_fields):
+    return update_fields is None or bool(STATS_FIELDS & set(update_fields))
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_stats_state(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding or not changes_stats(update_fields):
+        return
+    instance._stats_old = stats.recipe_state(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def update_stats(sender, instance, raw=False, update_fields=None, **kwargs):
+    # after index_recipe_ingredients, so the new ingredient links are in
+    if raw or not changes_stats(update_fields):
+        return
+    stats.apply_change(instance.__dict__.pop("_stats_old", None), stats.recipe_state(instance.pk))
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_deleted_stats(sender, instance, **kwargs):
+    instance._stats_old = stats.recipe_state(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_stats(sender, instance, **kwargs):
+    stats.apply_change(instance.__dict__.pop("_stats_old", None), None)
+
+
+@receiver(recipes_bulk_created)
+def add_to_stats(sender, recipe_ids, **kwargs):
+    stats.add_recipes(recipe_ids)
+
+
+@receiver(pre_delete, sender=Category)
+def uncategorize_stats(sender, instance, **kwargs):
+    # its recipes are set to NULL without Recipe signals
+    stats.uncategorize(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user(sender, instance, **kwargs):
+    # password changes, deactivation, last_login on each login; again on
+    # commit in case a request re-read the old row in between
+    invalidate_cached_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_cached_user(instance.pk))
+
+
+@receiver(post_migrate)
+def repair_fulltext_triggers(sender, using="default", **kwargs):
+    if sender.name == "recipes":
+        repair_search_schema(using)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    # per-request SQL timings for ServerTimingMiddleware
+    install_query_timer(connection)
+
+
+@receiver(setting_changed)
+def swap_async_views(setting=None, **kwargs):
+    # recipes/urls.py picks the views when imported, e.g. for a test's override
+    if setting != "RECIPE_ASYNC_VIEWS":
+        return
+    for module in ("recipes.urls", settings.ROOT_URLCONF):
+        if module in sys.modules:
+            importlib.reload(sys.modules[module])
+    clear_url_caches()
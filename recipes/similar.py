@@ -0,0 +1,303 @@
+"""
+"Similar recipes": the recipes sharing the most ingredients with each
+recipe, precomputed into the SimilarRecipe table. The detail page reads a
+recipe's list with one query.
+
+Similarity is the Jaccard index of the two ingredient sets (from the
+ingredient index), shared / (size + other size - shared), with sizes taken
+from Recipe.ingredient_count so every path below scores alike. Each recipe
+keeps its RECIPE_SIMILAR_COUNT best matches, ties going to the older
+recipe.
+
+Full rebuild (manage.py rebuild_similar): IngredientMatrix
+(recipes/similarity.py, numpy only, imported when needed) holds every
+recipe's ingredients as a sparse 0/1 matrix (CSR arrays) plus its inverted
+index. For one recipe, the shared-ingredient counts against every recipe
+are one bincount over the posting lists of their ingredients, i.e.
+the sparse product row x matrix.T; only the recipes sharing the most
+ingredients are then scored (Jaccard can't exceed shared / size). Slices
+of recipes are spread over worker processes; the parent writes each
+finished slice.
+
+Incremental (after a recipe is saved, imported or deleted, see
+recipes/signals.py): one GROUP BY over the ingredient index counts the
+ingredients every other recipe shares with the changed one, and the best
+of those are scored as in the full rebuild. That
+replaces its own list, updates its score in the lists that contain it,
+and adds it to the lists of its RECIPE_SIMILAR_CANDIDATES best matches
+where it now ranks. A recipe further down than that which should now list
+it only does so after the next full rebuild. Deleting a recipe takes it
+out of other lists (CASCADE); those lists are recomputed in full. Bulk inserts of more than
+RECIPE_SIMILAR_INCREMENTAL_LIMIT recipes are left to the full rebuild too.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Recipe, RecipeIngredient, SimilarRecipe
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_COUNT = 6
+CANDIDATES = 200
+INCREMENTAL_LIMIT = 100
+
+
+def get_similar_count():
+    return getattr(settings, "RECIPE_SIMILAR_COUNT", SIMILAR_COUNT)
+
+
+def similar_recipes(recipe_id):
+    """A recipe's stored matches, best first, with the matching Recipe."""
+    return (
+        SimilarRecipe.objects.filter(recipe_id=recipe_id)
+        .select_related("similar")
+        .only("score", "similar__id", "similar__name")
+        .order_by("-score", "similar_id")
+    )
+
+
+def load_matrix():
+    """IngredientMatrix of every recipe with at least one indexed ingredient, in pk order."""
+    import numpy as np
+
+    from .similarity import IngredientMatrix
+
+    links = RecipeIngredient.objects.order_by("recipe_id", "ingredient_id").values_list("recipe_id", "ingredient_id")
+    pairs = np.fromiter(
+        (value for link in links.iterator(chunk_size=20000) for value in link), dtype=np.int64
+    ).reshape(-1, 2)
+    recipe_ids, starts = np.unique(pairs[:, 0], return_index=True)
+    _, columns = np.unique(pairs[:, 1], return_inverse=True)
+    indptr = np.append(starts, len(pairs))
+    # Recipe.ingredient_count where the recipe still exists, else its link count
+    sizes = np.diff(indptr)
+    counts = np.array(list(Recipe.objects.order_by("pk").values_list("pk", "ingredient_count")), dtype=np.int64).reshape(-1, 2)
+    found = np.searchsorted(counts[:, 0], recipe_ids)
+    known = found < len(counts)
+    known[known] = counts[found[known], 0] == recipe_ids[known]
+    sizes[known] = counts[found[known], 1]
+    return IngredientMatrix(recipe_ids, indptr, columns, sizes)
+
+
+def save_neighbours(recipe_ids, rows):
+    """Replace the lists of `recipe_ids` with (recipe id, similar id, score) rows."""
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=recipe_ids).delete()
+        SimilarRecipe.objects.bulk_create(
+            [SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id, score=score) for recipe_id, similar_id, score in rows],
+            batch_size=5000,
+        )
+
+
+def rebuild_similar(workers=None, slice_size=2000, k=None, progress=None):
+    """
+    Recompute every recipe's list. Slices of `slice_size` recipes run in
+    `workers` processes (default: one per CPU) and are written as they
+    finish, each in its own transaction. Returns the number of recipes.
+    """
+    from .similarity import init_worker, neighbours_slice
+
+    k = k or get_similar_count()
+    workers = workers or os.cpu_count() or 1
+    matrix = load_matrix()
+    slices = [(start, min(start + slice_size, len(matrix))) for start in range(0, len(matrix), slice_size)]
+
+    def save(start, stop, rows):
+        save_neighbours(matrix.recipe_ids[start:stop].tolist(), rows)
+        if progress:
+            progress(stop, len(matrix))
+
+    if workers == 1:
+        for start, stop in slices:
+            save(start, stop, matrix.neighbours(start, stop, k))
+    else:
+        # spawn: never fork a process that holds DB connections and threads
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(matrix,),
+        ) as executor:
+            for start, stop, rows in executor.map(neighbours_slice, *zip(*slices), [k] * len(slices)):
+                save(start, stop, rows)
+
+    # recipes without ingredients, or deleted since the load, keep no list
+    SimilarRecipe.objects.exclude(recipe_id__in=Recipe.objects.filter(ingredient_links__isnull=False)).delete()
+    return len(matrix)
+
+
+def shared_with(recipe_id, among=None):
+    """
+    (ids, shared ingredient counts) of the other recipes sharing an
+    ingredient with `recipe_id`, optionally only those in `among`: one
+    GROUP BY over the ingredient index.
+    """
+    import numpy as np
+
+    links = RecipeIngredient.objects.filter(
+        ingredient_id__in=RecipeIngredient.objects.filter(recipe_id=recipe_id).values("ingredient_id")
+    ).exclude(recipe_id=recipe_id)
+    if among is not None:
+        links = links.filter(recipe_id__in=among)
+    rows = np.array(list(links.values_list("recipe_id").annotate(shared=Count("pk")).order_by()), dtype=np.int64)
+    rows = rows.reshape(-1, 2)
+    return rows[:, 0], rows[:, 1]
+
+
+def jaccard(size, ids, shared):
+    """Scores of `ids` sharing `shared` ingredients with a recipe of `size`."""
+    import numpy as np
+
+    sizes = dict(Recipe.objects.filter(pk__in=ids.tolist()).values_list("pk", "ingredient_count"))
+    other = np.array([sizes.get(pk, 0) for pk in ids.tolist()], dtype=np.int64)
+    return shared / np.maximum(size + other - shared, 1)
+
+
+def best_matches(recipe_id, size, count):
+    """
+    (ids, scores) including the `count` best matches of `recipe_id`. As in
+    IngredientMatrix.nearest, only the recipes sharing the most
+    ingredients are scored, widening until nothing left out can rank.
+    """
+    import numpy as np
+
+    from .similarity import top_k
+
+    ids, shared = shared_with(recipe_id)
+    if not len(ids):
+        return ids, np.zeros(0)
+    recipes_sharing = np.cumsum(np.bincount(shared)[::-1])[::-1]
+    least = max(1, int(np.flatnonzero(recipes_sharing >= count)[-1])) if recipes_sharing[0] >= count else 1
+    # sizes are looked up one band of shared counts at a time
+    scored = shared >= least
+    scores = np.zeros(len(ids))
+    scores[scored] = jaccard(size, ids[scored], shared[scored])
+    while True:
+        best = top_k(scores[scored], ids[scored], count)
+        if least == 1 or (least - 1) / size < scores[scored][best[-1]]:
+            return ids[scored], scores[scored]
+        least -= 1
+        band = shared == least
+        scores[band] = jaccard(size, ids[band], shared[band])
+        scored |= band
+
+
+def update_recipe(recipe_id, k=None, candidates=None):
+    """
+    Bring the lists in line with one added or changed recipe.
+    Returns the ids of the recipes whose list changed.
+    """
+    import numpy as np
+
+    from .similarity import top_k
+
+    k = k or get_similar_count()
+    candidates = candidates or getattr(settings, "RECIPE_SIMILAR_CANDIDATES", CANDIDATES)
+    size = Recipe.objects.filter(pk=recipe_id).values_list("ingredient_count", flat=True).first() or 0
+    ids, scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+    if size:
+        ids, scores = best_matches(recipe_id, size, max(k, candidates))
+    score_of = dict(zip(ids.tolist(), scores.tolist()))
+    listed_by = set(SimilarRecipe.objects.filter(similar_id=recipe_id).values_list("recipe_id", flat=True))
+    if size and listed_by - set(score_of):
+        more_ids, more_shared = shared_with(recipe_id, among=listed_by - set(score_of))
+        score_of.update(zip(more_ids.tolist(), jaccard(size, more_ids, more_shared).tolist()))
+    changed = {recipe_id}
+
+    with transaction.atomic():
+        # its own list
+        best = top_k(scores, ids, k)
+        save_neighbours([recipe_id], [(recipe_id, int(ids[i]), float(scores[i])) for i in best])
+
+        # lists it is already in: new score, or out when nothing is shared now
+        for link in SimilarRecipe.objects.filter(similar_id=recipe_id).only("pk", "recipe_id", "score"):
+            score = score_of.get(link.recipe_id, 0.0)
+            if score <= 0:
+                link.delete()
+            elif score != link.score:
+                link.score = score
+                link.save(update_fields=["score"])
+            changed.add(link.recipe_id)
+
+        # lists of its best matches where it now ranks
+        nearest_ids = ids[top_k(scores, ids, candidates)].tolist()
+        lists = {}
+        for link in SimilarRecipe.objects.filter(recipe_id__in=nearest_ids).order_by("-score", "similar_id"):
+            lists.setdefault(link.recipe_id, []).append(link)
+        for other in nearest_ids:
+            entries = lists.get(other, [])
+            if any(link.similar_id == recipe_id for link in entries):
+                continue
+            score = score_of[other]
+            if len(entries) >= k:
+                if (score, -recipe_id) <= (entries[-1].score, -entries[-1].similar_id):
+                    continue
+                entries[-1].delete()
+            SimilarRecipe.objects.create(recipe_id=other, similar_id=recipe_id, score=score)
+            changed.add(other)
+
+    return changed
+
+
+def listed_by(recipe_id):
+    """Ids of the recipes whose list contains `recipe_id`."""
+    return list(SimilarRecipe.objects.filter(similar_id=recipe_id).values_list("recipe_id", flat=True))
+
+
+def update_recipes(recipe_ids):
+    for recipe_id in recipe_ids:
+        if Recipe.objects.filter(pk=recipe_id).exists():
+            update_recipe(recipe_id)
+
+
+_pending = set()
+_pending_lock = threading.Lock()
+_updating = False
+
+
+def _drain():
+    global _updating
+    try:
+        while True:
+            with _pending_lock:
+                if not _pending:
+                    _updating = False
+                    return
+                recipe_ids = sorted(_pending)
+                _pending.clear()
+            try:
+                update_recipes(recipe_ids)
+            except Exception:
+                logger.exception("Updating similar recipes failed for %s", recipe_ids)
+    finally:
+        connection.close()
+
+
+def schedule_update(recipe_ids):
+    """
+    Update the lists for recipes that were just committed: in a background
+    thread by default (RECIPE_SIMILAR_IN_BACKGROUND), or right away.
+    """
+    recipe_ids = list(recipe_ids)
+    limit = getattr(settings, "RECIPE_SIMILAR_INCREMENTAL_LIMIT", INCREMENTAL_LIMIT)
+    if len(recipe_ids) > limit:
+        logger.info("%d new recipes: similar recipes wait for manage.py rebuild_similar", len(recipe_ids))
+        return
+    if not getattr(settings, "RECIPE_SIMILAR_IN_BACKGROUND", True):
+        update_recipes(recipe_ids)
+        return
+
+    global _updating
+    with _pending_lock:
+        _pending.update(recipe_ids)
+        if _updating:
+            return
+        _updating = True
+    threading.Thread(target=_drain, name="similar-recipes", daemon=True).start()
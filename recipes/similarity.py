@@ -0,0 +1,94 @@
+"""
+The array side of recipes/similar.py: a sparse recipes x ingredients matrix
+and the top-k Jaccard neighbours of its rows.
+
+Only numpy here, no Django, so the module is cheap to hand to worker
+processes and isn't imported until a rebuild or update needs it.
+"""
+import numpy as np
+
+
+def top_k(scores, ids, k):
+    """
+    Indexes of the k best positive `scores`, best first, ties broken by the
+    smaller id.
+    """
+    positive = np.flatnonzero(scores > 0)
+    if len(positive) > k:
+        kth = np.partition(scores[positive], len(positive) - k)[len(positive) - k]
+        positive = positive[scores[positive] >= kth]
+    order = np.lexsort((ids[positive], -scores[positive]))
+    return positive[order[:k]]
+
+
+class IngredientMatrix:
+    """
+    Recipes x ingredients 0/1 matrix: row i is recipe recipe_ids[i], its
+    ingredient columns are columns[indptr[i]:indptr[i + 1]]. The inverted
+    index lists the rows using column c in postings[posting_ptr[c]:posting_ptr[c + 1]].
+    """
+
+    def __init__(self, recipe_ids, indptr, columns, sizes):
+        self.recipe_ids = recipe_ids
+        self.indptr = indptr
+        self.columns = columns
+        self.sizes = sizes
+        rows = np.repeat(np.arange(len(recipe_ids)), np.diff(indptr))
+        order = np.argsort(columns, kind="stable")
+        self.postings = rows[order]
+        self.posting_ptr = np.concatenate(([0], np.cumsum(np.bincount(columns)))) if len(columns) else np.zeros(1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def shared(self, row):
+        """
+        Ingredients the recipe at `row` shares with every recipe: its row of
+        the sparse product matrix x matrix.T, one bincount over the posting
+        lists of its ingredients.
+        """
+        columns = self.columns[self.indptr[row]:self.indptr[row + 1]]
+        hits = np.concatenate([self.postings[self.posting_ptr[column]:self.posting_ptr[column + 1]] for column in columns])
+        return np.bincount(hits, minlength=len(self))
+
+    def nearest(self, row, k):
+        """(rows, scores) of the k recipes most similar to the one at `row`."""
+        shared = self.shared(row)
+        shared[row] = 0
+        size = self.sizes[row]
+        # Scoring every recipe costs more than finding the top k. Jaccard is
+        # at most shared / size, so start with the recipes sharing the most
+        # ingredients and widen until nothing left out can score higher.
+        # [s] = recipes sharing at least s ingredients
+        recipes_sharing = np.cumsum(np.bincount(shared)[::-1])[::-1]
+        least = max(1, int(np.flatnonzero(recipes_sharing >= k)[-1])) if recipes_sharing[0] >= k else 1
+        while True:
+            candidates = np.flatnonzero(shared >= least)
+            common = shared[candidates]
+            scores = common / np.maximum(size + self.sizes[candidates] - common, 1)
+            best = top_k(scores, self.recipe_ids[candidates], k)
+            if least == 1 or (least - 1) / size < scores[best[-1]]:
+                return candidates[best], scores[best]
+            least -= 1
+
+    def neighbours(self, start, stop, k):
+        """(recipe id, similar id, score) rows for the recipes at rows start..stop."""
+        results = []
+        for row in range(start, stop):
+            recipe_id = int(self.recipe_ids[row])
+            rows, scores = self.nearest(row, k)
+            results.extend(zip([recipe_id] * len(rows), self.recipe_ids[rows].tolist(), scores.tolist()))
+        return results
+
+
+# set in each worker process by the pool initializer
+_matrix = None
+
+
+def init_worker(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def neighbours_slice(start, stop, k):
+    return start, stop, _matrix.neighbours(start, stop, k)
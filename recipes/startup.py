@@ -0,0 +1,137 @@
+"""
+What a web process loads before it serves its first request.
+
+wsgi.py / asgi.py call application_loaded() once Django is set up. By
+default each worker then starts building the autocomplete and pantry
+indexes in the background and imports everything else (views,
+templates) on its first requests.
+
+With RECIPE_PRELOAD=1 (see gunicorn.conf.py) gunicorn imports the
+application once in the master and forks the workers from it, so they
+start ready and share those pages of memory copy-on-write. The master
+then only loads code: URLconf and views, compiled templates, and
+matplotlib when charts are drawn in the web workers
+(RECIPE_CHART_WORKERS = 0; otherwise only the chart pool imports it).
+Database connections and threads don't survive a fork, so the master
+opens neither; each worker warms its own in-memory indexes in
+worker_started().
+
+ready_script() is the same start-up as a standalone script, for measuring
+it in a fresh interpreter (manage.py bench_imports, bench_views).
+"""
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+
+# compiled once by the cached template loader
+PRELOAD_TEMPLATES = (
+    "base.html",
+    "recipes/recipes_home.html",
+    "recipes/recipes_overview.html",
+    "recipes/recipe_detail.html",
+    "recipes/_recipe_detail.html",
+    "recipes/recipe_search.html",
+    "recipes/recipe_add.html",
+)
+# imported by draw_chart when charts are drawn in-process
+CHART_MODULES = ("matplotlib.figure", "matplotlib.backends.backend_agg")
+# large optional dependencies that no request should import
+HEAVY_MODULES = ("matplotlib", "pandas", "numpy")
+
+
+def preloading():
+    return os.environ.get("RECIPE_PRELOAD") == "1"
+
+
+def application_loaded():
+    if preloading():
+        preload()
+    else:
+        worker_started()
+
+
+def preload():
+    """Load code shared by every forked worker. No database, no threads."""
+    from django.db import connections
+    from django.template.loader import get_template
+    from django.urls import get_resolver
+
+    # imports every view module
+    get_resolver().url_patterns
+    for name in PRELOAD_TEMPLATES:
+        get_template(name)
+    if getattr(settings, "RECIPE_CHART_WORKERS", 2) == 0:
+        for module in CHART_MODULES:
+            __import__(module)
+    # in case anything above queried; a forked socket must not be shared
+    connections.close_all()
+
+
+def worker_started():
+    """Per-process start-up work, run in each worker."""
+    import atexit
+
+    from .autocomplete import warm_autocomplete
+    from .pantry import warm_pantry_index
+    from .sessions import flush_sessions
+
+    # build the in-memory indexes in the background while the worker starts
+    warm_autocomplete()
+    warm_pantry_index()
+    # session changes still waiting for the database (recipes/sessions.py)
+    atexit.register(flush_sessions)
+
+
+def ready_script(module):
+    """
+    Python source that imports `module` (a WSGI/ASGI application) as
+    gunicorn's preload does, then prints the time taken, peak RSS and which
+    HEAVY_MODULES got loaded as JSON.
+    """
+    return (
+        "import importlib, json, os, resource, sys, time\n"
+        "started = time.perf_counter()\n"
+        f"importlib.import_module({module!r})\n"
+        "ready_s = time.perf_counter() - started\n"
+        "print(json.dumps({\n"
+        "    'ready_ms': round(ready_s * 1000, 1),\n"
+        "    'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\n"
+        "    'modules': len(sys.modules),\n"
+        f"    'heavy_modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules],\n"
+        "}))\n"
+    )
+
+
+def run_ready_script(module, *python_options):
+    """Run ready_script() in a fresh interpreter: (its JSON report, stderr)."""
+    env = {**os.environ, "RECIPE_PRELOAD": "1"}
+    result = subprocess.run(
+        [sys.executable, *python_options, "-c", ready_script(module)],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def cold_start(module="recipe_project.wsgi"):
+    """Time and peak RSS (Linux KiB) for a new process to load the application."""
+    report, _ = run_ready_script(module)
+    return report
+
+
+def import_times(module="recipe_project.wsgi"):
+    """
+    Import time of every module loaded while starting the application,
+    from `python -X importtime`: (module, self µs, cumulative µs) tuples
+    in import order, and the cold_start() report.
+    """
+    report, stderr = run_ready_script(module, "-X", "importtime")
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(self_us), int(cumulative_us)))
+    return times, report
@@ -0,0 +1,259 @@
+"""
+Catalogue statistics for the dashboard (/stats/, /api/stats/), read from
+two summary tables instead of the recipes:
+
+- CategoryStat: recipes and their total cooking time per (category,
+  difficulty, cooking-time bucket), with the buckets of the search facets
+  (recipes/facets.py). At most categories x 5 x 5 rows.
+- IngredientStat: recipes per ingredient.
+
+The dashboard reads those rows and the top RECIPE_STATS_TOP_INGREDIENTS
+ingredients, so its cost follows the number of categories and
+ingredients, not of recipes.
+
+Every Recipe save and delete moves the recipe's counts from its old row
+to its new one (recipes/signals.py): pre_save reads the stored values,
+post_save applies the difference as F() increments in one transaction,
+so concurrent writers don't lose updates. A save that changes none of the
+counted fields writes nothing. Bulk inserts (recipes_bulk_created) are
+counted per batch with two queries.
+
+Writes that bypass the signals drift the tables: QuerySet.update(),
+bulk_update() and raw SQL. manage.py reconcile_stats recounts both tables
+from the recipes with two GROUP BYs, fixes the rows that differ and drops
+the ones left at zero; recompute_difficulty and backfill_ingredients run
+it when they are done. Run it periodically as well, e.g. nightly.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+
+from .difficulty import DIFFICULTY_CHOICES
+from .facets import COOKING_TIME_BUCKETS, TIME_BUCKET_CHOICES
+from .models import CategoryStat, IngredientStat, Recipe, RecipeIngredient
+
+TOP_INGREDIENTS = 25
+
+
+def time_bucket(minutes):
+    for key, _, _, high in COOKING_TIME_BUCKETS:
+        if high is None or minutes <= high:
+            return key
+
+
+def bucket_case():
+    """time_bucket() as an SQL expression over cooking_time."""
+    return Case(
+        *(When(cooking_time__lte=high, then=Value(key)) for key, _, _, high in COOKING_TIME_BUCKETS if high is not None),
+        default=Value(COOKING_TIME_BUCKETS[-1][0]),
+    )
+
+
+def recipe_state(pk):
+    """(category id, difficulty, cooking time, ingredient ids) of a stored recipe, or None."""
+    row = Recipe.objects.filter(pk=pk).values_list("category_id", "difficulty", "cooking_time").first()
+    if row is None:
+        return None
+    return (*row, frozenset(RecipeIngredient.objects.filter(recipe_id=pk).values_list("ingredient_id", flat=True)))
+
+
+def add_counts(categories, ingredients):
+    """
+    Add {(category id, difficulty, bucket): (recipes, minutes)} and
+    {ingredient id: recipes} to the tables; rows are created as needed.
+    """
+    categories = {key: value for key, value in categories.items() if any(value)}
+    by_delta = defaultdict(list)
+    for ingredient_id, delta in ingredients.items():
+        if delta:
+            by_delta[delta].append(ingredient_id)
+    if not categories and not by_delta:
+        return
+
+    with transaction.atomic():
+        if categories:
+            CategoryStat.objects.bulk_create(
+                [CategoryStat(category_id=c, difficulty=d, time_bucket=b) for c, d, b in categories],
+                ignore_conflicts=True,
+            )
+        for (category_id, difficulty, bucket), (recipes, minutes) in categories.items():
+            CategoryStat.objects.filter(category_id=category_id, difficulty=difficulty, time_bucket=bucket).update(
+                recipe_count=F("recipe_count") + recipes,
+                total_cooking_time=F("total_cooking_time") + minutes,
+            )
+        for delta, ingredient_ids in by_delta.items():
+            IngredientStat.objects.bulk_create(
+                [IngredientStat(ingredient_id=pk) for pk in ingredient_ids], ignore_conflicts=True
+            )
+            IngredientStat.objects.filter(ingredient_id__in=ingredient_ids).update(recipe_count=F("recipe_count") + delta)
+
+
+def apply_change(old, new):
+    """Move one recipe's counts from recipe_state() `old` to `new`; either may be None."""
+    categories = defaultdict(lambda: (0, 0))
+    ingredients = Counter()
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        category_id, difficulty, cooking_time, ingredient_ids = state
+        key = (category_id, difficulty, time_bucket(cooking_time))
+        recipes, minutes = categories[key]
+        categories[key] = (recipes + sign, minutes + sign * cooking_time)
+        for ingredient_id in ingredient_ids:
+            ingredients[ingredient_id] += sign
+    add_counts(categories, ingredients)
+
+
+def add_recipes(recipe_ids):
+    """Count recipes inserted in bulk, bypassing the per-save signals."""
+    categories = defaultdict(lambda: (0, 0))
+    for category_id, difficulty, cooking_time in Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        "category_id", "difficulty", "cooking_time"
+    ):
+        key = (category_id, difficulty, time_bucket(cooking_time))
+        recipes, minutes = categories[key]
+        categories[key] = (recipes + 1, minutes + cooking_time)
+    ingredients = dict(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .values_list("ingredient_id").annotate(count=Count("pk")).order_by()
+    )
+    add_counts(categories, ingredients)
+
+
+def uncategorize(category_id):
+    """
+    A category is being deleted: its recipes become uncategorized (SET_NULL,
+    without Recipe signals), so its rows are added to the uncategorized ones.
+    """
+    rows = CategoryStat.objects.filter(category_id=category_id).values_list(
+        "difficulty", "time_bucket", "recipe_count", "total_cooking_time"
+    )
+    add_counts({(None, difficulty, bucket): (recipes, minutes) for difficulty, bucket, recipes, minutes in rows}, {})
+
+
+def counted_from_recipes():
+    """What the tables should hold: (category counts, ingredient counts)."""
+    rows = (
+        Recipe.objects.annotate(bucket=bucket_case())
+        .values_list("category_id", "difficulty", "bucket")
+        .annotate(count=Count("pk"), minutes=Sum("cooking_time"))
+        .order_by()
+    )
+    categories = {(category_id, difficulty, bucket): (count, minutes) for category_id, difficulty, bucket, count, minutes in rows}
+    ingredients = dict(RecipeIngredient.objects.values_list("ingredient_id").annotate(count=Count("pk")).order_by())
+    return categories, ingredients
+
+
+def reconcile_stats():
+    """
+    Recount both tables from the recipes and fix the rows that differ.
+    Returns the number of fixed rows per table, i.e. the drift.
+    """
+    with transaction.atomic():
+        # writers wait on these rows until the recount is in
+        stored_categories = {
+            (category_id, difficulty, bucket): (count, minutes)
+            for category_id, difficulty, bucket, count, minutes in CategoryStat.objects.select_for_update().values_list(
+                "category_id", "difficulty", "time_bucket", "recipe_count", "total_cooking_time"
+            )
+        }
+        stored_ingredients = dict(IngredientStat.objects.select_for_update().values_list("ingredient_id", "recipe_count"))
+        categories, ingredients = counted_from_recipes()
+
+        # rows emptied by moves and deletes are left at zero; not drift
+        CategoryStat.objects.filter(recipe_count=0, total_cooking_time=0).delete()
+        IngredientStat.objects.filter(recipe_count=0).delete()
+        stored_categories = {key: value for key, value in stored_categories.items() if value != (0, 0)}
+        stored_ingredients = {pk: count for pk, count in stored_ingredients.items() if count}
+
+        fixed_categories = 0
+        for key in stored_categories.keys() - categories.keys():
+            category_id, difficulty, bucket = key
+            CategoryStat.objects.filter(category_id=category_id, difficulty=difficulty, time_bucket=bucket).delete()
+            fixed_categories += 1
+        for key, (count, minutes) in categories.items():
+            if stored_categories.get(key) == (count, minutes):
+                continue
+            category_id, difficulty, bucket = key
+            CategoryStat.objects.update_or_create(
+                category_id=category_id, difficulty=difficulty, time_bucket=bucket,
+                defaults={"recipe_count": count, "total_cooking_time": minutes},
+            )
+            fixed_categories += 1
+
+        gone = stored_ingredients.keys() - ingredients.keys()
+        IngredientStat.objects.filter(ingredient_id__in=gone).delete()
+        wrong = [
+            IngredientStat(ingredient_id=pk, recipe_count=count)
+            for pk, count in ingredients.items()
+            if stored_ingredients.get(pk) != count
+        ]
+        IngredientStat.objects.bulk_create([stat for stat in wrong if stat.ingredient_id not in stored_ingredients], batch_size=1000)
+        IngredientStat.objects.bulk_update(
+            [stat for stat in wrong if stat.ingredient_id in stored_ingredients], ["recipe_count"], batch_size=1000
+        )
+    return {"categories": fixed_categories, "ingredients": len(gone) + len(wrong)}
+
+
+def dashboard(top_ingredients=None):
+    """The statistics page and /api/stats/ payload, from the summary tables only."""
+    if top_ingredients is None:
+        top_ingredients = getattr(settings, "RECIPE_STATS_TOP_INGREDIENTS", TOP_INGREDIENTS)
+
+    categories = {}
+    difficulties = Counter()
+    buckets = Counter()
+    total = minutes_total = 0
+    for category_id, name, difficulty, bucket, count, minutes in (
+        CategoryStat.objects.filter(recipe_count__gt=0)
+        .values_list("category_id", "category__name", "difficulty", "time_bucket", "recipe_count", "total_cooking_time")
+    ):
+        category = categories.setdefault(category_id, {
+            "id": category_id, "name": name or "Uncategorized", "recipes": 0, "minutes": 0,
+            "difficulty": Counter(), "cooking_time": Counter(),
+        })
+        category["recipes"] += count
+        category["minutes"] += minutes
+        category["difficulty"][difficulty] += count
+        category["cooking_time"][bucket] += count
+        difficulties[difficulty] += count
+        buckets[bucket] += count
+        total += count
+        minutes_total += minutes
+
+    difficulty_labels = [*DIFFICULTY_CHOICES, ("", "Unknown")]
+
+    def difficulty_mix(counts):
+        return [{"difficulty": value, "label": label, "recipes": counts[value]} for value, label in difficulty_labels if counts[value]]
+
+    def histogram(counts):
+        return [{"bucket": key, "label": label, "recipes": counts[key]} for key, label in TIME_BUCKET_CHOICES]
+
+    def average(minutes, recipes):
+        return round(minutes / recipes, 1) if recipes else None
+
+    top = (
+        IngredientStat.objects.filter(recipe_count__gt=0)
+        .order_by("-recipe_count", "ingredient")
+        .values_list("ingredient__name", "recipe_count")[:top_ingredients]
+    )
+    return {
+        "recipes": total,
+        "average_cooking_time": average(minutes_total, total),
+        "difficulty": difficulty_mix(difficulties),
+        "cooking_time": histogram(buckets),
+        "categories": [
+            {
+                "id": category["id"],
+                "name": category["name"],
+                "recipes": category["recipes"],
+                "average_cooking_time": average(category["minutes"], category["recipes"]),
+                "difficulty": difficulty_mix(category["difficulty"]),
+                "cooking_time": histogram(category["cooking_time"]),
+            }
+            for category in sorted(categories.values(), key=lambda c: (-c["recipes"], c["name"]))
+        ],
+        "ingredients": [{"name": name, "recipes": count} for name, count in top],
+    }
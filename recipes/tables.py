@@ -0,0 +1,58 @@
+"""
+HTML results table for the search page.
+
+Rows are streamed from the database with values_list().iterator(), so no
+model instances or DataFrames are built, and every cell is escaped.
+"""
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+RESULT_FIELDS = ("id", "name", "cooking_time", "difficulty", "ingredients")
+INGREDIENTS_PREVIEW = 80
+
+# resolved once per table; the placeholder is swapped for each row's pk
+_PK_PLACEHOLDER = "2147483647"
+
+
+def detail_url_template():
+    return reverse("recipes:recipe_detail", args=[_PK_PLACEHOLDER]).replace(_PK_PLACEHOLDER, "{pk}")
+
+
+def truncate(text, length=INGREDIENTS_PREVIEW):
+    return text if len(text) <= length else text[: length - 3] + "..."
+
+
+def result_rows(qs, chunk_size=2000):
+    """RESULT_FIELDS tuples for `qs`, streamed from the database cursor."""
+    return qs.values_list(*RESULT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def iter_result_rows(rows):
+    """
+    Yield one <tr> per RESULT_FIELDS tuple.
+    """
+    url = detail_url_template()
+    for pk, name, cooking_time, difficulty, ingredients in rows:
+        yield (
+            f'<tr><td><a class="recipe-link" href="{url.format(pk=pk)}">{escape(name)}</a></td>'
+            f"<td>{cooking_time}</td>"
+            f"<td>{escape(difficulty or '')}</td>"
+            f"<td>{escape(truncate(ingredients or ''))}</td></tr>"
+        )
+
+
+def render_results_table(rows):
+    """
+    rows: RESULT_FIELDS tuples, e.g. result_rows(qs) or a keyset page.
+    Return (html, row_count); html is None when there are no rows.
+    """
+    html_rows = list(iter_result_rows(rows))
+    if not html_rows:
+        return None, 0
+    html = (
+        '<table class="recipe-search-table">'
+        "<thead><tr><th>name</th><th>cooking_time</th><th>difficulty</th><th>ingredients</th></tr></thead>"
+        f"<tbody>{''.join(html_rows)}</tbody></table>"
+    )
+    return mark_safe(html), len(html_rows)
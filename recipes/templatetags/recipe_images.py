@@ -0,0 +1,21 @@
+from django import template
+
+from recipes.images import picture_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag("recipes/_picture.html")
+def recipe_picture(recipe, sizes, css_class="", loading="lazy"):
+    """
+    <picture> with WebP/JPEG srcsets for a recipe, falling back to the
+    original upload when no derivatives exist yet.
+    Prefetch "renditions" when rendering many recipes.
+    """
+    return {
+        "recipe": recipe,
+        "sources": picture_sources(recipe.renditions.all()),
+        "sizes": sizes,
+        "css_class": css_class,
+        "loading": loading,
+    }
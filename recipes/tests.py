@@ -1,11 +1,61 @@
+import csv
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.template import Context, Template
+from PIL import Image
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
-from django.urls import reverse
+from django.test import AsyncClient, Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
 
 from categories.models import Category
+from recipes.api import API_FIELDS
+from recipes.auth import user_cache_key
+from recipes.autocomplete import PrefixIndex, get_autocomplete, reset_autocomplete
+from recipes.changes import ChangeFeed, log_changes
+from recipes.chart_cache import ChartCache, LRUChartStore, chart_key, get_chart_cache
+from recipes.charts import chart_series
+from recipes.facets import facet_counts, query_budget
+from recipes.difficulty import classify_difficulties, classify_difficulty
 from recipes.forms import AddRecipeForm, RecipeSearchForm
-from recipes.models import Recipe
+from recipes.ingredients import filter_by_ingredients, parse_ingredients
+from recipes.images import DERIVATIVE_NAME_RE, render_derivatives, save_derivatives
+from recipes.importer import RecipeImporter
+from recipes.media import MediaWhiteNoiseMiddleware
+from recipes.models import CategoryStat, Ingredient, IngredientStat, Recipe, RecipeImage, RecipeIngredient, SimilarRecipe
+from recipes.pagination import InvalidCursor, bounded_count, decode_cursor, paginate_keyset
+from recipes.pantry import PantryIndex, get_pantry_index, reset_pantry_index
+from recipes.rendering import ChartRenderer, request_chart
+from recipes.seed import insert_recipes
+from recipes.sessions import SessionStore, flush_sessions
+from recipes.search import LikeSearchBackend, get_search_backend, search_recipes
+from recipes.similar import rebuild_similar
+from recipes.stats import dashboard, reconcile_stats
+from recipes.tables import render_results_table, result_rows
+from recipes.utils import draw_chart
+from recipes.views import RecipeListView, arecipe_search, recipe_search
+
+# one JSON line per request is noise here; TimingTests turns it back on with assertLogs
+logging.getLogger("recipes.timing").setLevel(logging.WARNING)
 
 
 class RecipeModelTests(TestCase):
@@ -232,3 +282,1547 @@ class RecipeViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "recipes/recipe_search.html")
         self.assertContains(response, "Results:")
+
+
+class IngredientIndexTests(TestCase):
+    def setUp(self):
+        self.omelette = Recipe.objects.create(
+            name="Omelette",
+            description="Eggs.",
+            ingredients="Eggs, milk ,salt",
+            cooking_time=10,
+        )
+        self.moussaka = Recipe.objects.create(
+            name="Moussaka",
+            description="Baked.",
+            ingredients="eggplant,tomato,Olive  Oil",
+            cooking_time=60,
+        )
+
+    def search(self, text):
+        return list(filter_by_ingredients(Recipe.objects.order_by("name"), text))
+
+    def test_parse_ingredients_normalizes_and_dedupes(self):
+        self.assertEqual(parse_ingredients(" Olive  Oil, salt,,SALT "), ["olive oil", "salt"])
+
+    def test_save_builds_index(self):
+        names = list(self.omelette.ingredient_index.order_by("recipe_links__position").values_list("name", flat=True))
+        self.assertEqual(names, ["eggs", "milk", "salt"])
+
+    def test_editing_ingredients_resyncs_index(self):
+        self.omelette.ingredients = "eggs,cheese"
+        self.omelette.save()
+        names = set(self.omelette.ingredient_index.values_list("name", flat=True))
+        self.assertEqual(names, {"eggs", "cheese"})
+
+    def test_exact_match_does_not_match_longer_names(self):
+        self.assertEqual(self.search("egg"), [])
+        self.assertEqual(self.search("EGGS"), [self.omelette])
+
+    def test_prefix_match(self):
+        self.assertEqual(self.search("egg*"), [self.moussaka, self.omelette])
+
+    def test_all_terms_must_match(self):
+        self.assertEqual(self.search("eggs, salt"), [self.omelette])
+        self.assertEqual(self.search("eggs, tomato"), [])
+
+    def test_backfill_command_rebuilds_index(self):
+        frittata = Recipe.objects.create(name="Frittata", description="d", ingredients="eggs,cheese", cooking_time=20)
+        RecipeIngredient.objects.all().delete()
+        Ingredient.objects.all().delete()
+        feed = ChangeFeed()
+        call_command("backfill_ingredients", batch_size=1, workers=1, stdout=StringIO())
+        self.assertEqual(self.search("olive oil"), [self.moussaka])
+        self.assertEqual(RecipeIngredient.objects.count(), 8)
+        self.assertEqual(list(SimilarRecipe.objects.filter(recipe=self.omelette).values_list("similar_id", flat=True)), [frittata.pk])
+        # the in-process indexes were built from the old links
+        self.assertIsNone(feed.read(1000))
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.soup = Recipe.objects.create(
+            name="Tomato Soup",
+            description="Blend and simmer.",
+            ingredients="tomato,onion,cream",
+            cooking_time=25,
+        )
+        self.pasta = Recipe.objects.create(
+            name="Garlic Pasta",
+            description="Serve with roasted tomatoes.",
+            ingredients="pasta,garlic,olive oil",
+            cooking_time=15,
+        )
+        self.cake = Recipe.objects.create(
+            name="Cake",
+            description="Bake for an hour.",
+            ingredients="flour,sugar,eggs",
+            cooking_time=60,
+        )
+
+    def test_name_match_ranks_above_description_match(self):
+        self.assertEqual(search_recipes("tomato"), [self.soup.pk, self.pasta.pk])
+
+    def test_searches_description(self):
+        self.assertEqual(search_recipes("bake"), [self.cake.pk])
+
+    def test_respects_base_queryset_and_limit(self):
+        base = Recipe.objects.filter(cooking_time__lte=20)
+        self.assertEqual(search_recipes("tomato", base_qs=base), [self.pasta.pk])
+        self.assertEqual(len(search_recipes("tomato", limit=1)), 1)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.cake.description = "Whisk and fold."
+        self.cake.save()
+        self.assertEqual(search_recipes("bake"), [])
+        self.soup.delete()
+        self.assertEqual(search_recipes("tomato"), [self.pasta.pk])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(search_recipes('tomato"* ^('), [self.soup.pk, self.pasta.pk])
+        self.assertEqual(search_recipes("  "), [])
+
+    def test_like_backend_matches_same_rows(self):
+        ranked = set(get_search_backend().search("tomato"))
+        self.assertEqual(set(LikeSearchBackend().search("tomato")), ranked)
+
+    def test_keyword_search_view_orders_by_relevance(self):
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        response = self.client.post(reverse("recipes:recipe_search"), data={"keywords": "tomato"})
+        self.assertContains(response, "Results: 2")
+        content = response.content.decode()
+        self.assertLess(content.index("Tomato Soup"), content.index("Garlic Pasta"))
+
+
+class ChartCacheTests(TestCase):
+    rows = [("Salad", 8, "Easy"), ("Stew", 90, "")]
+
+    def test_key_depends_on_type_and_rows(self):
+        key = chart_key("#1", self.rows)
+        self.assertEqual(key, chart_key("#1", list(self.rows)))
+        self.assertNotEqual(key, chart_key("#2", self.rows))
+        self.assertNotEqual(key, chart_key("#1", [("Salad", 9, "Easy"), ("Stew", 90, "")]))
+
+    def test_counts_hits_and_misses(self):
+        cache = ChartCache(LRUChartStore(max_entries=4))
+        key = chart_key("#1", self.rows)
+        self.assertIsNone(cache.get(key))
+        cache.store.set(key, b"png")
+        self.assertEqual(cache.get(key), b"png")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_lru_eviction(self):
+        store = LRUChartStore(max_entries=2)
+        store.set("a", 1)
+        store.set("b", 2)
+        store.get("a")
+        store.set("c", 3)
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(store.get("a"), 1)
+        self.assertEqual(len(store), 2)
+
+    @override_settings(RECIPE_CHART_CACHE_ALIAS=None, RECIPE_CHART_WORKERS=0)
+    def test_repeated_search_skips_rendering(self):
+        Recipe.objects.create(name="Salad", description="Mix.", ingredients="lettuce", cooking_time=8)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        with mock.patch("recipes.rendering.draw_chart", return_value=b"png") as render:
+            for _ in range(2):
+                response = self.client.post(reverse("recipes:recipe_search"), data={"chart_type": "#1"})
+                self.assertIsNotNone(response.context["chart_url"])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(get_chart_cache().stats()["hits"], 1)
+
+
+@override_settings(RECIPE_CHART_CACHE_ALIAS=None)
+class ChartRenderingTests(TestCase):
+    rows = [("Salad", 8), ("Stew", 90)]
+
+    def setUp(self):
+        Recipe.objects.create(name="Salad", description="Mix.", ingredients="lettuce", cooking_time=8)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def test_draw_chart_returns_png(self):
+        for chart_type in ("#1", "#2", "#3"):
+            self.assertTrue(draw_chart(chart_type, self.rows).startswith(b"\x89PNG"))
+        self.assertIn(b"<svg", draw_chart("#1", self.rows, "svg"))
+        self.assertIsNone(draw_chart("#9", self.rows))
+        self.assertIsNone(draw_chart("#1", []))
+        self.assertIsNone(draw_chart("#1", self.rows, "gif"))
+
+    @override_settings(RECIPE_CHART_WORKERS=1)
+    def test_chart_rendered_in_process_pool(self):
+        url = reverse("recipes:chart", args=[request_chart("#2", self.rows), "png"])
+        response = self.client.get(url)
+        for _ in range(30):
+            if response.status_code == 200:
+                break
+            self.assertEqual(response.status_code, 202)
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    @override_settings(RECIPE_CHART_WORKERS=1)
+    def test_chart_lookups_counted_once(self):
+        cache = get_chart_cache()
+        cache.clear()
+        url = reverse("recipes:chart", args=[request_chart("#2", self.rows), "png"])
+        for _ in range(30):
+            if self.client.get(url).status_code == 200:
+                break
+        self.assertEqual(cache.stats()["misses"], 1)
+        request_chart("#2", self.rows)
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 1))
+
+    def test_overrunning_job_recycles_the_pool(self):
+        renderer = ChartRenderer(get_chart_cache(), max_workers=1, timeout=0.01)
+        rows = [(f"Recipe {i}", i) for i in range(2000)]
+        children = set(multiprocessing.active_children())
+        self.assertTrue(renderer.submit("slow", "#1", rows))
+        executor = renderer.executor
+        processes = [process for process in multiprocessing.active_children() if process not in children]
+        time.sleep(0.05)
+        with self.assertLogs("recipes.rendering", "WARNING"):
+            self.assertTrue(renderer.submit("next", "#1", self.rows))
+            self.assertIsNot(renderer.executor, executor)
+            for process in processes:
+                process.join(5)
+                self.assertIsNotNone(process.exitcode)
+            self.assertFalse(renderer.is_pending("slow"))
+            self.assertIsNotNone(renderer.wait("next", timeout=30))
+        renderer.executor.shutdown()
+
+    @override_settings(RECIPE_CHART_WORKERS=1, RECIPE_CHART_QUEUE_DEPTH=0)
+    def test_full_queue_reports_busy(self):
+        response = self.client.post(reverse("recipes:recipe_search"), data={"chart_type": "#1"})
+        self.assertIsNone(response.context["chart_url"])
+        self.assertContains(response, "Charts are busy")
+
+    def test_unknown_chart_is_404(self):
+        for fmt in ("png", "svg", "json"):
+            response = self.client.get(reverse("recipes:chart", args=["0" * 64, fmt]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_difficulty_series_is_aggregated_in_sql(self):
+        Recipe.objects.create(name="Stew", description="Simmer.", ingredients="beef, carrot, onion", cooking_time=90)
+        Recipe.objects.create(name="Toast", description="Toast.", ingredients="bread", cooking_time=3)
+        with self.assertNumQueries(1):
+            series = chart_series(Recipe.objects.order_by("name"), "#2")
+        self.assertEqual(series, [("Easy", 2), ("Very Hard", 1)])
+        self.assertEqual(chart_series(Recipe.objects.order_by("name"), "#1", max_points=2), [("Salad", 8), ("Stew", 90)])
+
+    @override_settings(RECIPE_CHART_WORKERS=0)
+    def test_search_links_svg_and_json(self):
+        response = self.client.post(reverse("recipes:recipe_search"), data={"chart_type": "#1"})
+        urls = response.context["chart_urls"]
+        self.assertContains(response, urls["svg"])
+        response = self.client.get(urls["json"])
+        self.assertEqual(response.json()["series"], [{"label": "Salad", "value": 8}])
+        self.assertIn("immutable", response["Cache-Control"])
+        response = self.client.get(urls["svg"])
+        self.assertEqual(response["Content-Type"], "image/svg+xml")
+        self.assertIn(b"<svg", response.content)
+
+
+class ResultsTableTests(TestCase):
+    def test_cells_are_escaped(self):
+        Recipe.objects.create(
+            name="<script>alert(1)</script>",
+            description="x",
+            ingredients="<b>salt</b>",
+            cooking_time=5,
+        )
+        html, count = render_results_table(result_rows(Recipe.objects.all()))
+        self.assertEqual(count, 1)
+        self.assertNotIn("<script>", html)
+        self.assertIn("&lt;script&gt;alert(1)&lt;/script&gt;", html)
+        self.assertIn("&lt;b&gt;salt&lt;/b&gt;", html)
+
+    def test_links_and_truncation(self):
+        recipe = Recipe.objects.create(
+            name="Long",
+            description="x",
+            ingredients=",".join(["ingredient"] * 20),
+            cooking_time=5,
+        )
+        html, _ = render_results_table(result_rows(Recipe.objects.all()))
+        self.assertIn(f'href="{recipe.get_absolute_url()}"', html)
+        self.assertIn(",ingredient,...</td>", html)
+
+    def test_empty_queryset(self):
+        self.assertEqual(render_results_table(result_rows(Recipe.objects.none())), (None, 0))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        # duplicate names make sure the id tie-breaker keeps pages stable
+        for name in ["Bread", "Apple Pie", "Curry", "Bread", "Dumplings", "Apple Pie", "Eclair"]:
+            Recipe.objects.create(name=name, description="x", ingredients="a", cooking_time=5)
+        self.expected = list(Recipe.objects.order_by("name", "pk"))
+
+    def walk_forward(self, per_page):
+        seen, cursor = [], None
+        while True:
+            page = paginate_keyset(Recipe.objects.all(), cursor, per_page)
+            seen.extend(page)
+            if not page.has_next():
+                return seen, page
+            cursor = page.next_cursor
+
+    def test_forward_walk_visits_every_row_once(self):
+        seen, last = self.walk_forward(per_page=3)
+        self.assertEqual(seen, self.expected)
+        self.assertTrue(last.has_previous())
+
+    def test_previous_returns_the_page_before(self):
+        first = paginate_keyset(Recipe.objects.all(), None, 3)
+        second = paginate_keyset(Recipe.objects.all(), first.next_cursor, 3)
+        back = paginate_keyset(Recipe.objects.all(), second.previous_cursor, 3)
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+        self.assertEqual(back.next_cursor, first.next_cursor)
+
+    def test_values_list_rows(self):
+        qs = Recipe.objects.values_list("pk", "name")
+        page = paginate_keyset(qs, None, 2, key=lambda row: (row[1], row[0]))
+        self.assertEqual(page.object_list, [(r.pk, r.name) for r in self.expected[:2]])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor("not-a-cursor")
+
+    def test_bounded_count(self):
+        self.assertEqual(bounded_count(Recipe.objects.all(), limit=100), (7, True))
+        self.assertEqual(bounded_count(Recipe.objects.all(), limit=5), (5, False))
+
+    def test_overview_is_paginated(self):
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        with mock.patch.object(RecipeListView, "paginate_by", 3):
+            url = reverse("recipes:recipes_overview")
+            response = self.client.get(url)
+            self.assertEqual(len(response.context["object_list"]), 3)
+            next_cursor = response.context["page_obj"].next_cursor
+            response = self.client.get(url, {"cursor": next_cursor})
+            self.assertEqual(list(response.context["object_list"]), self.expected[3:6])
+            self.assertEqual(self.client.get(url, {"cursor": "garbage"}).status_code, 404)
+
+    def test_search_is_paginated(self):
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        url = reverse("recipes:recipe_search")
+        with mock.patch("recipes.views.SEARCH_PAGE_SIZE", 3):
+            response = self.client.post(url, data={"max_cooking_time": 10})
+            self.assertContains(response, "Results: 7")
+            page = response.context["page"]
+            response = self.client.post(url, data={"max_cooking_time": 10, "cursor": page.next_cursor})
+        self.assertContains(response, "Curry")
+        self.assertNotContains(response, "Apple Pie")
+
+
+def make_image(width=800, height=600, fmt="JPEG"):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 40)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class RecipeImageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.category = Category.objects.create(name="Dinner", description="")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def add_recipe(self, image):
+        form = AddRecipeForm(
+            data={"name": "Lasagne", "description": "Layer.", "ingredients": "pasta,beef", "cooking_time": 60},
+            files={"pic": SimpleUploadedFile("lasagne.jpg", image, content_type="image/jpeg")},
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_render_derivatives_never_upscales(self):
+        derivatives = render_derivatives(make_image(500, 250))
+        self.assertEqual(sorted({(w, h) for _, w, h, _ in derivatives}), [(160, 80), (320, 160), (500, 250)])
+        self.assertEqual({fmt for fmt, *_ in derivatives}, {"webp", "jpeg"})
+        self.assertEqual(render_derivatives(b"not an image"), [])
+
+    def test_add_recipe_form_creates_derivatives(self):
+        recipe = self.add_recipe(make_image())
+        renditions = list(recipe.renditions.all())
+        self.assertEqual(len(renditions), 8)
+        jpeg_320 = recipe.renditions.get(format="jpeg", width=320)
+        self.assertEqual(jpeg_320.height, 240)
+        self.assertRegex(jpeg_320.image.name, r"^recipes/derivatives/lasagne\.[0-9a-f]{10}\.320w\.jpg$")
+
+    def test_recipes_sharing_a_picture_keep_their_own_files(self):
+        recipe = self.add_recipe(make_image())
+        other = Recipe.objects.create(name="Copy", description="x", ingredients="a", cooking_time=5, pic=recipe.pic.name)
+        digest = hashlib.sha256(make_image()).hexdigest()
+        save_derivatives(other, render_derivatives(make_image()), digest)
+        names = set(recipe.renditions.values_list("image", flat=True))
+        self.assertFalse(names & set(other.renditions.values_list("image", flat=True)))
+        other.renditions.get(format="jpeg", width=320).image.delete(save=False)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+    def test_picture_tag_emits_srcset(self):
+        recipe = self.add_recipe(make_image())
+        html = Template('{% load recipe_images %}{% recipe_picture recipe "120px" "recipe-thumb" %}').render(
+            Context({"recipe": recipe})
+        )
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("160w, ", html)
+        self.assertIn('width="320" height="240"', html)
+
+    def test_picture_tag_without_derivatives_uses_original(self):
+        recipe = Recipe.objects.create(name="Plain", description="x", ingredients="a", cooking_time=5)
+        html = Template('{% load recipe_images %}{% recipe_picture recipe "120px" %}').render(Context({"recipe": recipe}))
+        self.assertIn(f'src="{recipe.pic.url}"', html)
+        self.assertNotIn("srcset", html)
+
+    def test_backfill_command(self):
+        recipe = self.add_recipe(make_image(300, 300))
+        RecipeImage.objects.all().delete()
+        Recipe.objects.create(name="No file", description="x", ingredients="a", cooking_time=5, pic="recipes/gone.jpg")
+        # the default picture exists, but is left alone
+        placeholder = Recipe.objects.create(name="Placeholder", description="x", ingredients="a", cooking_time=5)
+        with open(os.path.join(settings.MEDIA_ROOT, placeholder.pic.name), "wb") as f:
+            f.write(make_image(300, 300))
+        out = StringIO()
+        call_command("backfill_images", workers=1, stdout=out)
+        self.assertEqual(recipe.renditions.count(), 4)
+        # the files left by the deleted rows are replaced, not renamed around
+        for rendition in recipe.renditions.all():
+            self.assertRegex(rendition.image.name, DERIVATIVE_NAME_RE)
+        self.assertEqual(placeholder.renditions.count(), 0)
+        self.assertIn("1 recipes, 1 skipped", out.getvalue())
+
+
+class PrecomputedFieldsTests(TestCase):
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            name="Toast",
+            description="Toast it.",
+            ingredients=" bread, butter ,",
+            cooking_time=5,
+        )
+
+    def test_save_stores_parsed_ingredients_and_difficulty(self):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredient_list, ["bread", "butter"])
+        self.assertEqual(self.recipe.ingredient_count, 2)
+        self.assertEqual(self.recipe.difficulty, "Easy")
+
+    def test_update_fields_save_refreshes_difficulty(self):
+        self.recipe.cooking_time = 45
+        self.recipe.save(update_fields=["cooking_time"])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.difficulty, "Very Hard")
+
+    def test_detail_view_uses_stored_values(self):
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        response = self.client.get(self.recipe.get_absolute_url())
+        self.assertEqual(response.context["ingredients_list"], ["bread", "butter"])
+        self.assertEqual(response.context["difficulty"], "Easy")
+
+    def test_search_filters_by_difficulty(self):
+        Recipe.objects.create(name="Roast", description="x", ingredients="beef", cooking_time=90)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        response = self.client.post(reverse("recipes:recipe_search"), data={"difficulty": "Very Hard"})
+        self.assertContains(response, "Roast")
+        self.assertNotContains(response, "Toast")
+
+    def test_recompute_command_fixes_stale_rows(self):
+        Recipe.objects.update(difficulty="", ingredient_count=0, ingredient_list=[])
+        out = StringIO()
+        call_command("recompute_difficulty", batch_size=1, stdout=out)
+        self.assertIn("1 of 1 recipes updated", out.getvalue())
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.difficulty, self.recipe.ingredient_count), ("Easy", 2))
+
+
+class VectorizedDifficultyTests(TestCase):
+    def test_matches_scalar_rules_on_every_boundary(self):
+        # every combination around the thresholds (10/20/30 min, 3/6/10 ingredients)
+        pairs = [(t, c) for t in range(0, 41) for c in range(0, 16)]
+        vectorized = classify_difficulties([t for t, _ in pairs], [c for _, c in pairs])
+        self.assertEqual(list(vectorized), [classify_difficulty(t, c) for t, c in pairs])
+
+    def test_matches_calculate_difficulty_on_random_recipes(self):
+        rng = random.Random(42)
+        recipes = [
+            Recipe(cooking_time=rng.randint(1, 200), ingredients=",".join("x" * rng.randint(0, 25)))
+            for _ in range(2000)
+        ]
+        vectorized = classify_difficulties(
+            [r.cooking_time for r in recipes],
+            [len([i for i in r.ingredients.split(",") if i]) for r in recipes],
+        )
+        self.assertEqual(list(vectorized), [r.calculate_difficulty() for r in recipes])
+
+    def test_empty_input(self):
+        self.assertEqual(len(classify_difficulties([], [])), 0)
+
+
+class ImportRecipesTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        Category.objects.create(name="Dinner")
+
+    def write(self, name, text):
+        path = f"{self.tmp}/{name}"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_csv_import_fills_precomputed_fields_and_index(self):
+        path = self.write("r.csv", (
+            "id,name,description,ingredients,cooking_time,category\n"
+            "a1,Toast,Crisp,\"bread,butter\",5,dinner\n"
+            "a2,Stew,Slow,\"beef,carrot,onion,potato\",90,Winter\n"
+        ))
+        call_command("import_recipes", path, batch_size=1, stdout=StringIO())
+
+        toast = Recipe.objects.get(external_id="a1")
+        self.assertEqual((toast.difficulty, toast.ingredient_count), ("Easy", 2))
+        self.assertEqual(toast.category.name, "Dinner")
+        self.assertEqual(Recipe.objects.get(external_id="a2").category.name, "Winter")
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(filter_by_ingredients(Recipe.objects.all(), "carrot").get().name, "Stew")
+
+    def test_rerun_is_idempotent(self):
+        path = self.write("r.jsonl", (
+            '{"name": "Toast", "description": "x", "ingredients": ["bread"], "cooking_time": 5}\n'
+            '{"name": "Soup", "description": "x", "ingredients": "leek", "cooking_time": 25}\n'
+        ))
+        call_command("import_recipes", path, stdout=StringIO())
+        out = StringIO()
+        call_command("import_recipes", path, stdout=out)
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertIn("0 created, 2 already present", out.getvalue())
+
+    def test_bad_rows_are_reported_not_fatal(self):
+        path = self.write("r.csv", (
+            "name,description,ingredients,cooking_time\n"
+            "Toast,x,bread,soon\n"
+            ",x,bread,5\n"
+            "Soup,x,leek,25\n"
+        ))
+        out, err = StringIO(), StringIO()
+        call_command("import_recipes", path, stdout=out, stderr=err)
+        self.assertEqual(list(Recipe.objects.values_list("name", flat=True)), ["Soup"])
+        self.assertIn("line 2: bad cooking_time", err.getvalue())
+        self.assertIn("line 3: missing name", err.getvalue())
+
+    def test_malformed_json_lines_are_row_errors(self):
+        path = self.write("r.jsonl", (
+            '{"name": "Toast", "description": "x", "ingredients": ["bread"], "cooking_time": 5}\n'
+            '{"name": "Soup", \n'
+            '["not", "an", "object"]\n'
+            '{"name": "Stew", "description": "x", "ingredients": "beef", "cooking_time": 90}\n'
+        ))
+        out, err = StringIO(), StringIO()
+        call_command("import_recipes", path, stdout=out, stderr=err)
+        self.assertEqual(sorted(Recipe.objects.values_list("name", flat=True)), ["Stew", "Toast"])
+        self.assertIn("line 2: invalid JSON", err.getvalue())
+        self.assertIn("line 3: not a JSON object", err.getvalue())
+        self.assertIn("2 rejected", out.getvalue())
+
+    def test_rolled_back_batch_removes_its_picture_copies(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with open(f"{self.tmp}/toast.jpg", "wb") as f:
+            f.write(make_image(40, 30))
+        path = self.write("r.csv", "name,description,ingredients,cooking_time,image\nToast,x,bread,5,toast.jpg\n")
+        with override_settings(MEDIA_ROOT=media), mock.patch("recipes.importer.index_recipes", side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                call_command("import_recipes", path, images=self.tmp, stdout=StringIO())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(media, "recipes")), [])
+
+    def test_rolled_back_batch_forgets_its_categories(self):
+        importer = RecipeImporter()
+        rows = [(1, {"name": "Stew", "description": "x", "ingredients": "beef", "cooking_time": 90, "category": "Winter"})]
+        with mock.patch("recipes.importer.index_recipes", side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                importer.run(rows)
+        self.assertFalse(Category.objects.filter(name="Winter").exists())
+        importer.run(rows)
+        self.assertEqual(Recipe.objects.get().category.name, "Winter")
+
+    def test_only_the_first_errors_are_kept(self):
+        path = self.write("r.csv", (
+            "name,description,ingredients,cooking_time\n"
+            "Toast,x,bread,soon\n"
+            ",x,bread,5\n"
+        ))
+        out, err = StringIO(), StringIO()
+        with mock.patch("recipes.importer.MAX_ERRORS", 1):
+            call_command("import_recipes", path, stdout=out, stderr=err)
+        self.assertEqual(err.getvalue().splitlines(), ["line 2: bad cooking_time 'soon'"])
+        self.assertIn("2 rejected", out.getvalue())
+
+    def test_resume_skips_committed_lines(self):
+        path = self.write("r.csv", (
+            "name,description,ingredients,cooking_time\n"
+            "Toast,x,bread,5\n"
+            "Soup,x,leek,25\n"
+        ))
+        # pretend an earlier run committed line 2 and then died
+        self.write("r.csv.progress", "2")
+        call_command("import_recipes", path, resume=True, stdout=StringIO())
+        self.assertEqual(list(Recipe.objects.values_list("name", flat=True)), ["Soup"])
+        # finished: a later run starts from the top again
+        self.assertFalse(os.path.exists(path + ".progress"))
+
+    def test_attaches_images_from_directory(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with open(f"{self.tmp}/toast.jpg", "wb") as f:
+            f.write(make_image(40, 30))
+        path = self.write("r.csv", "name,description,ingredients,cooking_time,image\nToast,x,bread,5,toast.jpg\n")
+        with override_settings(MEDIA_ROOT=media):
+            call_command("import_recipes", path, images=self.tmp, stdout=StringIO())
+        self.assertEqual(Recipe.objects.get().pic.name, "recipes/toast.jpg")
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Dinner")
+        Recipe.objects.create(name="Toast", description="Crisp", ingredients="bread,butter", cooking_time=5, category=category)
+        Recipe.objects.create(name="Stew", description='Say "slow"', ingredients="beef,carrot", cooking_time=90)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def export(self, fmt, **params):
+        response = self.client.get(reverse("recipes:recipe_export", args=[fmt]), params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_csv_streams_every_recipe(self):
+        response, body = self.export("csv")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="recipes.csv"')
+        rows = list(csv.DictReader(StringIO(body)))
+        self.assertEqual([r["name"] for r in rows], ["Stew", "Toast"])
+        self.assertEqual(rows[0]["description"], 'Say "slow"')
+        self.assertEqual(rows[1]["category"], "Dinner")
+
+    def test_jsonl_uses_search_filters(self):
+        _, body = self.export("jsonl", ingredient="carrot")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]["name"], rows[0]["difficulty"]), ("Stew", "Very Hard"))
+
+    def test_columns_chunks(self):
+        _, body = self.export("columns")
+        chunk = json.loads(body)
+        self.assertEqual(chunk["name"], ["Stew", "Toast"])
+        self.assertEqual(chunk["cooking_time"], [90, 5])
+
+    def test_empty_csv_has_header(self):
+        _, body = self.export("csv", recipe_name="nothing")
+        self.assertEqual(body.strip(), "id,name,category,cooking_time,difficulty,ingredients,description")
+
+    def test_unknown_format_and_bad_filters(self):
+        self.assertEqual(self.client.get(reverse("recipes:recipe_export", args=["xml"])).status_code, 404)
+        response = self.client.get(reverse("recipes:recipe_export", args=["csv"]), {"max_cooking_time": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_page_links_export_with_filters(self):
+        response = self.client.post(reverse("recipes:recipe_search"), data={"recipe_name": "toast"})
+        self.assertContains(response, reverse("recipes:recipe_export", args=["csv"]) + "?recipe_name=toast")
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "detail-tests"},
+    "sessions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "detail-tests-sessions"},
+})
+class DetailCacheTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Dinner")
+        self.recipe = Recipe.objects.create(
+            name="Toast", description="Crisp", ingredients="bread,butter", cooking_time=5, category=self.category
+        )
+        self.url = reverse("recipes:recipe_detail", args=[self.recipe.pk])
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def test_second_hit_skips_fragment_rendering(self):
+        self.client.get(self.url)
+        with mock.patch("recipes.detail_cache.render_to_string") as render:
+            response = self.client.get(self.url)
+        render.assert_not_called()
+        self.assertContains(response, "Toast")
+
+    def test_conditional_get_returns_304(self):
+        response = self.client.get(self.url)
+        self.assertIn("no-cache", response["Cache-Control"])
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # staff get the Statistics link in the navigation
+        cook = User.objects.get(username="cook")
+        cook.is_staff = True
+        cook.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, reverse("recipes:recipe_stats"))
+
+    def test_recipe_save_invalidates(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.recipe.name = "French Toast"
+        self.recipe.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "French Toast")
+
+    def test_category_change_invalidates(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.category.name = "Breakfast"
+        self.category.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Breakfast")
+        # no signal, as when another worker renamed it: the key still changes
+        Category.objects.filter(pk=self.category.pk).update(name="Brunch")
+        self.assertContains(self.client.get(self.url), "Brunch")
+        self.category.delete()
+        self.assertNotContains(self.client.get(self.url), "Brunch")
+
+    def test_bulk_update_needs_explicit_invalidation(self):
+        self.client.get(self.url)
+        # queryset.update() skips post_save and updated_at: the cached page stays
+        Recipe.objects.filter(pk=self.recipe.pk).update(description="Changed")
+        self.assertContains(self.client.get(self.url), "Crisp")
+        # bulk writers such as recompute_difficulty drop the fragments themselves
+        call_command("recompute_difficulty", all=True, stdout=StringIO())
+        self.assertContains(self.client.get(self.url), "Changed")
+
+
+class TimingTests(TestCase):
+    def setUp(self):
+        Recipe.objects.create(name="Toast", description="x", ingredients="bread", cooking_time=5)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("recipes:recipes_overview"))
+        metrics = {part.split(";")[0]: part for part in response["Server-Timing"].split(", ")}
+        self.assertEqual(set(metrics), {"db", "tpl", "total"})
+        self.assertRegex(metrics["db"], r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    def test_chart_time_is_reported(self):
+        with override_settings(RECIPE_CHART_WORKERS=0, RECIPE_CHART_CACHE_ALIAS=None):
+            response = self.client.post(reverse("recipes:recipe_search"), data={"chart_type": "#1"})
+        self.assertIn("chart;dur=", response["Server-Timing"])
+
+    def test_structured_log_line(self):
+        with self.assertLogs("recipes.timing", "INFO") as logs:
+            self.client.get(reverse("recipes:recipes_overview"))
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((line["path"], line["status"]), ("/recipes/", 200))
+        self.assertGreater(line["queries"], 0)
+
+    @override_settings(RECIPE_SERVER_TIMING=False)
+    def test_header_can_be_turned_off(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("recipes:recipes_overview")))
+
+
+class QueryCountMixin:
+    """
+    assertNoNPlusOne: the query count of a request must not depend on how
+    many recipes it shows. Catches a missing select_related/prefetch_related
+    or a per-row lookup in a template tag.
+    """
+
+    def count_queries(self, fn):
+        # session changes left by earlier logins would be written inside fn
+        flush_sessions()
+        with CaptureQueriesContext(connection) as queries:
+            response = fn()
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return len(queries)
+
+    def assertNoNPlusOne(self, fn, add_recipes, more=5):
+        before = self.count_queries(fn)
+        add_recipes(more)
+        after = self.count_queries(fn)
+        self.assertEqual(
+            before, after, f"{after - before} more queries after adding {more} recipes (N+1?)"
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class QueryCountTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Dinner")
+        self.add_recipes(2)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def add_recipes(self, count):
+        for _ in range(count):
+            recipe = Recipe.objects.create(
+                name=f"Soup {Recipe.objects.count()}", description="x",
+                ingredients="leek,potato", cooking_time=25, category=self.category,
+            )
+            RecipeImage.objects.create(recipe=recipe, image="recipes/derivatives/x.webp", format="webp", width=320, height=240)
+
+    def test_recipe_list(self):
+        self.assertNoNPlusOne(lambda: self.client.get(reverse("recipes:recipes_overview")), self.add_recipes)
+
+    def test_search_results(self):
+        search = lambda: self.client.post(reverse("recipes:recipe_search"), data={"ingredient": "leek"})
+        self.assertNoNPlusOne(search, self.add_recipes)
+
+    def test_keyword_search(self):
+        search = lambda: self.client.post(reverse("recipes:recipe_search"), data={"keywords": "soup"})
+        self.assertNoNPlusOne(search, self.add_recipes)
+
+    def test_export(self):
+        export = lambda: self.client.get(reverse("recipes:recipe_export", args=["jsonl"]))
+        self.assertNoNPlusOne(export, self.add_recipes)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_seed_recipes(self):
+        call_command("seed_recipes", count=30, batch_size=7, stdout=StringIO())
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(Recipe.objects.filter(category__isnull=True).count(), 0)
+        self.assertEqual(Recipe.objects.exclude(difficulty="").count(), 30)
+        # bulk inserts still land in the ingredient index
+        self.assertEqual(RecipeIngredient.objects.values("recipe").distinct().count(), 30)
+
+    def test_seed_is_repeatable(self):
+        call_command("seed_recipes", count=5, seed=3, stdout=StringIO())
+        first = list(Recipe.objects.order_by("pk").values_list("name", "ingredients"))
+        Recipe.objects.all().delete()
+        call_command("seed_recipes", count=5, seed=3, stdout=StringIO())
+        self.assertEqual(list(Recipe.objects.order_by("pk").values_list("name", "ingredients")), first)
+
+    def test_bench_views_reports_json(self):
+        out = StringIO()
+        call_command(
+            "bench_views", seed=20, requests=3, warmup=0,
+            scenario=["overview", "detail", "search", "add"], stdout=out, stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report["scenarios"]), {"overview", "detail", "search", "add"})
+        for stats in report["scenarios"].values():
+            self.assertEqual((stats["runs"], stats["errors"]), (3, 0))
+            self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+            self.assertGreater(stats["throughput_rps"], 0)
+            self.assertGreater(stats["queries_per_request"], 0)
+        self.assertGreater(report["peak_rss_kib"], 0)
+        self.assertGreater(report["cold_start"]["ready_ms"], 0)
+        # seeded and added recipes are rolled back
+        self.assertEqual(Recipe.objects.count(), 0)
+
+    def test_bench_imports_reports_no_heavy_modules(self):
+        out = StringIO()
+        call_command("bench_imports", top=3, stdout=out)
+        report = json.loads(out.getvalue())
+        # matplotlib, pandas and numpy load on first use, not at start-up
+        self.assertEqual(report["cold_start"]["heavy_modules"], [])
+        self.assertIn("django", report["packages_ms"])
+        self.assertEqual(len(report["slowest_modules"]), 3)
+
+
+@override_settings(RECIPE_ASYNC_VIEWS=True)
+class AsyncViewTests(TestCase):
+    """The async views served through the ASGI request path."""
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(name="Toast", description="Crisp", ingredients="bread,butter", cooking_time=5)
+        Recipe.objects.create(name="Stew", description="Slow", ingredients="beef,carrot", cooking_time=90)
+        self.async_client.force_login(User.objects.create_user(username="cook", password="testpass123"))
+        # the async client closes responses in another thread, whose connection
+        # can't write while this test's transaction is open
+        flush_sessions()
+
+    def test_served_only_when_turned_on(self):
+        self.assertIs(resolve(reverse("recipes:recipe_search")).func, arecipe_search)
+        with override_settings(RECIPE_ASYNC_VIEWS=False):
+            self.assertIs(resolve(reverse("recipes:recipe_search")).func, recipe_search)
+
+    async def test_recipe_list(self):
+        response = await self.async_client.get(reverse("recipes:recipes_overview"))
+        self.assertContains(response, "Toast")
+        # ORM calls run in a worker thread and are still counted
+        self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+
+    async def test_detail_and_conditional_get(self):
+        url = reverse("recipes:recipe_detail", args=[self.recipe.pk])
+        response = await self.async_client.get(url)
+        self.assertContains(response, "Crisp")
+        response = await self.async_client.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse("recipes:recipe_detail", args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(RECIPE_CHART_WORKERS=0, RECIPE_CHART_CACHE_ALIAS=None)
+    async def test_search_with_chart(self):
+        response = await self.async_client.post(
+            reverse("recipes:recipe_search"), {"keywords": "toast", "chart_type": "#2"}
+        )
+        self.assertContains(response, "Results: 1")
+        chart_url = response.context["chart_url"]
+        response = await self.async_client.get(chart_url)
+        self.assertEqual(response["Content-Type"], "image/png")
+
+    async def test_export_streams_asynchronously(self):
+        response = await self.async_client.get(reverse("recipes:recipe_export", args=["jsonl"]))
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 2)
+
+    async def test_login_required(self):
+        response = await AsyncClient().get(reverse("recipes:recipe_search"))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("/login/", response["Location"])
+
+    async def test_chart_wait_timeout_leaves_render_running(self):
+        renderer = ChartRenderer(ChartCache(LRUChartStore()), max_workers=1)
+        future = Future()
+        renderer._pending["k"] = (future, time.monotonic())
+        self.assertIsNone(await renderer.await_chart("k", timeout=0.01))
+        self.assertFalse(future.cancelled())
+        renderer.cache.store.set("k", b"png")
+        future.set_result(b"png")
+        self.assertEqual(await renderer.await_chart("k", timeout=1), b"png")
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Dinner")
+        self.toast = Recipe.objects.create(name="Toast", description="Crisp", ingredients="bread,butter", cooking_time=5, category=category)
+        Recipe.objects.create(name="Stew", description="Slow", ingredients="beef,carrot", cooking_time=90)
+        Recipe.objects.create(name="Soup", description="Hot", ingredients="carrot,leek", cooking_time=30)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def get(self, name, args=(), **params):
+        return self.client.get(reverse(f"recipes:{name}", args=args), params)
+
+    def test_list_pages_with_cursor(self):
+        first = self.get("api_recipe_list", limit=2).json()
+        self.assertEqual([r["name"] for r in first["results"]], ["Soup", "Stew"])
+        self.assertIsNone(first["previous_cursor"])
+        second = self.get("api_recipe_list", limit=2, cursor=first["next_cursor"]).json()
+        self.assertEqual([r["name"] for r in second["results"]], ["Toast"])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_detail_fields(self):
+        data = self.get("api_recipe_detail", [self.toast.pk]).json()
+        self.assertEqual(set(data), set(API_FIELDS))
+        self.assertEqual((data["category"], data["ingredients"]), ("Dinner", ["bread", "butter"]))
+        self.assertEqual(data["pic"], "/media/no_picture.jpg")
+        data = self.get("api_recipe_detail", [self.toast.pk], fields="cooking_time,name").json()
+        self.assertEqual(data, {"cooking_time": 5, "name": "Toast"})
+
+    def test_search_filters_and_count(self):
+        data = self.get("api_recipe_search", ingredient="carrot", fields="name", limit=1).json()
+        self.assertEqual(data["results"], [{"name": "Soup"}])
+        self.assertEqual((data["count"], data["count_exact"]), (2, True))
+        data = self.get("api_recipe_search", keywords="crisp", fields="id").json()
+        self.assertEqual(data["results"], [{"id": self.toast.pk}])
+
+    def test_conditional_get(self):
+        url = reverse("recipes:api_recipe_detail", args=[self.toast.pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.toast.cooking_time = 6
+        self.toast.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_errors(self):
+        self.assertEqual(self.get("api_recipe_list", fields="name,secret").status_code, 400)
+        self.assertEqual(self.get("api_recipe_list", cursor="bogus").status_code, 400)
+        self.assertEqual(self.get("api_recipe_list", limit=0).status_code, 400)
+        self.assertEqual(self.get("api_recipe_search", max_cooking_time="x").status_code, 400)
+        self.assertEqual(self.get("api_recipe_detail", [0]).status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.get("api_recipe_list").status_code, 401)
+
+
+@override_settings(RECIPE_SIMILAR_IN_BACKGROUND=False)
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        reset_autocomplete()
+        self.addCleanup(reset_autocomplete)
+        self.soup = Recipe.objects.create(name="Creamy Tomato Soup", description="-", ingredients="tomato, cream", cooking_time=20)
+        Recipe.objects.create(name="Tomato Salad", description="-", ingredients="tomato, olive oil", cooking_time=5)
+        Recipe.objects.create(name="Toast", description="-", ingredients="bread, olive oil, tomato", cooking_time=5)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def suggest(self, query, kind):
+        return get_autocomplete().suggest(query, (kind,))[kind]
+
+    def test_word_prefixes_ranked_by_count(self):
+        self.assertEqual(self.suggest("tom", "name"), [("Creamy Tomato Soup", 1), ("Tomato Salad", 1)])
+        self.assertEqual(self.suggest("o", "ingredient"), [("olive oil", 2)])
+        self.assertEqual(self.suggest("  CREAMY  t", "name"), [("Creamy Tomato Soup", 1)])
+        self.assertEqual(self.suggest("", "name"), [])
+
+    def test_wide_and_narrow_ranges_agree(self):
+        index = PrefixIndex([(f"dish {n:03}", n % 7 + 1) for n in range(300)])
+        expected = [(f"dish {n:03}", 7) for n in (6, 13, 20, 27, 34)]
+        # walks the ranked ids / ranks the whole range
+        self.assertEqual(index.top("dish", 5), expected)
+        self.assertEqual(index.top("dish", 300)[:5], expected)
+        index.discard("dish 000")
+        index.add("dish 013", "Dish 13")
+        index.add("dish 300", "Dish 300")
+        self.assertEqual(index.top("dish", 1), [("dish 013", 8)])
+        self.assertEqual(index.top("dish 30", 2), [("Dish 300", 1)])
+        self.assertEqual(index.top("dish 000", 1), [])
+
+    def test_follows_saves_and_deletes(self):
+        get_autocomplete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup.name = "Creamy Pumpkin Soup"
+            self.soup.ingredients = "pumpkin, cream"
+            self.soup.save()
+        self.assertEqual(self.suggest("pum", "name"), [("Creamy Pumpkin Soup", 1)])
+        self.assertEqual(self.suggest("tomato", "ingredient"), [("tomato", 2)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soup.delete()
+        self.assertEqual(self.suggest("pum", "ingredient"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            insert_recipes(3)
+        self.assertEqual(len(get_autocomplete().names), 5)
+
+    def test_replays_changes_logged_by_other_processes(self):
+        index = get_autocomplete()
+        log_changes([
+            (self.soup.pk, ("Creamy Tomato Soup", "tomato, cream"), ("Pumpkin Soup", "pumpkin")),
+            (10_000, None, ("Pumpkin Pie", "pumpkin, sugar")),
+        ])
+        self.assertEqual(self.suggest("pum", "name"), [])
+        index.checked = 0
+        with mock.patch("recipes.autocomplete.threading.Thread") as thread:
+            self.assertIs(get_autocomplete(), index)
+        thread.assert_not_called()
+        self.assertEqual(self.suggest("pum", "name"), [("Pumpkin Soup", 1), ("Pumpkin Pie", 1)])
+        self.assertEqual(self.suggest("pum", "ingredient"), [("pumpkin", 2)])
+        self.assertEqual(self.suggest("cream", "ingredient"), [])
+        # read once
+        index.checked = 0
+        get_autocomplete()
+        self.assertEqual(self.suggest("pum", "ingredient"), [("pumpkin", 2)])
+
+    @override_settings(RECIPE_AUTOCOMPLETE_REPLAY_LIMIT=1)
+    def test_rebuilds_when_too_many_changes_wait(self):
+        index = get_autocomplete()
+        log_changes([(10_000 + n, None, (f"Pie {n}", "flour")) for n in range(2)])
+        index.checked = 0
+        with mock.patch("recipes.autocomplete.threading.Thread") as thread:
+            self.assertIs(get_autocomplete(), index)
+        thread.return_value.start.assert_called_once()
+
+    def test_endpoint(self):
+        response = self.client.get(reverse("recipes:api_autocomplete"), {"q": "to", "limit": 1})
+        self.assertEqual(response.json(), {
+            "name": [{"text": "Creamy Tomato Soup", "count": 1}],
+            "ingredient": [{"text": "tomato", "count": 3}],
+        })
+        response = self.client.get(reverse("recipes:api_autocomplete"), {"q": "to", "kind": "other"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "facet-tests"},
+    "sessions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "facet-tests-sessions"},
+})
+class FacetTests(TestCase):
+    def setUp(self):
+        self.dinner = Category.objects.create(name="Dinner")
+        lunch = Category.objects.create(name="Lunch")
+        Recipe.objects.create(name="Toast", description="Crisp", ingredients="bread,butter", cooking_time=5, category=lunch)
+        Recipe.objects.create(name="Tomato Stew", description="Slow", ingredients="beef,carrot,tomato", cooking_time=90, category=self.dinner)
+        Recipe.objects.create(name="Tomato Soup", description="Hot", ingredients="tomato,cream", cooking_time=25, category=self.dinner)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def test_counts_per_facet(self):
+        facets = facet_counts(Recipe.objects.all())
+        self.assertEqual(facets.categories, [(self.dinner.pk, "Dinner", 2), (self.dinner.pk + 1, "Lunch", 1)])
+        self.assertEqual(facets.difficulties, [("Easy", "Easy", 1), ("Hard", "Hard", 1), ("Very Hard", "Very Hard", 1)])
+        self.assertEqual([(key, count) for key, _, count in facets.time_buckets], [("quick", 1), ("short", 1), ("long", 1)])
+        self.assertTrue(facets.exact)
+
+    def test_scan_limit_gives_lower_bounds(self):
+        facets = facet_counts(Recipe.objects.all(), limit=1)
+        self.assertFalse(facets.exact)
+        self.assertEqual(sum(count for _, _, count in facets.time_buckets), 2)
+
+    def test_query_budget(self):
+        slow = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 100000000) SELECT count(*) FROM n"
+        with self.assertRaises(OperationalError), query_budget(10), connection.cursor() as cursor:
+            cursor.execute(slow)
+        with mock.patch("recipes.facets.query_budget", side_effect=OperationalError):
+            self.assertIsNone(facet_counts(Recipe.objects.all()))
+
+    def test_picking_a_facet_reuses_text_matches(self):
+        url = reverse("recipes:recipe_search")
+        with mock.patch("recipes.forms.search_recipes", wraps=search_recipes) as search:
+            response = self.client.post(url, {"keywords": "tomato"})
+            self.assertContains(response, 'name="category" value="%d"' % self.dinner.pk)
+            response = self.client.post(url, {"keywords": "tomato", "time_bucket": "short"})
+        self.assertEqual(search.call_count, 1)
+        self.assertContains(response, "Tomato Soup")
+        self.assertNotContains(response, "Tomato Stew")
+
+        self.client.post(url, {"recipe_name": "tomato"})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"recipe_name": "tomato", "category": self.dinner.pk, "difficulty": "Hard"})
+        self.assertEqual(response.context["results_count"], 1)
+        self.assertFalse([q for q in queries if "LIKE" in q["sql"]])
+
+    def test_writes_invalidate_matches(self):
+        url = reverse("recipes:recipe_search")
+        self.client.post(url, {"recipe_name": "soup"})
+        pea_soup = Recipe.objects.create(name="Pea Soup", description="Green", ingredients="peas", cooking_time=30)
+        self.assertContains(self.client.post(url, {"recipe_name": "soup"}), "Pea Soup")
+        # the key follows the database, not a signal in this process
+        self.assertNotContains(self.client.post(url, {"keywords": "minted"}), "Pea Soup")
+        Recipe.objects.filter(pk=pea_soup.pk).update(description="Minted", updated_at=timezone.now())
+        self.assertContains(self.client.post(url, {"keywords": "minted"}), "Pea Soup")
+        pea_soup.delete()
+        self.assertEqual(self.client.post(url, {"recipe_name": "soup"}).context["results_count"], 1)
+
+
+@override_settings(RECIPE_SIMILAR_COUNT=2, RECIPE_SIMILAR_IN_BACKGROUND=False)
+class SimilarRecipeTests(TestCase):
+    def setUp(self):
+        self.soup = Recipe.objects.create(name="Soup", description="d", ingredients="tomato, onion, garlic", cooking_time=30)
+        self.sauce = Recipe.objects.create(name="Sauce", description="d", ingredients="tomato, garlic, basil", cooking_time=20)
+        self.salad = Recipe.objects.create(name="Salad", description="d", ingredients="tomato, lettuce", cooking_time=5)
+        self.cake = Recipe.objects.create(name="Cake", description="d", ingredients="flour, sugar", cooking_time=50)
+
+    def neighbours(self):
+        return {
+            recipe_id: [(similar_id, round(score, 3)) for similar_id, score in
+                        SimilarRecipe.objects.filter(recipe_id=recipe_id).order_by("-score", "similar_id").values_list("similar_id", "score")]
+            for recipe_id in Recipe.objects.values_list("pk", flat=True)
+        }
+
+    def test_rebuild_keeps_top_jaccard_matches(self):
+        self.assertEqual(rebuild_similar(workers=1), 4)
+        self.assertEqual(self.neighbours(), {
+            self.soup.pk: [(self.sauce.pk, 0.5), (self.salad.pk, 0.25)],
+            self.sauce.pk: [(self.soup.pk, 0.5), (self.salad.pk, 0.25)],
+            self.salad.pk: [(self.soup.pk, 0.25), (self.sauce.pk, 0.25)],
+            # nothing shared, nothing listed
+            self.cake.pk: [],
+        })
+
+    def test_process_pool_matches_single_process(self):
+        rebuild_similar(workers=1)
+        expected = self.neighbours()
+        SimilarRecipe.objects.all().delete()
+        rebuild_similar(workers=2, slice_size=1)
+        self.assertEqual(self.neighbours(), expected)
+
+    def test_saves_update_lists_incrementally(self):
+        rebuild_similar(workers=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            pasta = Recipe.objects.create(name="Pasta", description="d", ingredients="tomato, garlic, onion, basil", cooking_time=15)
+        incremental = self.neighbours()
+        rebuild_similar(workers=1)
+        self.assertEqual(incremental, self.neighbours())
+        self.assertIn(pasta.pk, dict(incremental[self.soup.pk]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salad.ingredients = "flour, sugar, eggs"
+            self.salad.save()
+        self.assertEqual(self.neighbours()[self.cake.pk], [(self.salad.pk, 0.667)])
+        self.assertNotIn(self.salad.pk, dict(self.neighbours()[self.soup.pk]))
+
+    @override_settings(RECIPE_SIMILAR_COUNT=1)
+    def test_deletes_refill_the_lists_they_shortened(self):
+        rebuild_similar(workers=1)
+        self.assertEqual(self.neighbours()[self.soup.pk], [(self.sauce.pk, 0.5)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sauce.delete()
+        self.assertEqual(self.neighbours()[self.soup.pk], [(self.salad.pk, 0.25)])
+        self.assertEqual(self.neighbours()[self.salad.pk], [(self.soup.pk, 0.25)])
+
+    def test_detail_page_lists_similar_recipes(self):
+        rebuild_similar(workers=1)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        url = reverse("recipes:recipe_detail", args=[self.soup.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, reverse("recipes:recipe_detail", args=[self.sauce.pk]))
+        self.assertEqual(len([q for q in queries if "recipes_similarrecipe" in q["sql"]]), 1)
+
+        # lists rewritten elsewhere (another worker, rebuild_similar) show
+        # up without any invalidation in this process
+        SimilarRecipe.objects.filter(recipe_id=self.soup.pk, similar_id=self.salad.pk).delete()
+        self.assertNotContains(self.client.get(url), reverse("recipes:recipe_detail", args=[self.salad.pk]))
+        # deleting a listed recipe drops it from the cached page
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sauce.delete()
+        self.assertNotContains(self.client.get(url), "Sauce")
+
+
+@override_settings(RECIPE_SIMILAR_IN_BACKGROUND=False)
+class PantrySearchTests(TestCase):
+    def setUp(self):
+        reset_pantry_index()
+        self.addCleanup(reset_pantry_index)
+        self.omelette = Recipe.objects.create(name="Omelette", description="d", ingredients="eggs, butter", cooking_time=10)
+        self.pancakes = Recipe.objects.create(name="Pancakes", description="d", ingredients="eggs, milk, flour, butter", cooking_time=20)
+        self.cake = Recipe.objects.create(name="Cake", description="d", ingredients="eggs, flour, sugar, butter, cocoa", cooking_time=60)
+        Recipe.objects.create(name="Stew", description="d", ingredients="beef, carrot, onion", cooking_time=120)
+        User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+
+    def search(self, **data):
+        response = self.client.post(reverse("recipes:recipe_search"), data=data)
+        content = response.content.decode()
+        names = [name for name in ("Omelette", "Pancakes", "Cake", "Stew") if name in content]
+        return sorted(names, key=content.index)
+
+    def test_ranked_by_missing_ingredients(self):
+        self.assertEqual(self.search(pantry="Eggs, butter, flour"), ["Omelette", "Pancakes", "Cake"])
+        self.assertEqual(self.search(pantry="eggs, butter, flour", max_missing=1), ["Omelette", "Pancakes"])
+        self.assertEqual(self.search(pantry="eggs, butter, flour", max_cooking_time=30), ["Omelette", "Pancakes"])
+        # prefix terms as in the ingredient filter
+        self.assertEqual(self.search(pantry="egg*\nbutter", max_missing=0), ["Omelette"])
+        self.assertEqual(self.search(pantry="saffron"), [])
+
+    def test_matches_brute_force_with_sparse_ingredients_and_updates(self):
+        rng = random.Random(0)
+        # 0-9 common, 100-299 rare (kept as row arrays)
+        def ingredients():
+            return {rng.randrange(10) for _ in range(rng.randint(1, 6))} | {100 + rng.randrange(200) for _ in range(rng.randint(0, 2))}
+
+        recipes = {pk: ingredients() for pk in range(1, 400)}
+        links = [(pk, ingredient) for pk in sorted(recipes) for ingredient in sorted(recipes[pk])]
+        counts = {}
+        for _, ingredient in links:
+            counts[ingredient] = counts.get(ingredient, 0) + 1
+        index = PantryIndex(links, len(recipes), counts)
+        self.assertTrue(index.sparse)
+        for pk in rng.sample(sorted(recipes), 60):
+            recipes[pk] = ingredients()
+            index.put(pk, recipes[pk])
+        index.discard(1)
+        del recipes[1]
+
+        for _ in range(50):
+            pantry = {*rng.sample(range(10), rng.randint(1, 8)), *rng.sample(range(100, 300), rng.randint(0, 60))}
+            expected = [[], [], []]
+            for pk, ingredients in sorted(recipes.items(), key=lambda item: index.rows[item[0]]):
+                missing = len(ingredients - pantry)
+                if missing <= 2 and ingredients & pantry:
+                    expected[missing].append(pk)
+            self.assertEqual(index.match(pantry, 2, 1000), ([len(pks) for pks in expected], sum(expected, [])))
+
+    def test_follows_saves_and_deletes(self):
+        get_pantry_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.omelette.ingredients = "eggs, butter, chives"
+            self.omelette.save()
+            Recipe.objects.create(name="Scrambled Eggs", description="d", ingredients="eggs, butter", cooking_time=5)
+            self.cake.delete()
+        self.assertEqual(self.search(pantry="eggs, butter", max_missing=1), ["Omelette"])
+        self.assertContains(self.client.post(reverse("recipes:recipe_search"), {"pantry": "eggs, butter"}), "Scrambled Eggs")
+
+    def test_replays_changes_made_by_other_processes(self):
+        index = get_pantry_index()
+        # commit callbacks don't run here: as if another process saved these
+        self.omelette.ingredients = "eggs, chives, parsley"
+        self.omelette.save()
+        Recipe.objects.create(name="Scrambled Eggs", description="d", ingredients="eggs, butter", cooking_time=5)
+        self.assertEqual(self.search(pantry="eggs, butter", max_missing=1), ["Omelette"])
+        index.checked = 0
+        with mock.patch("recipes.pantry.threading.Thread") as thread:
+            self.assertIs(get_pantry_index(), index)
+        thread.assert_not_called()
+        response = self.client.post(reverse("recipes:recipe_search"), {"pantry": "eggs, butter", "max_missing": 1})
+        self.assertContains(response, "Scrambled Eggs")
+        self.assertNotContains(response, "Omelette")
+
+    def test_api_search(self):
+        response = self.client.get(reverse("recipes:api_recipe_search"), {"pantry": "eggs, butter, milk", "max_missing": 1, "fields": "name"})
+        self.assertEqual(response.json()["results"], [{"name": "Omelette"}, {"name": "Pancakes"}])
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "session-tests"},
+        "sessions": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "session-tests-sessions"},
+    },
+    SESSION_ENGINE="recipes.sessions",
+    SESSION_CACHE_ALIAS="sessions",
+    RECIPE_USER_CACHE_ALIAS="sessions",
+)
+class CachedSessionTests(TestCase):
+    def setUp(self):
+        # left by logins in other tests
+        flush_sessions()
+        self.user = User.objects.create_user(username="cook", password="testpass123")
+        self.client.login(username="cook", password="testpass123")
+        self.url = reverse("recipes:recipes_overview")
+
+    def tearDown(self):
+        flush_sessions()
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        return [q["sql"] for q in queries if "django_session" in q["sql"] or "auth_user" in q["sql"]]
+
+    def test_logged_in_request_reads_no_session_or_user(self):
+        # login saved the user (last_login); its invalidation marker expires
+        caches["sessions"].delete(user_cache_key(self.user.pk))
+        self.client.get(self.url)
+        self.assertEqual(self.auth_queries(), [])
+
+    def test_logout_ends_the_session_everywhere(self):
+        self.client.get(self.url)
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.client.get(reverse("logout"))
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+        # replaying the old cookie
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_password_change_logs_out_other_sessions(self):
+        other = Client()
+        other.login(username="cook", password="testpass123")
+        other.get(self.url)
+        self.user.set_password("newpass456")
+        self.user.save()
+        self.assertEqual(other.get(self.url).status_code, 302)
+        self.assertTrue(self.client.login(username="cook", password="newpass456"))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_activity_reaches_the_database_later(self):
+        session = SessionStore()
+        session["last_activity"] = 1
+        session.create()
+        session["last_activity"] = 2
+        session.save()
+        stored = lambda: Session.objects.get(session_key=session.session_key).get_decoded()["last_activity"]
+        self.assertEqual(stored(), 1)
+        self.assertEqual(SessionStore(session.session_key)["last_activity"], 2)
+        flush_sessions()
+        self.assertEqual(stored(), 2)
+
+    def test_other_changes_are_written_at_once(self):
+        session = SessionStore()
+        session["last_activity"] = 1
+        session.create()
+        session["last_activity"] = 2
+        session.save()
+        loaded = SessionStore(session.session_key)
+        loaded["step"] = 1
+        loaded.save()
+        self.assertEqual(Session.objects.get(session_key=session.session_key).get_decoded(), {"last_activity": 2, "step": 1})
+        self.assertEqual(flush_sessions(), 0)
+
+    def test_login_is_written_at_once(self):
+        client = Client()
+        # an anonymous session already in the database
+        session = client.session
+        session["last_activity"] = 1
+        session.save()
+        client.post(reverse("login"), {"username": "cook", "password": "testpass123"})
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertEqual(Session.objects.get(session_key=session_key).get_decoded()["_auth_user_id"], str(self.user.pk))
+
+    def test_model_backend_sessions_stay_logged_in(self):
+        session = self.client.session
+        session["_auth_user_backend"] = "django.contrib.auth.backends.ModelBackend"
+        session.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_pending_change_to_a_deleted_session_is_dropped(self):
+        session = SessionStore()
+        session["last_activity"] = 1
+        session.create()
+        session["last_activity"] = 2
+        session.save()
+        Session.objects.filter(session_key=session.session_key).delete()
+        flush_sessions()
+        self.assertFalse(Session.objects.filter(session_key=session.session_key).exists())
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+
+    @override_settings(RECIPE_SESSION_WRITE_DELAY=0)
+    def test_write_through(self):
+        flush_sessions()
+        session = SessionStore()
+        session["step"] = 1
+        session.create()
+        session["step"] = 2
+        session.save()
+        self.assertEqual(Session.objects.get(session_key=session.session_key).get_decoded()["step"], 2)
+        self.assertEqual(flush_sessions(), 0)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, "recipes", "derivatives"))
+        self.derivative = self.write("recipes/derivatives/soup.3f2a9c01d4.320w.webp", bytes(range(256)) * 4)
+        self.original = self.write("recipes/soup.jpg", b"original picture")
+
+    def write(self, name, content):
+        with open(os.path.join(self.media_root, name), "wb") as f:
+            f.write(content)
+        return "/media/" + name
+
+    def body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_derivatives_are_immutable(self):
+        response = self.client.get(self.derivative)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), bytes(range(256)) * 4)
+        self.assertEqual(response["Cache-Control"], "max-age=315360000, public, immutable")
+        self.assertEqual(response["Content-Length"], "1024")
+        self.assertEqual(response["ETag"], '"%s"' % hashlib.sha256(bytes(range(256)) * 4).hexdigest()[:32])
+
+    def test_other_uploads_are_revalidated(self):
+        response = self.client.get(self.original)
+        self.assertEqual(response["Cache-Control"], "max-age=3600, public")
+        response = self.client.get(self.original, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.derivative, headers={"Range": "bytes=2-5"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/1024")
+        self.assertEqual(self.body(response), bytes([2, 3, 4, 5]))
+
+    def test_range_keeps_file_descriptor(self):
+        middleware = MediaWhiteNoiseMiddleware(lambda request: None)
+        response = middleware(RequestFactory().get(self.derivative, headers={"Range": "bytes=2-5"}))
+        # gunicorn can sendfile() Content-Length bytes from this descriptor and offset
+        self.assertEqual(os.lseek(response.file_to_stream.fileno(), 0, os.SEEK_CUR), 2)
+        response.close()
+
+    def test_if_range(self):
+        etag = self.client.get(self.original)["ETag"]
+        response = self.client.get(self.original, headers={"Range": "bytes=0-3", "If-Range": etag})
+        self.assertEqual((response.status_code, self.body(response)), (206, b"orig"))
+        self.write("recipes/soup.jpg", b"replaced picture, longer")
+        response = self.client.get(self.original, headers={"Range": "bytes=0-3", "If-Range": etag})
+        self.assertEqual((response.status_code, self.body(response)), (200, b"replaced picture, longer"))
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get("/media/recipes/none.jpg").status_code, 404)
+        self.assertEqual(self.client.get("/media/../manage.py").status_code, 404)
+        os.remove(os.path.join(self.media_root, "recipes", "soup.jpg"))
+        self.assertEqual(self.client.get(self.original).status_code, 404)
+
+
+@override_settings(RECIPE_SIMILAR_IN_BACKGROUND=False)
+class StatsTests(QueryCountMixin, TestCase):
+    def setUp(self):
+        self.dinner = Category.objects.create(name="Dinner")
+        self.dessert = Category.objects.create(name="Dessert")
+        self.soup = Recipe.objects.create(
+            name="Soup", description="d", ingredients="leek, potato", cooking_time=25, category=self.dinner
+        )
+        self.cake = Recipe.objects.create(
+            name="Cake", description="d", ingredients="eggs, flour, sugar", cooking_time=70, category=self.dessert
+        )
+        User.objects.create_user(username="cook", password="testpass123")
+        User.objects.create_user(username="admin", password="testpass123", is_staff=True)
+
+    def assertInSync(self):
+        self.assertEqual(reconcile_stats(), {"categories": 0, "ingredients": 0})
+
+    def test_kept_in_sync_on_save_and_delete(self):
+        self.assertEqual(dashboard()["recipes"], 2)
+        self.assertInSync()
+
+        self.soup.cooking_time = 200
+        self.soup.ingredients = "leek, potato, cream"
+        self.soup.category = self.dessert
+        self.soup.save()
+        self.assertInSync()
+        # a change outside the counted fields writes nothing
+        self.soup.description = "Smooth"
+        with self.assertNumQueries(1):
+            self.soup.save(update_fields=["description"])
+
+        insert_recipes(20, category_ids=[self.dinner.pk])
+        self.assertInSync()
+        self.cake.delete()
+        self.assertInSync()
+        self.dessert.delete()
+        self.assertInSync()
+
+        stats = dashboard()
+        self.assertEqual(stats["recipes"], 21)
+        self.assertEqual([c["name"] for c in stats["categories"]], ["Dinner", "Uncategorized"])
+        self.assertEqual(sum(b["recipes"] for b in stats["cooking_time"]), 21)
+        self.assertEqual(sum(d["recipes"] for d in stats["difficulty"]), 21)
+
+    def test_reconcile_fixes_drift(self):
+        # QuerySet.update() sends no signals
+        Recipe.objects.filter(pk=self.cake.pk).update(cooking_time=5, category=self.dinner)
+        RecipeIngredient.objects.filter(recipe=self.soup).delete()
+        IngredientStat.objects.create(ingredient=Ingredient.objects.create(name="saffron"), recipe_count=3)
+
+        fixed = reconcile_stats()
+        # the cake's old and new category rows, the soup's two ingredients and saffron
+        self.assertEqual(fixed, {"categories": 2, "ingredients": 3})
+        self.assertInSync()
+        self.assertEqual(CategoryStat.objects.get(category=self.dinner, time_bucket="quick").recipe_count, 1)
+        self.assertEqual(
+            [i["name"] for i in dashboard()["ingredients"]], ["eggs", "flour", "sugar"]
+        )
+
+        out = StringIO()
+        call_command("reconcile_stats", stdout=out)
+        self.assertIn("0 category and 0 ingredient rows fixed", out.getvalue())
+
+    def test_page_and_api_are_staff_only(self):
+        self.client.login(username="cook", password="testpass123")
+        with self.assertLogs("django.request", "WARNING"):
+            self.assertEqual(self.client.get(reverse("recipes:recipe_stats")).status_code, 403)
+            self.assertEqual(self.client.get(reverse("recipes:api_stats")).status_code, 403)
+
+        self.client.login(username="admin", password="testpass123")
+        response = self.client.get(reverse("recipes:recipe_stats"))
+        self.assertContains(response, "Dessert")
+        self.assertContains(response, "potato")
+        payload = self.client.get(reverse("recipes:api_stats")).json()
+        self.assertEqual(payload["recipes"], 2)
+        dinner = next(c for c in payload["categories"] if c["name"] == "Dinner")
+        self.assertEqual(dinner["average_cooking_time"], 25.0)
+        self.assertEqual(len(payload["ingredients"]), 5)
+
+    def test_dashboard_queries_do_not_grow_with_recipes(self):
+        self.client.login(username="admin", password="testpass123")
+        page = lambda: self.client.get(reverse("recipes:recipe_stats"))
+        self.assertNoNPlusOne(page, lambda count: insert_recipes(count, seed=1, category_ids=[self.dinner.pk]), more=50)
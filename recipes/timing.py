@@ -0,0 +1,171 @@
+"""
+Per-request timing: SQL query count and time, template time, chart time.
+
+ServerTimingMiddleware collects the numbers for each request and reports
+them twice: as a Server-Timing response header (visible in the browser's
+network panel) and as one JSON log line on the "recipes.timing" logger.
+
+- SQL is timed by an execute wrapper installed on every connection as it
+  connects (recipes/signals.py); it reads the current request from a
+  context variable, so queries run by async views in worker threads count.
+- Templates are timed by TimedDjangoTemplates, a drop-in for the
+  DjangoTemplates backend (settings.TEMPLATES). Only top-level renders are
+  timed; includes and inclusion tags fall inside their parent.
+- Anything else can be timed with `with timed("chart"): ...`.
+
+For streaming responses the numbers cover the view only, not the body.
+
+Settings:
+    RECIPE_SERVER_TIMING  send the header (default True); logging is always on
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger("recipes.timing")
+
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.durations = {}
+        # set while a template renders, so nested render_to_string calls aren't counted twice
+        self.in_template = False
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.add("db", time.perf_counter() - started)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        metrics = [f'db;dur={self.durations.get("db", 0.0) * 1000:.1f};desc="{self.queries} queries"']
+        metrics += [
+            f"{name};dur={seconds * 1000:.1f}"
+            for name, seconds in self.durations.items()
+            if name != "db"
+        ]
+        metrics.append(f"total;dur={self.total() * 1000:.1f}")
+        return ", ".join(metrics)
+
+    def as_dict(self):
+        data = {"queries": self.queries, "total_ms": round(self.total() * 1000, 1)}
+        data.update({f"{name}_ms": round(seconds * 1000, 1) for name, seconds in self.durations.items()})
+        return data
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.record_query(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    if _record_query not in connection.execute_wrappers:
+        # outermost: execute_wrapper() blocks pop the last wrapper on exit
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+def current_timings():
+    """The RequestTimings of the request being handled, or None."""
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to `name` for the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        if getattr(settings, "RECIPE_SERVER_TIMING", True):
+            response["Server-Timing"] = timings.header()
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            **timings.as_dict(),
+        }))
+        return response
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None or timings.in_template:
+            return self.template.render(context, request)
+        timings.in_template = True
+        try:
+            with timed("tpl"):
+                return self.template.render(context, request)
+        finally:
+            timings.in_template = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates add their render time to "tpl"."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -1,14 +1,38 @@
+from django.conf import settings
 from django.urls import path
-from .views import recipes_home, RecipeListView, RecipeDetailView, recipe_search, recipe_add
+
+from . import api
+from .views import (
+    AsyncRecipeDetailView, AsyncRecipeListView, RecipeDetailView, RecipeListView, achart, arecipe_search, chart,
+    recipe_add, recipe_export, recipe_search, recipe_stats, recipes_home,
+)
 
 app_name = "recipes"
 
+if getattr(settings, "RECIPE_ASYNC_VIEWS", False):
+    # under ASGI, see recipe_project/asgi.py
+    list_view, detail_view, search_view, chart_view = (
+        AsyncRecipeListView.as_view(), AsyncRecipeDetailView.as_view(), arecipe_search, achart
+    )
+else:
+    list_view, detail_view, search_view, chart_view = RecipeListView.as_view(), RecipeDetailView.as_view(), recipe_search, chart
+
 urlpatterns = [
     path("", recipes_home, name="home"),
-    path("recipes/", RecipeListView.as_view(), name="recipes_overview"),
-    path("recipes/<int:pk>/", RecipeDetailView.as_view(), name="recipe_detail"),
-    path("search/", recipe_search, name="recipe_search"),
+    path("recipes/", list_view, name="recipes_overview"),
+    path("recipes/<int:pk>/", detail_view, name="recipe_detail"),
+    path("search/", search_view, name="recipe_search"),
+    path("charts/<slug:key>.<slug:fmt>", chart_view, name="chart"),
+    path("export/<slug:fmt>/", recipe_export, name="recipe_export"),
+    path("stats/", recipe_stats, name="recipe_stats"),
 
     # add recipe (logged-in users)
     path("recipes/add/", recipe_add, name="recipe_add"),
+
+    # read-only JSON API, see recipes/api.py
+    path("api/recipes/", api.recipe_list, name="api_recipe_list"),
+    path("api/recipes/<int:pk>/", api.recipe_detail, name="api_recipe_detail"),
+    path("api/search/", api.recipe_search, name="api_recipe_search"),
+    path("api/autocomplete/", api.autocomplete, name="api_autocomplete"),
+    path("api/stats/", api.stats, name="api_stats"),
 ]
@@ -1,61 +1,75 @@
 from io import BytesIO
-import base64
 
-import matplotlib
-matplotlib.use("Agg") 
+CHART_TYPES = ("#1", "#2", "#3")
 
-import matplotlib.pyplot as plt
+# format -> content type
+CHART_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
 
+# chart type -> title, x axis label, y axis label
+CHART_LABELS = {
+    "#1": ("Cooking time per recipe", "Recipe", "Cooking time (min)"),
+    "#2": ("Difficulty distribution", "Difficulty", "Recipes"),
+    "#3": ("Cooking time trend", "Recipe", "Cooking time (min)"),
+}
 
-def get_graph() -> str:
-    """Return current matplotlib figure as a base64 string."""
+
+def get_graph(fig, fmt="png") -> bytes:
+    """Return a matplotlib figure as PNG or SVG bytes."""
     buffer = BytesIO()
-    plt.savefig(buffer, format="png", bbox_inches="tight")
-    buffer.seek(0)
-    image_png = buffer.getvalue()
-    graph = base64.b64encode(image_png).decode("utf-8")
+    fig.savefig(buffer, format=fmt, bbox_inches="tight")
+    image = buffer.getvalue()
     buffer.close()
-    plt.close() 
-    return graph
+    return image
+
+
+def _rotate_xticks(ax):
+    for label in ax.get_xticklabels():
+        label.set(rotation=45, ha="right")
 
 
-def get_chart(chart_type: str, df):
+def draw_chart(chart_type: str, series, fmt="png"):
     """
     chart_type: "#1" bar, "#2" pie, "#3" line
-    df: pandas DataFrame (must include: name, cooking_time, difficulty)
-    Returns base64 string or None.
+    series: list of (label, value), see recipes/charts.py
+    Returns PNG / SVG bytes or None.
     """
-    if df is None or df.empty or not chart_type:
+    if not series or chart_type not in CHART_TYPES or fmt not in CHART_FORMATS:
         return None
 
+    # imported here, not at module level: matplotlib takes about half a
+    # second to import, and web workers only draw when RECIPE_CHART_WORKERS
+    # is 0. The object-oriented Figure API keeps no global state (unlike
+    # pyplot), so charts can be drawn from several threads.
+    from matplotlib.figure import Figure
 
-    plt.clf()
-    plt.figure(figsize=(7, 4))
+    labels = [label for label, _ in series]
+    values = [value for _, value in series]
+    title, x_label, y_label = CHART_LABELS[chart_type]
+
+    fig = Figure(figsize=(7, 4))
+    ax = fig.subplots()
 
     if chart_type == "#1":
 
-        plt.bar(df["name"], df["cooking_time"])
-        plt.xticks(rotation=45, ha="right")
-        plt.xlabel("Recipe")
-        plt.ylabel("Cooking time (min)")
-        plt.title("Cooking time per recipe")
+        ax.bar(labels, values)
+        _rotate_xticks(ax)
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
 
     elif chart_type == "#2":
 
-        counts = df["difficulty"].fillna("Unknown").value_counts()
-        plt.pie(counts.values, labels=counts.index, autopct="%1.0f%%")
-        plt.title("Difficulty distribution")
+        ax.pie(values, labels=labels, autopct="%1.0f%%")
 
     elif chart_type == "#3":
 
-        plt.plot(df["name"], df["cooking_time"], marker="o")
-        plt.xticks(rotation=45, ha="right")
-        plt.xlabel("Recipe")
-        plt.ylabel("Cooking time (min)")
-        plt.title("Cooking time trend")
-
-    else:
-        return None
+        ax.plot(labels, values, marker="o")
+        _rotate_xticks(ax)
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
 
-    plt.tight_layout()
-    return get_graph()
+    ax.set_title(title)
+    fig.tight_layout()
+    return get_graph(fig, fmt)
@@ -1,12 +1,35 @@
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.template.response import TemplateResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.generic import ListView, DetailView
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse
 
+from .auth import AsyncLoginRequiredMixin, async_login_required
 from .models import Recipe
+from .detail_cache import detail_cache_key, detail_etag, render_detail_fragment
 from .forms import RecipeSearchForm, AddRecipeForm
-from .utils import get_chart
+from .tables import RESULT_FIELDS, render_results_table
+from .pagination import InvalidCursor, abounded_count, apaginate_keyset, bounded_count, paginate_keyset
+from .charts import chart_payload, chart_series
+from .rendering import POLL_WAIT, chart_spec, get_renderer, image_key, request_chart, resume_chart
+from .export import EXPORT_FORMATS, aiter_chunks, stream_export
+from .facets import facet_counts
+from .search import get_search_limit
+from .similar import similar_recipes
+from .stats import dashboard
+from .timing import timed
+from .utils import CHART_FORMATS
+
+SEARCH_PAGE_SIZE = 50
 
 
 def recipes_home(request):
@@ -17,24 +40,111 @@ def recipes_home(request):
     return render(request, "recipes/recipes_home.html")
 
 
-class RecipeListView(LoginRequiredMixin, ListView):
+# The list, detail, search and chart views come as sync views and as async
+# ones (Async*, a*). recipes/urls.py serves the async ones only when
+# RECIPE_ASYNC_VIEWS is on, as under ASGI (recipe_project/asgi.py): under
+# WSGI each async view would run its own event loop and hop to a thread
+# for every query.
+
+
+class RecipeListMixin:
     model = Recipe
     template_name = "recipes/recipes_overview.html"
+    paginate_by = 24
+
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related("renditions")
+
+    def paginate_queryset(self, queryset, page_size):
+        # already fetched by get()
+        return None, self.page, self.page.object_list, self.page.has_other_pages()
+
 
+class RecipeListView(LoginRequiredMixin, RecipeListMixin, ListView):
+    def get(self, request, *args, **kwargs):
+        # keyset instead of OFFSET pages: deep pages cost the same as the first
+        try:
+            self.page = paginate_keyset(self.get_queryset(), request.GET.get("cursor"), self.get_paginate_by(None))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        self.object_list = self.get_queryset()
+        return self.render_to_response(self.get_context_data())
 
-class RecipeDetailView(LoginRequiredMixin, DetailView):
+
+class AsyncRecipeListView(AsyncLoginRequiredMixin, RecipeListMixin, ListView):
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.page = await apaginate_keyset(
+                self.get_queryset(), request.GET.get("cursor"), self.get_paginate_by(None)
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        self.object_list = self.get_queryset()
+        # a TemplateResponse: the handler renders it in a thread
+        return self.render_to_response(self.get_context_data())
+
+
+class RecipeDetailMixin:
     model = Recipe
     template_name = "recipes/recipe_detail.html"
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("category")
+
+    def load_cache_key(self):
+        # part of the key: another process may have rewritten the list
+        self.similar = list(similar_recipes(self.object.pk))
+        self.cache_key = detail_cache_key(self.object, self.similar)
+
+    def validators(self, request):
+        """(ETag, Last-Modified timestamp) of the page."""
+        # the page around the fragment shows staff a Statistics link
+        etag = detail_etag(f"{self.cache_key}:staff={int(request.user.is_staff)}")
+        return etag, int(self.object.updated_at.timestamp())
+
+    def finish(self, response, etag, last_modified):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        # always revalidate: a 304 costs three indexed lookups and no rendering
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        ingredients_raw = self.object.ingredients or ""
-        ingredients_list = [i.strip() for i in ingredients_raw.split(",") if i.strip()]
-        context["ingredients_list"] = ingredients_list
-        context["difficulty"] = self.object.calculate_difficulty()
+        # both precomputed by Recipe.save()
+        context["ingredients_list"] = self.object.ingredient_list
+        context["difficulty"] = self.object.difficulty
+        context["similar_recipes"] = self.similar
+        context["recipe_html"] = render_detail_fragment(self.cache_key, context)
         return context
 
 
+class RecipeDetailView(LoginRequiredMixin, RecipeDetailMixin, DetailView):
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        self.load_cache_key()
+        etag, last_modified = self.validators(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.render_to_response(self.get_context_data(object=self.object))
+        return self.finish(response, etag, last_modified)
+
+
+class AsyncRecipeDetailView(AsyncLoginRequiredMixin, RecipeDetailMixin, DetailView):
+    async def get(self, request, *args, **kwargs):
+        try:
+            self.object = await self.get_queryset().aget(pk=self.kwargs[self.pk_url_kwarg])
+        except Recipe.DoesNotExist:
+            raise Http404("No recipe found matching the query")
+        await sync_to_async(self.load_cache_key)()
+        etag, last_modified = self.validators(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            context = await sync_to_async(self.get_context_data)(object=self.object)
+            response = self.render_to_response(context)
+        return self.finish(response, etag, last_modified)
+
+
 @login_required
 def recipe_add(request):
     """
@@ -51,53 +161,208 @@ def recipe_add(request):
     return render(request, "recipes/recipe_add.html", {"form": form})
 
 
+@login_required
+def recipe_stats(request):
+    """
+    Catalogue statistics for staff, read from the summary tables
+    (recipes/stats.py): as fast with a million recipes as with ten.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return render(request, "recipes/recipe_stats.html", {"stats": dashboard()})
+
+
+def search_filters(request, form):
+    """(queryset, ranked, chart type, export query string) of a search."""
+    qs = Recipe.objects.all().order_by("name")
+    # validating the category choice is a query
+    if request.method == "POST" and form.is_valid():
+        # keyword and pantry search find their matches here
+        qs = form.filter_queryset(qs)
+        return qs, form.is_ranked(), form.cleaned_data.get("chart_type"), urlencode(form.filter_params())
+    return qs, False, None, ""
+
+
+def chart_links(key):
+    return {fmt: reverse("recipes:chart", args=[key, fmt]) for fmt in (*CHART_FORMATS, "json")}
+
+
+def search_response(request, chart_urls, **context):
+    context.update(chart_url=chart_urls.get("png"), chart_urls=chart_urls)
+    return TemplateResponse(request, "recipes/recipe_search.html", context)
+
+
 @login_required
 def recipe_search(request):
-    import pandas as pd
+    form = RecipeSearchForm(request.POST or None)
+    qs, ranked, chart_type, export_query = search_filters(request, form)
+
+    page = None
+    if ranked:
+        # the top N by relevance (or fewest missing ingredients), shown in rank order
+        results_table, results_count = render_results_table(list(qs.values_list(*RESULT_FIELDS)[: get_search_limit()]))
+    else:
+        try:
+            page = paginate_keyset(
+                qs.values_list(*RESULT_FIELDS),
+                request.POST.get("cursor"),
+                SEARCH_PAGE_SIZE,
+                key=lambda row: (row[1], row[0]),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        results_table, results_count = render_results_table(page)
+
+    count_exact = True
+    if page is not None and page.has_other_pages():
+        # only count when one page doesn't already hold every result
+        results_count, count_exact = bounded_count(qs)
+
+    # one GROUP BY within a fixed time budget; None if it ran over
+    facets = facet_counts(qs) if results_count else None
 
+    chart_urls = {}
+    chart_busy = False
+    if results_count and chart_type:
+        # rendered in the chart pool; the page only links to the image
+        with timed("chart"):
+            # aggregated in SQL: a few dozen points, however many recipes match
+            key = request_chart(chart_type, chart_series(qs, chart_type))
+        chart_busy = key is None
+        if key is not None:
+            chart_urls = chart_links(key)
+
+    return search_response(
+        request, chart_urls, form=form, results_table=results_table, results_count=results_count,
+        count_exact=count_exact, page=page, chart_busy=chart_busy, export_query=export_query, facets=facets,
+    )
+
+
+@async_login_required
+async def arecipe_search(request):
     form = RecipeSearchForm(request.POST or None)
-    qs = Recipe.objects.all().order_by("name")
+    qs, ranked, chart_type, export_query = await sync_to_async(search_filters)(request, form)
 
-    results_df_html = None
-    chart = None
+    page = None
+    if ranked:
+        rows = [row async for row in qs.values_list(*RESULT_FIELDS)[: get_search_limit()]]
+        results_table, results_count = render_results_table(rows)
+    else:
+        try:
+            page = await apaginate_keyset(
+                qs.values_list(*RESULT_FIELDS),
+                request.POST.get("cursor"),
+                SEARCH_PAGE_SIZE,
+                key=lambda row: (row[1], row[0]),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        results_table, results_count = render_results_table(page)
 
-    if request.method == "POST" and form.is_valid():
-        recipe_name = (form.cleaned_data.get("recipe_name") or "").strip()
-        ingredient = (form.cleaned_data.get("ingredient") or "").strip()
-        max_time = form.cleaned_data.get("max_cooking_time")
-        chart_type = form.cleaned_data.get("chart_type")
-
-        if recipe_name:
-            qs = qs.filter(name__icontains=recipe_name)
-        if ingredient:
-            qs = qs.filter(ingredients__icontains=ingredient)
-        if max_time:
-            qs = qs.filter(cooking_time__lte=max_time)
-
-    if qs.exists():
-        df = pd.DataFrame(list(qs.values("id", "name", "cooking_time", "difficulty", "ingredients")))
-
-        chart_type = None
-        if request.method == "POST" and form.is_valid():
-            chart_type = form.cleaned_data.get("chart_type")
-
-        df_chart = df[["name", "cooking_time", "difficulty"]].copy()
-        chart = get_chart(chart_type, df_chart)
-
-        df["name"] = df.apply(
-            lambda row: f'<a class="recipe-link" href="{reverse("recipes:recipe_detail", args=[row["id"]])}">{row["name"]}</a>',
-            axis=1,
-        )
-
-        df["ingredients"] = df["ingredients"].fillna("").apply(lambda x: x if len(x) <= 80 else x[:77] + "...")
-
-        df = df.drop(columns=["id"])
-        results_df_html = df.to_html(classes="recipe-search-table", index=False, escape=False)
-
-    context = {
-        "form": form,
-        "results_df": results_df_html,
-        "results_count": qs.count(),
-        "chart": chart,
-    }
-    return render(request, "recipes/recipe_search.html", context)
+    count_exact = True
+    if page is not None and page.has_other_pages():
+        results_count, count_exact = await abounded_count(qs)
+
+    facets = await sync_to_async(facet_counts)(qs) if results_count else None
+
+    chart_urls = {}
+    chart_busy = False
+    if results_count and chart_type:
+        with timed("chart"):
+            series = await sync_to_async(chart_series)(qs, chart_type)
+            key = await sync_to_async(request_chart, thread_sensitive=False)(chart_type, series)
+        chart_busy = key is None
+        if key is not None:
+            chart_urls = chart_links(key)
+
+    return search_response(
+        request, chart_urls, form=form, results_table=results_table, results_count=results_count,
+        count_exact=count_exact, page=page, chart_busy=chart_busy, export_query=export_query, facets=facets,
+    )
+
+
+def immutable(response):
+    # the key is a hash of the chart's content, so the response never changes
+    patch_cache_control(response, private=True, max_age=31536000, immutable=True)
+    return response
+
+
+def chart_response(image, fmt):
+    if image is None:
+        response = HttpResponse(status=202)
+        response["Retry-After"] = "1"
+        return response
+    return immutable(HttpResponse(image, content_type=CHART_FORMATS[fmt]))
+
+
+@login_required
+def chart(request, key, fmt):
+    """
+    A chart registered by recipe_search: PNG or SVG image, or its series as
+    JSON for drawing in the browser.
+    Images answer 202 while they are still rendering; the page retries.
+    """
+    if fmt == "json":
+        spec = chart_spec(key)
+        if spec is None:
+            raise Http404("Unknown chart")
+        return immutable(JsonResponse(chart_payload(*spec)))
+    if fmt not in CHART_FORMATS:
+        raise Http404("Unknown chart format")
+
+    renderer = get_renderer()
+    with timed("chart"):
+        # not counted in the cache stats: request_chart already looked the PNG up
+        image = renderer.cache.store.get(image_key(key, fmt))
+        if image is None:
+            if not renderer.is_pending(image_key(key, fmt)) and not resume_chart(key, fmt):
+                raise Http404("Unknown chart")
+            image = renderer.wait(image_key(key, fmt), timeout=POLL_WAIT)
+    return chart_response(image, fmt)
+
+
+@async_login_required
+async def achart(request, key, fmt):
+    """chart() that awaits the render instead of blocking a thread."""
+    if fmt == "json":
+        spec = await sync_to_async(chart_spec, thread_sensitive=False)(key)
+        if spec is None:
+            raise Http404("Unknown chart")
+        return immutable(JsonResponse(chart_payload(*spec)))
+    if fmt not in CHART_FORMATS:
+        raise Http404("Unknown chart format")
+
+    renderer = get_renderer()
+    with timed("chart"):
+        image = await sync_to_async(renderer.cache.store.get, thread_sensitive=False)(image_key(key, fmt))
+        if image is None:
+            if (
+                not renderer.is_pending(image_key(key, fmt))
+                and not await sync_to_async(resume_chart, thread_sensitive=False)(key, fmt)
+            ):
+                raise Http404("Unknown chart")
+            image = await renderer.await_chart(image_key(key, fmt), timeout=POLL_WAIT)
+    return chart_response(image, fmt)
+
+
+@login_required
+def recipe_export(request, fmt):
+    """
+    Stream every recipe matching the search filters in the query string
+    (the same ones as RecipeSearchForm) as CSV, JSON Lines or column chunks.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise Http404("Unknown export format")
+    form = RecipeSearchForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Invalid filters")
+
+    qs = form.filter_queryset(Recipe.objects.order_by("name", "pk"))
+    content_type, extension = EXPORT_FORMATS[fmt]
+    chunks = stream_export(qs, fmt)
+    if isinstance(request, ASGIRequest):
+        # under ASGI Django would read a sync iterator into memory first
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="recipes.{extension}"'
+    return response